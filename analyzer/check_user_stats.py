@@ -10,7 +10,7 @@ from pathlib import Path
 # اضافه کردن مسیر ریشه پروژه
 sys.path.append(str(Path(__file__).parent.parent))
 
-from services.mongo_service import MongoServiceManager
+from services.storage import StorageManager
 from utils.logger import logger
 
 async def check_user_statistics():
@@ -18,20 +18,20 @@ async def check_user_statistics():
     logger.info("📊 Checking user statistics...")
     
     try:
-        async with MongoServiceManager() as mongo_service:
+        async with StorageManager() as storage:
             # دریافت تعداد کل کاربران
-            total_users = await mongo_service.get_user_count()
+            total_users = await storage.get_user_count()
             logger.info(f"👥 Total users in database: {total_users:,}")
             
             # دریافت آمار کاربران
-            user_stats = await mongo_service.get_user_stats()
+            user_stats = await storage.get_user_stats()
             logger.info("📈 User Statistics:")
             logger.info(f"   ├── Total users: {user_stats.get('total_users', 0):,}")
             logger.info(f"   ├── New users today: {user_stats.get('today_new_users', 0):,}")
             logger.info(f"   └── New users this week: {user_stats.get('week_new_users', 0):,}")
             
             # دریافت کاربران اخیر
-            recent_users = await mongo_service.get_recent_users(hours=24)
+            recent_users = await storage.get_recent_users(hours=24)
             logger.info(f"🕐 Recent users (last 24h): {len(recent_users):,}")
             
             if recent_users:
@@ -188,12 +188,185 @@ class FilterSettings:
             ]
         )
 
+@dataclass
+class CacheSettings:
+    """تنظیمات کش محلی فایل‌های دانلود شده"""
+    cache_dir: str
+    max_size_mb: int
+    parsed_items: int
+    
+    @classmethod
+    def from_env(cls) -> 'CacheSettings':
+        return cls(
+            cache_dir=ensure_dir(os.getenv('FILE_CACHE_DIR', 'cache/files')),
+            max_size_mb=int(os.getenv('FILE_CACHE_MAX_MB', '1024')),
+            parsed_items=int(os.getenv('FILE_CACHE_PARSED_ITEMS', '0'))
+        )
+
+@dataclass
+class StorageConfig:
+    """انتخاب backend ذخیره‌سازی (mongo یا sqlite)"""
+    backend: str
+    sqlite_path: str
+    
+    @classmethod
+    def from_env(cls) -> 'StorageConfig':
+        backend = os.getenv('STORAGE_BACKEND', 'mongo').strip().lower()
+        if backend not in ('mongo', 'sqlite'):
+            print(f"⚠️ Unknown STORAGE_BACKEND '{backend}', using mongo")
+            backend = 'mongo'
+        
+        sqlite_path = os.getenv('SQLITE_PATH', 'data/telegram_scanner.db')
+        if sqlite_path != ':memory:' and not Path(sqlite_path).is_absolute():
+            sqlite_path = str(Path(__file__).parent.parent / sqlite_path)
+        
+        return cls(backend=backend, sqlite_path=sqlite_path)
+
+@dataclass
+class ExpirySettings:
+    """انقضای خودکار اسناد MongoDB با TTL index بر حسب روز (۰ = غیرفعال)"""
+    groups_days: int
+    users_days: int
+    redirect_cache_days: int
+    scan_journal_days: int
+    
+    @classmethod
+    def from_env(cls) -> 'ExpirySettings':
+        return cls(
+            groups_days=int(os.getenv('GROUPS_EXPIRE_DAYS', '0')),
+            users_days=int(os.getenv('USERS_EXPIRE_DAYS', '0')),
+            redirect_cache_days=int(os.getenv('REDIRECT_CACHE_EXPIRE_DAYS', '30')),
+            scan_journal_days=int(os.getenv('SCAN_JOURNAL_EXPIRE_DAYS', '90'))
+        )
+
+@dataclass
+class RedirectCacheSettings:
+    """مدت اعتبار کش حل لینک‌های ریدایرکت بر اساس نتیجه (۰ = بدون کش)"""
+    telegram_ttl_hours: int
+    non_telegram_ttl_hours: int
+    failed_ttl_minutes: int
+    
+    @classmethod
+    def from_env(cls) -> 'RedirectCacheSettings':
+        return cls(
+            telegram_ttl_hours=int(os.getenv('REDIRECT_CACHE_TELEGRAM_TTL_HOURS', '720')),
+            non_telegram_ttl_hours=int(os.getenv('REDIRECT_CACHE_NON_TELEGRAM_TTL_HOURS', '168')),
+            failed_ttl_minutes=int(os.getenv('REDIRECT_CACHE_FAILED_TTL_MINUTES', '60'))
+        )
+
+@dataclass
+class ResolverSettings:
+    """محدودیت‌های درخواست HTTP هنگام حل لینک‌های ریدایرکت"""
+    max_concurrency: int
+    per_host_limit: int
+    host_delay_seconds: float
+    
+    @classmethod
+    def from_env(cls) -> 'ResolverSettings':
+        return cls(
+            max_concurrency=int(os.getenv('RESOLVER_MAX_CONCURRENCY', '20')),
+            per_host_limit=int(os.getenv('RESOLVER_PER_HOST_LIMIT', '4')),
+            host_delay_seconds=float(os.getenv('RESOLVER_HOST_DELAY_SECONDS', '0.5'))
+        )
+
+@dataclass
+class RateLimitSettings:
+    """محدودیت درخواست‌های API تلگرام (مشترک بین همه سرویس‌ها) و بررسی لینک‌های دعوت"""
+    telegram_per_second: float
+    telegram_burst: int
+    invite_checks_per_minute: float
+    
+    @classmethod
+    def from_env(cls) -> 'RateLimitSettings':
+        return cls(
+            telegram_per_second=float(os.getenv('TELEGRAM_REQUESTS_PER_SECOND', '2')),
+            telegram_burst=int(os.getenv('TELEGRAM_REQUEST_BURST', '5')),
+            invite_checks_per_minute=float(os.getenv('INVITE_CHECKS_PER_MINUTE', '10'))
+        )
+
+@dataclass
+class InviteCacheSettings:
+    """مدت اعتبار نتیجه بررسی لینک‌های دعوت بر اساس نتیجه (۰ = بدون کش)"""
+    valid_ttl_hours: int
+    invalid_ttl_hours: int
+    error_ttl_minutes: int
+    
+    @classmethod
+    def from_env(cls) -> 'InviteCacheSettings':
+        return cls(
+            valid_ttl_hours=int(os.getenv('INVITE_CACHE_VALID_TTL_HOURS', '24')),
+            invalid_ttl_hours=int(os.getenv('INVITE_CACHE_INVALID_TTL_HOURS', '720')),
+            error_ttl_minutes=int(os.getenv('INVITE_CACHE_ERROR_TTL_MINUTES', '10'))
+        )
+
+@dataclass
+class FrontierSettings:
+    """صف کشف خودکار: لینک‌های تلگرام پیدا شده در پیام‌ها به عنوان گروه کاندید ذخیره می‌شوند"""
+    enabled: bool
+    include_mentions: bool
+    bloom_capacity: int
+    bloom_error_rate: float
+    bloom_path: str  # فایل mmap برای نگه داشتن seen-set بین اجراها (خالی = فقط در حافظه)
+    max_candidates_per_run: int
+    
+    @classmethod
+    def from_env(cls) -> 'FrontierSettings':
+        bloom_path = os.getenv('FRONTIER_BLOOM_PATH', '').strip()
+        if bloom_path and not Path(bloom_path).is_absolute():
+            bloom_path = str(Path(__file__).parent.parent / bloom_path)
+        
+        return cls(
+            enabled=str_to_bool(os.getenv('FRONTIER_ENABLED', 'true')),
+            include_mentions=str_to_bool(os.getenv('FRONTIER_INCLUDE_MENTIONS', 'false')),
+            bloom_capacity=int(os.getenv('FRONTIER_BLOOM_CAPACITY', '1000000')),
+            bloom_error_rate=float(os.getenv('FRONTIER_BLOOM_ERROR_RATE', '0.001')),
+            bloom_path=bloom_path,
+            max_candidates_per_run=int(os.getenv('FRONTIER_MAX_CANDIDATES_PER_RUN', '500'))
+        )
+
+@dataclass
+class PrefetchSettings:
+    """مرحله lookahead: آماده‌سازی K لینک بعدی صف همزمان با پردازش چت فعلی"""
+    lookahead: int  # تعداد لینک‌های جلوتر (0 = غیرفعال، هر چت کلاینت جداگانه)
+    first_page: bool  # دریافت صفحه اول تاریخچه گروه‌ها علاوه بر get_chat
+    
+    @classmethod
+    def from_env(cls) -> 'PrefetchSettings':
+        return cls(
+            lookahead=max(0, int(os.getenv('PREFETCH_LOOKAHEAD', '2'))),
+            first_page=str_to_bool(os.getenv('PREFETCH_FIRST_PAGE', 'true'))
+        )
+
+@dataclass
+class SeenSetSettings:
+    """ساختار حذف تکرار در مسیرهای پرحجم: set دقیق یا Bloom filter با حافظه ثابت"""
+    backend: str
+    capacity: int
+    error_rate: float
+    
+    @classmethod
+    def from_env(cls) -> 'SeenSetSettings':
+        backend = os.getenv('SEEN_SET_BACKEND', 'set').strip().lower()
+        if backend not in ('set', 'bloom'):
+            print(f"⚠️ Unknown SEEN_SET_BACKEND '{backend}', using set")
+            backend = 'set'
+        
+        return cls(
+            backend=backend,
+            capacity=int(os.getenv('SEEN_SET_CAPACITY', '10000000')),
+            error_rate=float(os.getenv('SEEN_SET_ERROR_RATE', '0.001'))
+        )
+
 @dataclass
 class MongoConfig:
     """تنظیمات MongoDB"""
     connection_string: str
     database_name: str
     collection_name: str
+    max_pool_size: int
+    executor_workers: int
+    materialized_stats: bool
+    stats_recount_hours: int  # شمارش دوباره دوره‌ای اسناد آمار (0 = فقط وقتی سند وجود ندارد)
     
     @classmethod
     def from_env(cls) -> 'MongoConfig':
@@ -201,7 +374,11 @@ class MongoConfig:
         return cls(
             connection_string=os.getenv('MONGO_CONNECTION_STRING', 'mongodb://localhost:27017/'),
             database_name=os.getenv('MONGO_DATABASE', 'telegram_scanner'),
-            collection_name=os.getenv('MONGO_COLLECTION', 'groups')
+            collection_name=os.getenv('MONGO_COLLECTION', 'groups'),
+            max_pool_size=int(os.getenv('MONGO_MAX_POOL_SIZE', '50')),
+            executor_workers=int(os.getenv('MONGO_EXECUTOR_WORKERS', '8')),
+            materialized_stats=str_to_bool(os.getenv('MONGO_MATERIALIZED_STATS', 'false')),
+            stats_recount_hours=int(os.getenv('MONGO_STATS_RECOUNT_HOURS', '24'))
         )
 
 @dataclass
@@ -288,6 +465,16 @@ FILE_SETTINGS = FileSettings.from_env()
 ANALYSIS_CONFIG = AnalysisConfig.from_env()
 MONGO_CONFIG = MongoConfig.from_env()
 FILTER_SETTINGS = FilterSettings.from_env()
+CACHE_SETTINGS = CacheSettings.from_env()
+EXPIRY_SETTINGS = ExpirySettings.from_env()
+REDIRECT_CACHE_SETTINGS = RedirectCacheSettings.from_env()
+RESOLVER_SETTINGS = ResolverSettings.from_env()
+RATE_LIMIT_SETTINGS = RateLimitSettings.from_env()
+INVITE_CACHE_SETTINGS = InviteCacheSettings.from_env()
+FRONTIER_SETTINGS = FrontierSettings.from_env()
+PREFETCH_SETTINGS = PrefetchSettings.from_env()
+SEEN_SET_SETTINGS = SeenSetSettings.from_env()
+STORAGE_CONFIG = StorageConfig.from_env()
 
 # برای سازگاری با کد قبلی
 telegram_config = TELEGRAM_CONFIG
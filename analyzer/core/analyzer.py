@@ -63,6 +63,9 @@ class TelegramAnalyzer:
         # ذخیره نتایج چت‌ها
         await self.save_results()
         
+        # ذخیره دسته‌ای کاربران و پیام‌ها در MongoDB
+        await self.user_tracker.flush_to_database()
+        
         # ذخیره اطلاعات کاربران به تلگرام
         logger.info("💾 Saving user profiles to Telegram...")
         await self.user_tracker.save_all_users_to_telegram()
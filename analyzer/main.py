@@ -1,216 +1,313 @@
 import asyncio
 import sys
+import time
 import os
 from pathlib import Path
-from typing import List
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import List, Optional, AsyncIterator, Set
 from datetime import datetime, timedelta
 
 # اضافه کردن مسیر ریشه پروژه
 sys.path.append(str(Path(__file__).parent.parent))
 
-from config.settings import TELEGRAM_CONFIG, ANALYSIS_CONFIG, MESSAGE_SETTINGS, MEMBER_SETTINGS, MONGO_CONFIG, FILTER_SETTINGS
-from services.telegram_client import TelegramClientManager
+from config.settings import TELEGRAM_CONFIG, ANALYSIS_CONFIG, MESSAGE_SETTINGS, MEMBER_SETTINGS, MONGO_CONFIG, FILTER_SETTINGS, FRONTIER_SETTINGS, PREFETCH_SETTINGS
+from services.telegram_client import TelegramClientManager, GROUP_CHAT_TYPES, get_chat_type
 from services.user_tracker import UserTracker
 from services.chat_analyzer import ChatAnalyzer
 from services.message_analyzer import MessageAnalyzer
 from services.link_analyzer import LinkAnalyzer
 from services.url_resolver import URLResolver
-from services.mongo_service import MongoServiceManager
+from services.crawl_frontier import CrawlFrontier
+from services.chat_prefetcher import ChatPrefetcher, PrefetchedChat
+from services.storage import StorageManager, close_storage_service
+from services.link_extractor import canonical_link_key, classify_link
 from models.data_models import GroupInfo, ChatType, ScanStatus
 from utils.logger import logger
+from utils.seen_set import create_seen_set
 
-async def resolve_and_validate_link(chat_link: str) -> str:
-    """حل کردن و اعتبارسنجی لینک"""
+async def resolve_and_validate_link(chat_link: str, resolver: Optional[URLResolver] = None) -> str:
+    """حل کردن و اعتبارسنجی لینک (resolver مشترک بین لینک‌ها تا session و کش دوباره ساخته نشود)"""
+    if resolver is None:
+        async with StorageManager() as storage:
+            async with URLResolver(storage=storage) as resolver:
+                return await resolve_and_validate_link(chat_link, resolver)
+    
     logger.info(f"🔍 Checking link: {chat_link}")
     
-    async with URLResolver() as resolver:
-        # ابتدا بررسی کنیم که آیا URL شامل لینک تلگرام است
-        extracted_telegram = resolver.extract_telegram_link(chat_link)
-        if extracted_telegram:
-            logger.info(f"✅ Found Telegram link in URL: {chat_link} -> {extracted_telegram}")
-            return extracted_telegram
-        
-        # بررسی اینکه آیا لینک از قبل لینک تلگرام است
-        if resolver.is_telegram_link(chat_link):
-            logger.info(f"✅ Link is already a Telegram link: {chat_link}")
-            return chat_link
-        
-        # حل کردن لینک برای یافتن ریدایرکت‌ها
-        resolved_link = await resolver.resolve_url(chat_link)
-        
-        if resolved_link and resolver.is_telegram_link(resolved_link):
-            logger.info(f"✅ Link resolved to Telegram: {chat_link} -> {resolved_link}")
-            return resolved_link
+    # ابتدا بررسی کنیم که آیا URL شامل لینک تلگرام است
+    extracted_telegram = resolver.extract_telegram_link(chat_link)
+    if extracted_telegram:
+        logger.info(f"✅ Found Telegram link in URL: {chat_link} -> {extracted_telegram}")
+        return extracted_telegram
+    
+    # بررسی اینکه آیا لینک از قبل لینک تلگرام است
+    if resolver.is_telegram_link(chat_link):
+        logger.info(f"✅ Link is already a Telegram link: {chat_link}")
+        return chat_link
+    
+    # حل کردن لینک برای یافتن ریدایرکت‌ها (ابتدا از کش ماندگار)
+    resolved_link = await resolver.resolve_url(chat_link)
+    
+    if resolved_link and resolver.is_telegram_link(resolved_link):
+        logger.info(f"✅ Link resolved to Telegram: {chat_link} -> {resolved_link}")
+        return resolved_link
+    else:
+        logger.warning(f"⚠️ Link does not redirect to Telegram: {chat_link}")
+        return chat_link  # بازگرداندن لینک اصلی برای پردازش
+
+async def skip_non_group_chat(group_info: GroupInfo, resolved_link: str, chat_link: str,
+                              scan_started: float, chat=None):
+    """ثبت کانال یا چت غیرگروهی در دیتابیس و رد کردن آن بدون دریافت پیام‌ها و اعضا"""
+    title = getattr(chat, 'title', None) or 'Unknown'
+    if group_info.chat_type == ChatType.CHANNEL:
+        skip_reason = 'channel_detected'
+        logger.warning(f"⚠️ Skipping channel: {title} (ID: {group_info.chat_id})")
+        logger.info(f"   📢 Channel type detected - only groups are processed")
+    else:
+        skip_reason = 'non_group_chat'
+        logger.warning(f"⚠️ Skipping non-group chat: {title} (ID: {group_info.chat_id}, Type: {group_info.chat_type})")
+        logger.info(f"   ❌ Non-group type detected - only groups are processed")
+    
+    # تا اسکن بعدی دوباره در صف قرار نمی‌گیرد
+    group_info.update_scan_info(
+        status=ScanStatus.SKIPPED,
+        interval_minutes=ANALYSIS_CONFIG.scan_interval_minutes
+    )
+    
+    async with StorageManager() as storage:
+        if await storage.save_group_info(group_info):
+            logger.info(f"✅ Chat info saved to database: {group_info.chat_id}")
         else:
-            logger.warning(f"⚠️ Link does not redirect to Telegram: {chat_link}")
-            return chat_link  # بازگرداندن لینک اصلی برای پردازش
+            logger.error(f"❌ Failed to save chat info to database: {group_info.chat_id}")
+        
+        await storage.record_scan(
+            chat_id=group_info.chat_id,
+            link=resolved_link,
+            status=ScanStatus.SKIPPED,
+            message_count=0,
+            last_message_id=None,
+            duration_seconds=time.monotonic() - scan_started
+        )
+    
+    return {
+        'chat_info': {
+            'id': group_info.chat_id,
+            'title': title,
+            'username': group_info.username,
+            'type': str(chat.type) if chat is not None else group_info.chat_type.value,
+            'members_count': getattr(chat, 'members_count', 0),
+            'description': getattr(chat, 'description', ''),
+            'link': resolved_link,
+            'original_link': chat_link if chat_link != resolved_link else None
+        },
+        'analysis_results': None,
+        'group_info': group_info,
+        'scan_status': ScanStatus.SKIPPED,
+        'skip_reason': skip_reason
+    }
 
-async def analyze_single_chat(chat_link: str):
-    """تحلیل یک چت"""
+async def find_stored_group(storage, link_key: Optional[str]) -> Optional[GroupInfo]:
+    """رکورد دیتابیس چت یک لینک (از طریق رجیستری یا link_key گروه)"""
+    if not link_key:
+        return None
+    
+    # کلیدی که قبلاً به یک چت حل شده (مثلاً لینک دعوت یک گروه عمومی)
+    registered = await storage.get_registered_link(link_key)
+    if registered and registered.get('chat_id') is not None:
+        group_info = await storage.get_group_info(registered['chat_id'])
+        if group_info:
+            return group_info
+    
+    return await storage.get_group_by_link_key(link_key)
+
+async def needs_chat_fetch(resolved_link: str, scanned_chats: Optional[Set[int]] = None) -> bool:
+    """آیا اسکن این لینک به درخواست تلگرام می‌رسد (همان شرط‌های رد شدن analyze_single_chat از روی دیتابیس)"""
+    async with StorageManager() as storage:
+        group_info = await find_stored_group(storage, canonical_link_key(resolved_link))
+    if not group_info:
+        return True
+    if group_info.chat_id is not None:
+        if scanned_chats is not None and group_info.chat_id in scanned_chats:
+            return False
+        if group_info.chat_type not in GROUP_CHAT_TYPES:
+            return False
+    should_scan, _, _ = await should_scan_group(group_info)
+    return should_scan
+
+@asynccontextmanager
+async def telegram_session(client: Optional[TelegramClientManager] = None):
+    """کلاینت مشترک اجرا در صورت وجود، وگرنه یک کلاینت تازه برای همین چت"""
+    if client is not None:
+        yield client
+        return
+    async with TelegramClientManager(TELEGRAM_CONFIG) as client:
+        yield client
+
+async def record_chat_alias(chat_id: int, alias_keys, resolved_link: str, chat_link: str):
+    """ثبت لینک به عنوان alias چتی که در همین اجرا اسکن شده (بدون اسکن دوباره)"""
+    logger.info(f"🔁 {resolved_link} is an alias of chat {chat_id} - already scanned in this run")
+    aliases = sorted(alias_keys)
+    async with StorageManager() as storage:
+        for key in aliases:
+            await storage.set_link_chat_id(key, chat_id)
+        await storage.add_group_aliases(chat_id, aliases)
+    
+    return {
+        'chat_info': {
+            'id': chat_id,
+            'link': resolved_link,
+            'original_link': chat_link if chat_link != resolved_link else None
+        },
+        'analysis_results': None,
+        'group_info': None,
+        'scan_status': ScanStatus.SKIPPED,
+        'skip_reason': 'duplicate_alias'
+    }
+
+async def analyze_single_chat(chat_link: str, resolved_link: Optional[str] = None,
+                              frontier: Optional[CrawlFrontier] = None,
+                              scanned_chats: Optional[Set[int]] = None,
+                              client: Optional[TelegramClientManager] = None,
+                              prefetched: Optional[PrefetchedChat] = None):
+    """تحلیل یک چت (لینک‌های تلگرام پیدا شده در پیام‌ها به صف کشف frontier اضافه می‌شوند)
+    
+    scanned_chats: chat_idهای اسکن شده در این اجرا؛ لینک دیگری از همین چت فقط به عنوان alias ثبت می‌شود
+    client: کلاینت مشترک اجرا (None یعنی یک کلاینت برای همین چت)
+    prefetched: اطلاعات چت و صفحه اول تاریخچه که مرحله lookahead از قبل دریافت کرده است
+    """
     logger.info(f"🔍 Starting analysis for: {chat_link}")
+    scan_started = time.monotonic()
     
-    # حل کردن و اعتبارسنجی لینک
-    resolved_link = await resolve_and_validate_link(chat_link)
+    # حل کردن و اعتبارسنجی لینک (اگر فراخواننده قبلاً حل نکرده باشد)
+    if resolved_link is None:
+        resolved_link = prefetched.resolved_link if prefetched else await resolve_and_validate_link(chat_link)
     
     # بررسی اطلاعات گروه در دیتابیس
     group_info = None
     scan_status = ScanStatus.FAILED
     last_message_id = None
     start_message_id = None
+    analysis_results = None
+    extracted_links: List[str] = []
+    
+    # همه شکل‌های یک لینک (t.me/x، t.me/x/123، telegram.me/X، @x، ?start=...) یک کلید دارند
+    link_key = canonical_link_key(resolved_link)
     
     # بررسی اینکه آیا گروه در دیتابیس وجود دارد
-    async with MongoServiceManager() as mongo_service:
-        # تلاش برای یافتن گروه بر اساس لینک
-        if resolved_link.startswith('https://t.me/'):
-            username = resolved_link.split('t.me/')[1].split('/')[0]
-            group_info = await mongo_service.get_group_by_username(username)
+    async with StorageManager() as storage:
+        group_info = await find_stored_group(storage, link_key)
+    
+    # لینک دیگری از چتی که در همین اجرا اسکن شده (از روی رجیستری، بدون درخواست تلگرام)
+    alias_keys = {link_key, canonical_link_key(chat_link)} - {None}
+    if scanned_chats is not None and group_info and group_info.chat_id is not None:
+        if group_info.chat_id in scanned_chats:
+            return await record_chat_alias(group_info.chat_id, alias_keys, resolved_link, chat_link)
+        scanned_chats.add(group_info.chat_id)
+    
+    # بررسی زمان اسکن اگر گروه در دیتابیس وجود دارد
+    if group_info:
+        should_scan, reason, remaining_minutes = await should_scan_group(group_info)
         
-        # اگر پیدا نشد، بر اساس لینک جستجو کن
-        if not group_info:
-            # اینجا می‌توانیم جستجوی بیشتری انجام دهیم
-            pass
+        if not should_scan:
+            if ANALYSIS_CONFIG.show_remaining_time:
+                remaining_time = format_remaining_time(remaining_minutes)
+                logger.info(f"⏰ Last scan: {group_info.last_scan_time.strftime('%Y-%m-%d %H:%M:%S')} ({remaining_minutes} minutes ago)")
+                logger.info(f"⏭️ Skipping scan - too recent (wait {remaining_time} more)")
+            else:
+                logger.info(f"⏭️ Skipping scan - too recent (wait {remaining_minutes} more minutes)")
+            
+            return {
+                'chat_info': {
+                    'id': group_info.chat_id,
+                    'title': 'Unknown',  # از دیتابیس نمی‌توانیم عنوان را بفهمیم
+                    'username': group_info.username,
+                    'type': 'unknown',
+                    'members_count': 0,
+                    'description': '',
+                    'link': resolved_link,
+                    'original_link': chat_link if chat_link != resolved_link else None
+                },
+                'analysis_results': None,
+                'group_info': group_info,
+                'scan_status': ScanStatus.SKIPPED,
+                'skip_reason': 'too_recent',
+                'remaining_minutes': remaining_minutes
+            }
+        else:
+            logger.info(f"✅ Group ready for scan (last scan: {group_info.last_scan_time.strftime('%Y-%m-%d %H:%M:%S') if group_info.last_scan_time else 'Never'})")
+        
+        # نوع کانال و چت خصوصی تغییر نمی‌کند؛ بدون اتصال به تلگرام ثبت و رد می‌شود
+        if group_info.chat_id is not None and group_info.chat_type not in GROUP_CHAT_TYPES:
+            return await skip_non_group_chat(group_info, resolved_link, chat_link, scan_started)
     
-    async with TelegramClientManager(TELEGRAM_CONFIG) as client:
+    async with telegram_session(client) as client:
         try:
-            # بررسی زمان اسکن اگر گروه در دیتابیس وجود دارد
-            if group_info:
-                should_scan, reason, remaining_minutes = await should_scan_group(group_info)
-                
-                if not should_scan:
-                    if ANALYSIS_CONFIG.show_remaining_time:
-                        remaining_time = format_remaining_time(remaining_minutes)
-                        logger.info(f"⏰ Last scan: {group_info.last_scan_time.strftime('%Y-%m-%d %H:%M:%S')} ({remaining_minutes} minutes ago)")
-                        logger.info(f"⏭️ Skipping scan - too recent (wait {remaining_time} more)")
-                    else:
-                        logger.info(f"⏭️ Skipping scan - too recent (wait {remaining_minutes} more minutes)")
-                    
-                    return {
-                        'chat_info': {
-                            'id': group_info.chat_id,
-                            'title': 'Unknown',  # از دیتابیس نمی‌توانیم عنوان را بفهمیم
-                            'username': group_info.username,
-                            'type': 'unknown',
-                            'members_count': 0,
-                            'description': '',
-                            'link': resolved_link,
-                            'original_link': chat_link if chat_link != resolved_link else None
-                        },
-                        'analysis_results': None,
-                        'group_info': group_info,
-                        'scan_status': ScanStatus.SKIPPED,
-                        'skip_reason': 'too_recent',
-                        'remaining_minutes': remaining_minutes
-                    }
-                else:
-                    logger.info(f"✅ Group ready for scan (last scan: {group_info.last_scan_time.strftime('%Y-%m-%d %H:%M:%S') if group_info.last_scan_time else 'Never'})")
-            
-            # تحلیل کامل چت
-            chat, messages, members = await client.analyze_chat_complete(resolved_link)
+            # فقط اطلاعات چت (یک get_chat)؛ پیام‌ها و اعضا پس از بررسی نوع چت دریافت می‌شوند
+            if prefetched and prefetched.chat_fetched:
+                chat = prefetched.chat
+            else:
+                chat = await client.get_chat_info(resolved_link)
             
             if not chat:
                 logger.error(f"❌ Could not access chat: {resolved_link}")
+                if group_info and group_info.chat_id is None:
+                    # کاندید حل نشده از ابتدای صف کشف خارج می‌شود و با زمان‌بندی عادی دوباره امتحان می‌شود
+                    group_info.priority = 0.0
+                    group_info.update_scan_info(
+                        status=ScanStatus.FAILED,
+                        interval_minutes=ANALYSIS_CONFIG.scan_interval_minutes
+                    )
+                    async with StorageManager() as storage:
+                        await storage.save_group_info(group_info)
                 return None
             
+            # کلید canonical چت (username در صورت وجود) و اتصال همه کلیدهای این لینک به chat_id
+            chat_username = getattr(chat, 'username', None)
+            chat_key = f"@{chat_username.lower()}" if chat_username else link_key
+            chat_keys = alias_keys | ({chat_key} - {None})
+            if frontier:
+                frontier.mark_known(chat_keys)
+            
+            # لینکی که تازه به چتی از همین اجرا حل شد (چت رکورد دیتابیس بالاتر ثبت شده است)
+            if scanned_chats is not None and (group_info is None or group_info.chat_id != chat.id):
+                if chat.id in scanned_chats:
+                    return await record_chat_alias(chat.id, chat_keys, resolved_link, chat_link)
+                scanned_chats.add(chat.id)
+            
+            async with StorageManager() as storage:
+                for key in chat_keys:
+                    await storage.set_link_chat_id(key, chat.id)
+            
             # تعیین نوع چت
-            chat_type = ChatType.GROUP
-            if hasattr(chat, 'type'):
-                if str(chat.type) == 'ChatType.CHANNEL':
-                    chat_type = ChatType.CHANNEL
-                elif str(chat.type) == 'ChatType.SUPERGROUP':
-                    chat_type = ChatType.SUPERGROUP
-                elif str(chat.type) == 'ChatType.PRIVATE':
-                    chat_type = ChatType.PRIVATE
-            
-            # بررسی اینکه آیا چت گروه است یا نه
-            is_group = chat_type in [ChatType.GROUP, ChatType.SUPERGROUP]
-            is_channel = chat_type == ChatType.CHANNEL
-            
-            if is_channel:
-                logger.warning(f"⚠️ Skipping channel: {chat.title} (ID: {chat.id})")
-                logger.info(f"   📢 Channel type detected - only groups are processed")
-                
-                # ایجاد اطلاعات کانال برای ذخیره در دیتابیس
-                channel_info = GroupInfo(
-                    chat_id=chat.id,
-                    username=getattr(chat, 'username', None),
-                    link=resolved_link,
-                    chat_type=chat_type,
-                    is_public=is_public
-                )
-                
-                # ذخیره اطلاعات کانال در MongoDB
-                async with MongoServiceManager() as mongo_service:
-                    if await mongo_service.save_group_info(channel_info):
-                        logger.info(f"✅ Channel info saved to MongoDB: {channel_info.chat_id}")
-                    else:
-                        logger.error(f"❌ Failed to save channel info to MongoDB: {channel_info.chat_id}")
-                
-                return {
-                    'chat_info': {
-                        'id': chat.id,
-                        'title': chat.title,
-                        'username': getattr(chat, 'username', None),
-                        'type': str(chat.type),
-                        'members_count': getattr(chat, 'members_count', 0),
-                        'description': getattr(chat, 'description', ''),
-                        'link': resolved_link,
-                        'original_link': chat_link if chat_link != resolved_link else None
-                    },
-                    'analysis_results': None,
-                    'group_info': channel_info,
-                    'scan_status': ScanStatus.SKIPPED,
-                    'skip_reason': 'channel_detected'
-                }
+            chat_type = get_chat_type(chat)
             
-            if not is_group:
-                logger.warning(f"⚠️ Skipping non-group chat: {chat.title} (ID: {chat.id}, Type: {chat_type})")
-                logger.info(f"   ❌ Non-group type detected - only groups are processed")
-                
-                # ایجاد اطلاعات چت برای ذخیره در دیتابیس
+            # تعیین public/private بودن
+            is_public = bool(getattr(chat, 'username', None))
+            
+            # کانال‌ها و چت‌های غیرگروهی قبل از دریافت پیام‌ها و اعضا ثبت و رد می‌شوند
+            if chat_type not in GROUP_CHAT_TYPES:
                 other_chat_info = GroupInfo(
                     chat_id=chat.id,
                     username=getattr(chat, 'username', None),
                     link=resolved_link,
+                    link_key=chat_key,
                     chat_type=chat_type,
-                    is_public=is_public
+                    is_public=is_public,
+                    aliases=sorted(chat_keys)
                 )
-                
-                # ذخیره اطلاعات چت در MongoDB
-                async with MongoServiceManager() as mongo_service:
-                    if await mongo_service.save_group_info(other_chat_info):
-                        logger.info(f"✅ Chat info saved to MongoDB: {other_chat_info.chat_id}")
-                    else:
-                        logger.error(f"❌ Failed to save chat info to MongoDB: {other_chat_info.chat_id}")
-                
-                return {
-                    'chat_info': {
-                        'id': chat.id,
-                        'title': chat.title,
-                        'username': getattr(chat, 'username', None),
-                        'type': str(chat.type),
-                        'members_count': getattr(chat, 'members_count', 0),
-                        'description': getattr(chat, 'description', ''),
-                        'link': resolved_link,
-                        'original_link': chat_link if chat_link != resolved_link else None
-                    },
-                    'analysis_results': None,
-                    'group_info': other_chat_info,
-                    'scan_status': ScanStatus.SKIPPED,
-                    'skip_reason': 'non_group_chat'
-                }
+                return await skip_non_group_chat(other_chat_info, resolved_link, chat_link, scan_started, chat)
             
             logger.info(f"✅ Processing group: {chat.title} (Type: {chat_type})")
             
-            # تعیین public/private بودن
-            is_public = bool(getattr(chat, 'username', None))
-            
             # ایجاد اطلاعات گروه
             group_info = GroupInfo(
                 chat_id=chat.id,
                 username=getattr(chat, 'username', None),
                 link=resolved_link,
+                link_key=chat_key,
                 chat_type=chat_type,
-                is_public=is_public
+                is_public=is_public,
+                aliases=sorted(chat_keys)
             )
             
             # آماده سازی tracker و analyzer
@@ -232,6 +329,18 @@ async def analyze_single_chat(chat_link: str):
             
             logger.info(f"📊 Chat Info: {chat_info['title']} ({chat_info['members_count']} members)")
             
+            def track_member(member):
+                """ثبت هر عضو در tracker همزمان با دریافت"""
+                if hasattr(member, 'user'):  # اگر ChatMember object است
+                    user_tracker.add_user_from_member(member, chat_info)
+                else:  # اگر User object است
+                    user_tracker.add_user_direct(member, chat_info)
+            
+            # دریافت همزمان پیام‌ها و اعضا فقط برای گروه‌ها؛ اعضا در حین دریافت ثبت می‌شوند
+            messages, members = await client.get_chat_contents(
+                chat.id, on_member=track_member, first_page=prefetched.first_page if prefetched else None
+            )
+            
             # پردازش پیام‌ها
             if messages:
                 logger.info(f"📝 Processing {len(messages)} messages...")
@@ -289,15 +398,12 @@ async def analyze_single_chat(chat_link: str):
                 analysis_results = {}
                 scan_status = ScanStatus.PARTIAL
             
-            # پردازش اعضا (اگر دریافت شده باشند)
+            # اعضا در حین دریافت به tracker اضافه شده‌اند
             if members:
-                logger.info(f"👥 Processing {len(members)} members...")
-                if hasattr(members[0], 'user'):  # اگر ChatMember objects هستند
-                    for member in members:
-                        user_tracker.add_user_from_member(member, chat_info)
-                else:  # اگر User objects هستند
-                    for user in members:
-                        user_tracker.add_user_direct(user, chat_info)
+                logger.info(f"👥 Tracked {len(members)} members")
+            
+            # ذخیره دسته‌ای کاربران و پیام‌های این اسکن در دیتابیس
+            await user_tracker.flush_to_database()
             
             # ذخیره نتایج
             results_file = Path(ANALYSIS_CONFIG.results_dir) / ANALYSIS_CONFIG.output_file
@@ -315,6 +421,19 @@ async def analyze_single_chat(chat_link: str):
                 
                 logger.info(f"🔗 Extracted links saved to: {links_file}")
                 logger.info(f"   📊 Total extracted links: {len(message_analyzer.extracted_links)}")
+                
+                # ثبت لینک‌ها در رجیستری؛ هر چت فقط یک رکورد دارد
+                extracted_links = sorted(message_analyzer.extracted_links)
+                async with StorageManager() as storage:
+                    counts = await storage.register_links(
+                        [link for link in map(classify_link, extracted_links) if link and link.key]
+                    )
+                    logger.info(f"   🗂️ Link registry: {counts['inserted']} new, {counts['updated']} known")
+                    
+                    # چت‌های جدید بدون مرحله دستی به صف اسکن اضافه می‌شوند
+                    if frontier:
+                        frontier.observe(message_analyzer.link_sightings)
+                        await frontier.flush(storage)
             
             # ذخیره کاربران به تلگرام
             users_saved = await user_tracker.save_all_users_to_telegram()
@@ -340,21 +459,32 @@ async def analyze_single_chat(chat_link: str):
             group_info.update_scan_info(
                 message_id=last_message_id,
                 start_message_id=start_message_id,
-                status=scan_status
+                status=scan_status,
+                interval_minutes=ANALYSIS_CONFIG.scan_interval_minutes
             )
             
-            # ذخیره در MongoDB
-            async with MongoServiceManager() as mongo_service:
-                if await mongo_service.save_group_info(group_info):
-                    logger.info(f"✅ Group info saved to MongoDB: {group_info.chat_id}")
+            # ذخیره در دیتابیس
+            async with StorageManager() as storage:
+                if await storage.save_group_info(group_info):
+                    logger.info(f"✅ Group info saved to database: {group_info.chat_id}")
                 else:
-                    logger.error(f"❌ Failed to save group info to MongoDB: {group_info.chat_id}")
+                    logger.error(f"❌ Failed to save group info to database: {group_info.chat_id}")
+                
+                await storage.record_scan(
+                    chat_id=group_info.chat_id,
+                    link=resolved_link,
+                    status=scan_status,
+                    message_count=(analysis_results or {}).get('total_messages', 0),
+                    last_message_id=last_message_id,
+                    duration_seconds=time.monotonic() - scan_started
+                )
         
         return {
             'chat_info': chat_info if 'chat_info' in locals() else None,
             'analysis_results': analysis_results if 'analysis_results' in locals() else None,
             'group_info': group_info,
-            'scan_status': scan_status
+            'scan_status': scan_status,
+            'extracted_links': extracted_links
         }
 
 async def should_scan_group(group_info: GroupInfo) -> tuple[bool, str, int]:
@@ -364,6 +494,12 @@ async def should_scan_group(group_info: GroupInfo) -> tuple[bool, str, int]:
     Returns:
         tuple: (should_scan, reason, remaining_minutes)
     """
+    if group_info.next_scan_at:
+        remaining_seconds = (group_info.next_scan_at - datetime.utcnow()).total_seconds()
+        if remaining_seconds > 0:
+            return False, "too_recent", max(1, int(remaining_seconds // 60))
+        return True, "ready_for_scan", 0
+    
     if not group_info.last_scan_time:
         return True, "no_previous_scan", 0
     
@@ -401,35 +537,42 @@ def format_remaining_time(minutes: int) -> str:
         else:
             return f"{hours} ساعت و {remaining_minutes} دقیقه"
 
-async def get_groups_from_database() -> List[str]:
-    """دریافت گروه‌ها از دیتابیس MongoDB"""
-    logger.info("🔍 Reading groups from MongoDB database...")
+async def iter_groups_from_database() -> AsyncIterator[str]:
+    """پیمایش جریانی لینک گروه‌های آماده اسکن از دیتابیس (ابتدا کاندیدهای صف کشف به ترتیب اولویت)"""
+    logger.info("🔍 Reading groups from database...")
     
     try:
-        async with MongoServiceManager() as mongo_service:
-            # دریافت تمام گروه‌ها از دیتابیس
-            all_groups = await mongo_service.get_all_groups()
-            
-            if not all_groups:
-                logger.warning("⚠️ No groups found in MongoDB database")
-                return []
-            
-            # تبدیل گروه‌ها به لینک‌ها
-            group_links = []
-            for group in all_groups:
-                if group.link:
-                    group_links.append(group.link)
-                elif group.username:
-                    group_links.append(f"@{group.username}")
-                else:
+        async with StorageManager() as storage:
+            await storage.backfill_next_scan_at(ANALYSIS_CONFIG.scan_interval_minutes)
+            due_at = datetime.utcnow()
+            
+            count = 0
+            frontier_keys = set()
+            if FRONTIER_SETTINGS.enabled:
+                candidates = await storage.get_frontier_candidates(FRONTIER_SETTINGS.max_candidates_per_run, due_at)
+                if candidates:
+                    logger.info(f"🧭 {len(candidates)} discovered candidates queued by priority")
+                for candidate in candidates:
+                    if candidate.scan_target:
+                        frontier_keys.add(candidate.link_key)
+                        count += 1
+                        yield candidate.scan_target
+            
+            # فقط گروه‌هایی که زمان اسکنشان رسیده با یک کوئری ایندکس‌دار خوانده می‌شوند
+            async for group in storage.iter_groups(due_at=due_at):
+                if group.chat_id is None and group.link_key in frontier_keys:
+                    continue
+                target = group.scan_target
+                if not target:
                     logger.warning(f"⚠️ Group {group.chat_id} has no link or username")
+                    continue
+                count += 1
+                yield target
             
-            logger.info(f"✅ Retrieved {len(group_links)} group links from database")
-            return group_links
+            logger.info(f"✅ Streamed {count} group links from database")
             
     except Exception as e:
         logger.error(f"❌ Error reading groups from database: {e}")
-        return []
 
 async def get_groups_from_file() -> List[str]:
     """دریافت گروه‌ها از فایل links.txt"""
@@ -451,6 +594,30 @@ async def get_groups_from_file() -> List[str]:
     logger.info(f"✅ Retrieved {len(chat_links)} group links from file")
     return chat_links
 
+async def iter_groups_from_file() -> AsyncIterator[str]:
+    """پیمایش لینک‌های فایل links.txt"""
+    for link in await get_groups_from_file():
+        yield link
+
+async def iter_chat_links() -> AsyncIterator[str]:
+    """منبع لینک‌ها بر اساس تنظیمات؛ اگر منبع اول خالی باشد از منبع دوم خوانده می‌شود"""
+    if ANALYSIS_CONFIG.use_database_for_groups:
+        logger.info("🔍 Using database as source for groups...")
+        sources = [("database", iter_groups_from_database), ("file", iter_groups_from_file)]
+    else:
+        logger.info("🔍 Using file as source for groups...")
+        sources = [("file", iter_groups_from_file), ("database", iter_groups_from_database)]
+    
+    for index, (name, source) in enumerate(sources):
+        found = False
+        async for link in source():
+            found = True
+            yield link
+        if found:
+            return
+        if index == 0:
+            logger.warning(f"⚠️ No groups found in {name}, trying the other source...")
+
 async def main():
     """تابع اصلی"""
     try:
@@ -463,67 +630,103 @@ async def main():
         logger.info(f"   🔄 Resume from last message: {ANALYSIS_CONFIG.resume_from_last_message}")
         logger.info(f"   📊 Show remaining time: {ANALYSIS_CONFIG.show_remaining_time}")
         
-        # خواندن گروه‌ها بر اساس تنظیمات
-        if ANALYSIS_CONFIG.use_database_for_groups:
-            logger.info("🔍 Using database as source for groups...")
-            chat_links = await get_groups_from_database()
-            
-            if not chat_links:
-                logger.warning("⚠️ No groups found in database, trying to read from file...")
-                chat_links = await get_groups_from_file()
-        else:
-            logger.info("🔍 Using file as source for groups...")
-            chat_links = await get_groups_from_file()
-            
-            if not chat_links:
-                logger.warning("⚠️ No groups found in file, trying to read from database...")
-                chat_links = await get_groups_from_database()
+        # لینک‌ها به صورت جریانی خوانده، حل و تحلیل می‌شوند تا اسکن از همان گروه اول شروع شود
+        all_results = []
+        skipped_results = []
+        total_links = 0
+        duplicate_links = 0
+        # با SEEN_SET_BACKEND=bloom حافظه این مجموعه در اجراهای خیلی بزرگ ثابت می‌ماند
+        processed_keys = create_seen_set()
+        # لینک‌های مختلفِ یک chat_id (username، لینک دعوت، username قدیمی) فقط یک بار اسکن می‌شوند
+        scanned_chats: Set[int] = set()
+        # یک resolver و session برای همه لینک‌ها؛ نتایج در کش ماندگار storage بین اجراها باقی می‌مانند
+        async with StorageManager() as storage:
+            frontier = None
+            if FRONTIER_SETTINGS.enabled:
+                frontier = CrawlFrontier()
+                await frontier.load(storage)
+            
+            async with URLResolver(storage=storage) as resolver, AsyncExitStack() as stack:
+                links = iter_chat_links()
+                client = None
+                prefetcher = None
+                if PREFETCH_SETTINGS.lookahead > 0:
+                    # یک کلاینت برای کل اجرا تا لینک‌های بعدی همزمان با پردازش چت فعلی آماده شوند
+                    client = await stack.enter_async_context(TelegramClientManager(TELEGRAM_CONFIG))
+                    prefetcher = ChatPrefetcher(
+                        client,
+                        lambda link: resolve_and_validate_link(link, resolver),
+                        should_fetch=lambda link: needs_chat_fetch(link, scanned_chats)
+                    )
+                    stack.callback(prefetcher.close)
+                    links = prefetcher.iter_links(links)
+                
+                async for original_link in links:
+                    if total_links:
+                        # تاخیر بین چت‌ها
+                        await asyncio.sleep(2)
+                    total_links += 1
+                    i = total_links
+                    
+                    # هر چت در یک اجرا فقط یک بار حل و اسکن می‌شود، با هر شکلی از لینک
+                    original_key = canonical_link_key(original_link)
+                    if original_key and original_key in processed_keys:
+                        logger.info(f"⏭️ Duplicate of an already processed chat: {original_link}")
+                        duplicate_links += 1
+                        continue
+                    
+                    # با lookahead لینک قبلاً حل و اطلاعات چت در پس‌زمینه دریافت شده است
+                    prefetched = await prefetcher.take(original_link) if prefetcher else None
+                    if prefetched:
+                        resolved_link = prefetched.resolved_link
+                    else:
+                        resolved_link = await resolve_and_validate_link(original_link, resolver)
+                    resolved_key = canonical_link_key(resolved_link)
+                    if resolved_key and resolved_key in processed_keys:
+                        logger.info(f"⏭️ Duplicate of an already processed chat: {original_link} -> {resolved_link}")
+                        duplicate_links += 1
+                        continue
+                    processed_keys.update({original_key, resolved_key} - {None})
+                    
+                    logger.info(f"🔍 Analyzing chat {i}")
+                    logger.info(f"   Original: {original_link}")
+                    logger.info(f"   Resolved: {resolved_link}")
+                    
+                    result = await analyze_single_chat(
+                        original_link, resolved_link, frontier, scanned_chats, client, prefetched
+                    )
+                    if result:
+                        if result.get('skip_reason') == 'duplicate_alias':
+                            duplicate_links += 1
+                        elif result.get('scan_status') == ScanStatus.SKIPPED:
+                            skipped_results.append(result)
+                            logger.info(f"⏭️ Chat {i} skipped: {result.get('skip_reason', 'unknown')}")
+                        else:
+                            all_results.append(result)
+                            logger.info(f"✅ Chat {i} completed successfully")
+                    else:
+                        logger.error(f"❌ Chat {i} failed")
+                
+                redirect_stats = resolver.get_redirect_stats()
+                logger.info(f"🔗 Redirect cache: {redirect_stats['cache_hits']} hits, {redirect_stats['http_requests']} HTTP requests")
+                
+                if prefetcher:
+                    prefetch_stats = prefetcher.get_stats()
+                    logger.info(f"🔭 Prefetch: {prefetch_stats['used']}/{prefetch_stats['prefetched']} chats used, {prefetch_stats['discarded']} discarded")
+            
+            if frontier:
+                frontier.close()
+                frontier_stats = frontier.get_stats()
+                logger.info(f"🧭 Frontier: {frontier_stats['inserted']} new candidates, {frontier_stats['updated']} re-prioritized, {frontier_stats['known_skipped']} known links skipped")
         
-        if not chat_links:
+        if not total_links:
             logger.error("❌ No chat links found in database or file")
             return
         
-        logger.info(f"📋 Found {len(chat_links)} chat(s) to analyze")
-        
-        # حل کردن و اعتبارسنجی همه لینک‌ها
-        logger.info("🔍 Resolving and validating all links...")
-        resolved_links = []
-        for i, link in enumerate(chat_links, 1):
-            logger.info(f"🔍 Processing link {i}/{len(chat_links)}: {link}")
-            resolved_link = await resolve_and_validate_link(link)
-            resolved_links.append(resolved_link)
-            
-            # تاخیر کوتاه بین حل کردن لینک‌ها
-            if i < len(chat_links):
-                await asyncio.sleep(1)
-        
-        # تحلیل هر چت
-        all_results = []
-        skipped_results = []
-        for i, (original_link, resolved_link) in enumerate(zip(chat_links, resolved_links), 1):
-            logger.info(f"🔍 Analyzing chat {i}/{len(chat_links)}")
-            logger.info(f"   Original: {original_link}")
-            logger.info(f"   Resolved: {resolved_link}")
-            
-            result = await analyze_single_chat(resolved_link)
-            if result:
-                if result.get('scan_status') == ScanStatus.SKIPPED:
-                    skipped_results.append(result)
-                    logger.info(f"⏭️ Chat {i} skipped: {result.get('skip_reason', 'unknown')}")
-                else:
-                    all_results.append(result)
-                    logger.info(f"✅ Chat {i} completed successfully")
-            else:
-                logger.error(f"❌ Chat {i} failed")
-            
-            # تاخیر بین چت‌ها
-            if i < len(chat_links):
-                await asyncio.sleep(2)
-        
         # نمایش آمار کلی
         total_processed = len(all_results)
         total_skipped = len(skipped_results)
-        total_failed = len(chat_links) - total_processed - total_skipped
+        total_failed = total_links - total_processed - total_skipped - duplicate_links
         
         # شمارش انواع مختلف رد شده
         saved_channels = 0
@@ -543,8 +746,9 @@ async def main():
         logger.info(f"   📝 Other chats saved to DB: {saved_other_chats}")
         logger.info(f"   ⏰ Too recent to scan: {too_recent_scans}")
         logger.info(f"   ⏭️ Total skipped: {total_skipped}")
+        logger.info(f"   🔁 Duplicate links: {duplicate_links}")
         logger.info(f"   ❌ Failed: {total_failed}")
-        logger.info(f"   📋 Total links: {len(chat_links)}")
+        logger.info(f"   📋 Total links: {total_links}")
         
         # ذخیره نتایج کلی
         if all_results or skipped_results:
@@ -615,6 +819,8 @@ async def main():
     except Exception as e:
         logger.error(f"❌ Unexpected error: {e}")
         raise
+    finally:
+        await close_storage_service()
 
 if __name__ == "__main__":
     asyncio.run(main())
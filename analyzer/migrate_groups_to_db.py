@@ -10,10 +10,12 @@ from pathlib import Path
 # اضافه کردن مسیر ریشه پروژه
 sys.path.append(str(Path(__file__).parent.parent))
 
-from services.mongo_service import MongoServiceManager
+from services.storage import StorageManager
+from services.link_extractor import canonical_link_key, classify_link
 from models.data_models import GroupInfo, ChatType
 from config.settings import ANALYSIS_CONFIG
 from utils.logger import logger
+from utils.seen_set import create_seen_set
 
 async def read_groups_from_file() -> list:
     """خواندن گروه‌ها از فایل links.txt"""
@@ -36,27 +38,19 @@ async def read_groups_from_file() -> list:
         return []
 
 async def create_group_info_from_link(link: str) -> GroupInfo:
-    """ایجاد GroupInfo از لینک"""
-    # استخراج username از لینک
-    username = None
-    if link.startswith('@'):
-        username = link[1:]  # حذف @
-    elif 't.me/' in link:
-        # استخراج username از لینک تلگرام
-        parts = link.split('t.me/')
-        if len(parts) > 1:
-            username = parts[1].split('/')[0]
+    """ایجاد GroupInfo موقت از لینک (chat_id هنگام اسکن مشخص می‌شود)"""
+    # کلید canonical لینک؛ لینک‌های غیر تلگرامی (ریدایرکت) با خود لینک شناخته می‌شوند
+    link_key = canonical_link_key(link) or link
+    username = link_key[1:] if link_key.startswith('@') else None
     
-    # ایجاد GroupInfo موقت
-    group_info = GroupInfo(
-        chat_id=0,  # موقت - بعداً به‌روزرسانی می‌شود
+    return GroupInfo(
+        chat_id=None,
         username=username,
         link=link,
+        link_key=link_key,
         chat_type=ChatType.SUPERGROUP,  # پیش‌فرض
         is_public=bool(username)
     )
-    
-    return group_info
 
 async def migrate_groups_to_database():
     """انتقال گروه‌ها از فایل به دیتابیس"""
@@ -70,62 +64,48 @@ async def migrate_groups_to_database():
         return False
     
     try:
-        async with MongoServiceManager() as mongo_service:
-            # بررسی گروه‌های موجود در دیتابیس
-            existing_groups = await mongo_service.get_all_groups()
-            existing_links = {group.link for group in existing_groups if group.link}
-            existing_usernames = {group.username for group in existing_groups if group.username}
+        async with StorageManager() as storage:
+            # بررسی گروه‌های موجود در دیتابیس (بر اساس کلید canonical، نه متن لینک)
+            # گروه‌ها جریانی خوانده می‌شوند؛ با SEEN_SET_BACKEND=bloom حافظه کلیدها ثابت است
+            existing_count = 0
+            existing_keys = create_seen_set()
+            async for group in storage.iter_groups():
+                existing_count += 1
+                existing_keys.update({group.link_key, canonical_link_key(group.link), group.link} - {None})
             
-            logger.info(f"📊 Found {len(existing_groups)} existing groups in database")
+            logger.info(f"📊 Found {existing_count} existing groups in database")
             
             # انتقال گروه‌های جدید
             migrated_count = 0
             skipped_count = 0
             
             for link in file_groups:
-                # بررسی تکراری بودن
-                if link in existing_links:
-                    logger.info(f"⏭️ Skipping duplicate link: {link}")
-                    skipped_count += 1
-                    continue
+                group_info = await create_group_info_from_link(link)
                 
-                # استخراج username
-                username = None
-                if link.startswith('@'):
-                    username = link[1:]
-                elif 't.me/' in link:
-                    parts = link.split('t.me/')
-                    if len(parts) > 1:
-                        username = parts[1].split('/')[0]
-                
-                if username and username in existing_usernames:
-                    logger.info(f"⏭️ Skipping duplicate username: @{username}")
+                # بررسی تکراری بودن (t.me/x، @x، telegram.me/X و ... یک گروه هستند)
+                if group_info.link_key in existing_keys:
+                    logger.info(f"⏭️ Skipping duplicate link: {link} ({group_info.link_key})")
                     skipped_count += 1
                     continue
-                
-                # ایجاد GroupInfo
-                group_info = GroupInfo(
-                    chat_id=0,  # موقت
-                    username=username,
-                    link=link,
-                    chat_type=ChatType.SUPERGROUP,
-                    is_public=bool(username)
-                )
+                existing_keys.add(group_info.link_key)
                 
                 # ذخیره در دیتابیس
-                if await mongo_service.save_group_info(group_info):
+                if await storage.save_group_info(group_info):
                     logger.info(f"✅ Migrated: {link}")
                     migrated_count += 1
                 else:
                     logger.error(f"❌ Failed to migrate: {link}")
             
+            # ثبت لینک‌های تلگرامی در رجیستری
+            await storage.register_links([link for link in map(classify_link, file_groups) if link and link.key])
+            
             # نمایش آمار
             logger.info(f"\n📊 Migration Summary:")
             logger.info(f"   📄 Groups in file: {len(file_groups)}")
-            logger.info(f"   💾 Groups in database: {len(existing_groups)}")
+            logger.info(f"   💾 Groups in database: {existing_count}")
             logger.info(f"   ✅ Migrated: {migrated_count}")
             logger.info(f"   ⏭️ Skipped (duplicates): {skipped_count}")
-            logger.info(f"   📈 Total in database after migration: {len(existing_groups) + migrated_count}")
+            logger.info(f"   📈 Total in database after migration: {existing_count + migrated_count}")
             
             return migrated_count > 0
             
@@ -1,7 +1,7 @@
 from .data_models import (
-    LinkInfo, GroupInfo
+    LinkInfo, GroupInfo, LinkKind, ExtractedLink, FrontierCandidate
 )
 
 __all__ = [
-    'LinkInfo', 'GroupInfo'
+    'LinkInfo', 'GroupInfo', 'LinkKind', 'ExtractedLink', 'FrontierCandidate'
 ]
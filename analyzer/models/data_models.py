@@ -1,6 +1,6 @@
-from dataclasses import dataclass, asdict
-from datetime import datetime
-from typing import Optional, Dict, Any
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
 from enum import Enum
 
 class ChatType(Enum):
@@ -27,12 +27,46 @@ class LinkInfo:
     is_redirect: bool = False
     redirect_source: str = ""
 
+class LinkKind(Enum):
+    """نوع لینک استخراج شده از متن پیام"""
+    TELEGRAM_PUBLIC = "telegram_public"
+    TELEGRAM_INVITE = "telegram_invite"
+    TELEGRAM_PRIVATE = "telegram_private"
+    MENTION = "mention"
+    WEB = "web"
+
+@dataclass(frozen=True)
+class ExtractedLink:
+    """لینک استخراج شده از پیام به شکل نرمال شده (canonical)؛ تغییرناپذیر تا بین پیام‌ها به اشتراک گذاشته شود"""
+    url: str
+    raw: str
+    kind: LinkKind
+    identifier: str = ""
+    source: str = "text"  # text یا entity
+    
+    @property
+    def is_telegram(self) -> bool:
+        """آیا لینک به تلگرام اشاره می‌کند"""
+        return self.kind != LinkKind.WEB
+    
+    @property
+    def key(self) -> Optional[str]:
+        """کلید یکتای چت: @username با حروف کوچک، +hash برای دعوت، c:id برای لینک خصوصی"""
+        if self.kind in (LinkKind.TELEGRAM_PUBLIC, LinkKind.MENTION):
+            return f"@{self.identifier}"
+        if self.kind == LinkKind.TELEGRAM_INVITE:
+            return f"+{self.identifier}"
+        if self.kind == LinkKind.TELEGRAM_PRIVATE:
+            return f"c:{self.identifier}"
+        return None
+
 @dataclass
 class GroupInfo:
     """اطلاعات پایه گروه/کانال برای ذخیره در MongoDB"""
-    chat_id: int
+    chat_id: Optional[int]  # None تا وقتی لینک هنوز به چت حل نشده
     username: Optional[str] = None
     link: Optional[str] = None
+    link_key: Optional[str] = None  # کلید canonical لینک (@username یا +hash)
     chat_type: ChatType = ChatType.GROUP
     is_public: bool = True
     last_scan_time: Optional[datetime] = None
@@ -40,6 +74,10 @@ class GroupInfo:
     start_message_id: Optional[int] = None  # ID پیامی که اسکن شروع می‌شود
     last_scan_status: ScanStatus = ScanStatus.FAILED
     scan_count: int = 0
+    next_scan_at: Optional[datetime] = None  # زمان اسکن بعدی (None یعنی آماده اسکن)
+    priority: float = 0.0  # اولویت کاندیدهای کشف شده در صف اسکن
+    discovery_count: int = 0  # تعداد دفعاتی که لینک در پیام‌های گروه‌های دیگر دیده شده
+    aliases: List[str] = field(default_factory=list)  # کلید همه لینک‌هایی که به این چت رسیده‌اند
     created_at: datetime = None
     updated_at: datetime = None
     
@@ -73,7 +111,7 @@ class GroupInfo:
             data_copy['last_scan_status'] = ScanStatus(data_copy['last_scan_status'])
         
         # تبدیل datetime strings به datetime objects
-        for field in ['last_scan_time', 'created_at', 'updated_at']:
+        for field in ['last_scan_time', 'next_scan_at', 'created_at', 'updated_at']:
             if field in data_copy and isinstance(data_copy[field], str):
                 try:
                     data_copy[field] = datetime.fromisoformat(data_copy[field].replace('Z', '+00:00'))
@@ -84,9 +122,12 @@ class GroupInfo:
     
     def update_scan_info(self, message_id: Optional[int] = None, 
                         start_message_id: Optional[int] = None,
-                        status: ScanStatus = ScanStatus.SUCCESS):
+                        status: ScanStatus = ScanStatus.SUCCESS,
+                        interval_minutes: Optional[int] = None):
         """به‌روزرسانی اطلاعات اسکن"""
         self.last_scan_time = datetime.utcnow()
+        if interval_minutes is not None:
+            self.schedule_next_scan(interval_minutes)
         self.last_scan_status = status
         self.scan_count += 1
         self.updated_at = datetime.utcnow()
@@ -96,3 +137,63 @@ class GroupInfo:
         
         if start_message_id is not None:
             self.start_message_id = start_message_id
+    
+    def schedule_next_scan(self, interval_minutes: int):
+        """تعیین زمان اسکن بعدی نسبت به آخرین اسکن"""
+        base_time = self.last_scan_time or datetime.utcnow()
+        self.next_scan_at = base_time + timedelta(minutes=interval_minutes)
+
+@dataclass
+class GroupRef:
+    """رکورد سبک گروه برای برنامه‌ریزی اسکن (بدون تبدیل enum و تاریخ)"""
+    chat_id: Optional[int] = None
+    username: Optional[str] = None
+    link: Optional[str] = None
+    link_key: Optional[str] = None
+    chat_type: Optional[str] = None
+    is_public: Optional[bool] = None
+    last_scan_time: Optional[datetime] = None
+    last_message_id: Optional[int] = None
+    next_scan_at: Optional[datetime] = None
+    priority: Optional[float] = None
+    
+    # فیلدهایی که از MongoDB خوانده می‌شوند
+    PROJECTION = {
+        "_id": 0, "chat_id": 1, "username": 1, "link": 1, "link_key": 1, "chat_type": 1,
+        "is_public": 1, "last_scan_time": 1, "last_message_id": 1, "next_scan_at": 1, "priority": 1
+    }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'GroupRef':
+        """ایجاد از سند projected MongoDB"""
+        return cls(
+            chat_id=data.get('chat_id'),
+            username=data.get('username'),
+            link=data.get('link'),
+            link_key=data.get('link_key'),
+            chat_type=data.get('chat_type'),
+            is_public=data.get('is_public'),
+            last_scan_time=data.get('last_scan_time'),
+            last_message_id=data.get('last_message_id'),
+            next_scan_at=data.get('next_scan_at'),
+            priority=data.get('priority')
+        )
+    
+    @property
+    def scan_target(self) -> Optional[str]:
+        """لینک قابل اسکن (link یا @username)"""
+        if self.link:
+            return self.link
+        if self.username:
+            return f"@{self.username}"
+        return None
+
+@dataclass
+class FrontierCandidate:
+    """چت کشف شده در پیام‌ها که هنوز اسکن نشده؛ امتیاز این اجرا به اولویت ذخیره شده اضافه می‌شود"""
+    link_key: str
+    link: str
+    username: Optional[str] = None
+    is_public: bool = True
+    score: float = 0.0
+    sightings: int = 0
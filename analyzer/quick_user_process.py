@@ -33,13 +33,26 @@ async def quick_process_user(user_id: int):
         logger.error(f"❌ Error processing user {user_id}: {e}")
         return False
 
+async def quick_process_all_users():
+    """پردازش سریع همه کاربران در یک پیمایش"""
+    logger.info("🚀 Quick processing all users...")
+    
+    processor = UserJSONProcessor()
+    stats = await processor.process_all_users()
+    return stats['failed'] == 0
+
 async def main():
     """تابع اصلی"""
     if len(sys.argv) != 2:
-        print("Usage: python quick_user_process.py <user_id>")
+        print("Usage: python quick_user_process.py <user_id|all>")
         print("Example: python quick_user_process.py 123456789")
         sys.exit(1)
     
+    if sys.argv[1] == 'all':
+        success = await quick_process_all_users()
+        print("🎉 All users processed successfully!" if success else "❌ Some users failed to process")
+        sys.exit(0 if success else 1)
+    
     try:
         user_id = int(sys.argv[1])
     except ValueError:
@@ -1,5 +1,5 @@
 import asyncio
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
 from pyrogram import Client
 from pyrogram.errors import (
@@ -9,8 +9,17 @@ from pyrogram.errors import (
 )
 from pyrogram import raw
 
+from config.settings import RATE_LIMIT_SETTINGS
 from models.data_models import LinkInfo
 from utils.logger import logger
+from utils.rate_limiter import get_rate_limiter
+from .invite_cache import invite_cache
+from .telegram_client import telegram_rate_limiter
+
+# تعداد تلاش CheckChatInvite پس از FloodWait
+INVITE_CHECK_ATTEMPTS = 2
+# FloodWait طولانی‌تر از این صبر نمی‌شود و نتیجه خطا (با TTL کوتاه) برمی‌گردد
+MAX_FLOOD_WAIT_RETRY_SECONDS = 60
 
 class ChatAnalyzer:
     """کلاس تحلیل چت‌ها"""
@@ -19,9 +28,28 @@ class ChatAnalyzer:
         self.client = client
     
     async def analyze_invite_link_advanced(self, invite_hash: str, original_link: str) -> Dict:
-        """تحلیل پیشرفته لینک‌های دعوت با استفاده از raw API"""
+        """تحلیل پیشرفته لینک‌های دعوت با استفاده از raw API (نتیجه هر hash کش و بین فراخوانی‌های همزمان مشترک است)"""
+        info = await invite_cache.get_or_probe(invite_hash, lambda: self._check_invite(invite_hash))
+        return {**info, 'link': original_link}
+    
+    async def _check_invite(self, invite_hash: str) -> Dict[str, Any]:
+        """فراخوانی CheckChatInvite با نوبت limiterهای مشترک؛ پس از FloodWait بررسی‌های بعدی هم متوقف می‌شوند"""
+        invite_limiter = get_rate_limiter("check_chat_invite", RATE_LIMIT_SETTINGS.invite_checks_per_minute / 60)
+        for attempt in range(INVITE_CHECK_ATTEMPTS):
+            await invite_limiter.acquire()
+            await telegram_rate_limiter().acquire()
+            try:
+                return await self._probe_invite(invite_hash)
+            except FloodWait as e:
+                logger.warning(f"⏳ CheckChatInvite rate limit hit, waiting {e.value} seconds...")
+                invite_limiter.pause(e.value)
+                if e.value > MAX_FLOOD_WAIT_RETRY_SECONDS or attempt + 1 == INVITE_CHECK_ATTEMPTS:
+                    return self._invite_result(invite_hash, status="error", error=f"FloodWait {e.value}s")
+    
+    @staticmethod
+    def _invite_result(invite_hash: str, **values) -> Dict[str, Any]:
+        """نتیجه پایه بررسی لینک دعوت"""
         result = {
-            'link': original_link,
             'type': "invite_link",
             'status': "unknown",
             'invite_hash': invite_hash,
@@ -35,6 +63,12 @@ class ChatAnalyzer:
             'is_group': False,
             'error': None
         }
+        result.update(values)
+        return result
+    
+    async def _probe_invite(self, invite_hash: str) -> Dict[str, Any]:
+        """یک فراخوانی CheckChatInvite (FloodWait به فراخواننده برمی‌گردد)"""
+        result = self._invite_result(invite_hash)
         
         try:
             # استفاده از raw API برای چک کردن invite link
@@ -103,10 +137,12 @@ class ChatAnalyzer:
         except InviteHashInvalid:
             result['error'] = "Invalid invite link"
             result['status'] = "invalid"
+        except FloodWait:
+            raise
         except Exception as e:
             result['error'] = str(e)
             result['status'] = "error"
-            logger.error(f"Error analyzing invite link {original_link}: {e}")
+            logger.error(f"Error analyzing invite link {invite_hash}: {e}")
         
         return result
     
@@ -0,0 +1,118 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+from config.settings import MESSAGE_SETTINGS, PREFETCH_SETTINGS
+from utils.logger import logger
+from .telegram_client import TelegramClientManager, GROUP_CHAT_TYPES, HISTORY_PAGE_SIZE, get_chat_type
+
+@dataclass
+class PrefetchedChat:
+    """نتیجه آماده‌سازی یک لینک: لینک حل شده و در صورت دریافت، اطلاعات چت و صفحه اول تاریخچه"""
+    resolved_link: str
+    chat: Any = None
+    chat_fetched: bool = False  # False یعنی get_chat انجام نشده (نه اینکه چت در دسترس نیست)
+    first_page: Optional[List[Any]] = None
+
+class ChatPrefetcher:
+    """مرحله lookahead: K لینک بعدی صف همزمان با پردازش چت فعلی حل می‌شوند و get_chat و صفحه اول تاریخچه آنها دریافت می‌شود"""
+
+    def __init__(self, client: TelegramClientManager, resolve: Callable[[str], Awaitable[str]],
+                 should_fetch: Optional[Callable[[str], Awaitable[bool]]] = None,
+                 lookahead: int = None, first_page: bool = None):
+        self.client = client
+        self.resolve = resolve
+        # لینک‌هایی که بدون درخواست تلگرام رد می‌شوند (مثلاً هنوز زمان اسکنشان نرسیده) پیش‌بارگذاری نمی‌شوند
+        self.should_fetch = should_fetch
+        self.lookahead = PREFETCH_SETTINGS.lookahead if lookahead is None else lookahead
+        self.first_page = PREFETCH_SETTINGS.first_page if first_page is None else first_page
+        # لینک -> task آماده‌سازی؛ حداکثر lookahead + 1 ورودی
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.prefetched = 0
+        self.used = 0
+        self.discarded = 0
+
+    async def _prepare(self, link: str) -> PrefetchedChat:
+        """حل لینک و دریافت اطلاعات چت و صفحه اول تاریخچه گروه"""
+        try:
+            resolved_link = await self.resolve(link)
+        except Exception as e:
+            logger.warning(f"⚠️ Prefetch could not resolve {link}: {e}")
+            return PrefetchedChat(resolved_link=link)
+
+        prefetched = PrefetchedChat(resolved_link=resolved_link)
+        try:
+            if self.should_fetch and not await self.should_fetch(resolved_link):
+                return prefetched
+
+            prefetched.chat = await self.client.get_chat_info(resolved_link)
+            prefetched.chat_fetched = True
+            self.prefetched += 1
+
+            chat = prefetched.chat
+            if chat and self.first_page and get_chat_type(chat) in GROUP_CHAT_TYPES:
+                prefetched.first_page = await self.client.get_history_page(
+                    chat.id, min(MESSAGE_SETTINGS.limit, HISTORY_PAGE_SIZE)
+                )
+        except Exception as e:
+            logger.warning(f"⚠️ Prefetch failed for {resolved_link}: {e}")
+        return prefetched
+
+    async def iter_links(self, links: AsyncIterator[str]) -> AsyncIterator[str]:
+        """پیمایش لینک‌ها به همان ترتیب، در حالی که lookahead لینک بعدی در پس‌زمینه آماده می‌شوند"""
+        window: Deque[str] = deque()
+        iterator = links.__aiter__()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(window) <= self.lookahead:
+                    try:
+                        link = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    window.append(link)
+                    if link not in self._tasks:
+                        self._tasks[link] = asyncio.create_task(self._prepare(link))
+
+                if not window:
+                    return
+
+                link = window.popleft()
+                yield link
+                # نتیجه‌ای که برداشته نشد (مثلاً لینک تکراری) نگه داشته نمی‌شود
+                if link not in window:
+                    self._discard(link)
+        finally:
+            self.close()
+
+    async def take(self, link: str) -> Optional[PrefetchedChat]:
+        """نتیجه آماده‌سازی لینک (در صورت نیاز منتظر اتمام آن می‌ماند)"""
+        task = self._tasks.pop(link, None)
+        if task is None:
+            return None
+        prefetched = await task
+        if prefetched.chat_fetched:
+            self.used += 1
+        return prefetched
+
+    def _discard(self, link: str):
+        task = self._tasks.pop(link, None)
+        if task is not None:
+            self.discarded += 1
+            task.cancel()
+
+    def close(self):
+        """لغو آماده‌سازی‌های باقی‌مانده"""
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """آمار پیش‌بارگذاری در این اجرا"""
+        return {
+            'prefetched': self.prefetched,
+            'used': self.used,
+            'discarded': self.discarded
+        }
@@ -1,12 +1,12 @@
 import asyncio
 import json
-import re
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 from pathlib import Path
 from pyrogram.types import Message, User, ChatMember
 from config.settings import ANALYSIS_SETTINGS
 from utils.logger import logger
+from services.link_extractor import extract_links, extract_message_links
 
 class ComprehensiveAnalyzer:
     """تحلیلگر جامع برای استخراج تمام اطلاعات گروه‌ها"""
@@ -25,33 +25,8 @@ class ComprehensiveAnalyzer:
         self.all_links = set()  # برای ذخیره تمام لینک‌های یافت شده
     
     def extract_links_from_text(self, text: str) -> List[str]:
-        """استخراج لینک‌ها از متن"""
-        if not text:
-            return []
-            
-        # الگوهای مختلف لینک
-        patterns = [
-            r'https?://[^\s<>"\']+',
-            r'www\.[^\s<>"\']+',
-            r't\.me/[^\s<>"\']+',
-            r'@[a-zA-Z0-9_]+',
-            r'telegram\.me/[^\s<>"\']+',
-        ]
-        
-        links = []
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            links.extend(matches)
-        
-        # پاکسازی لینک‌ها
-        cleaned_links = []
-        for link in links:
-            # حذف کاراکترهای اضافی از انتها
-            link = re.sub(r'[.,;:!?)\\]}]+$', '', link)
-            if link:
-                cleaned_links.append(link)
-        
-        return cleaned_links
+        """استخراج لینک‌های نرمال شده از متن"""
+        return [link.url for link in extract_links(text)]
     
     def categorize_link(self, link: str) -> Dict[str, Any]:
         """دسته‌بندی لینک"""
@@ -174,16 +149,14 @@ class ComprehensiveAnalyzer:
             try:
                 message_data = self._extract_message_data(message)
                 
-                # استخراج لینک‌ها از متن پیام
-                message_text = message_data.get('text', '') or message_data.get('caption', '')
-                if message_text:
-                    links = self.extract_links_from_text(message_text)
-                    if links:
-                        message_data['links'] = []
-                        for link in links:
-                            link_info = self.categorize_link(link)
-                            message_data['links'].append(link_info)
-                            self.all_links.add(link)  # اضافه کردن به مجموعه کلی
+                # استخراج لینک‌ها از متن یا caption پیام و entityهای آن (شامل text_link)
+                links = extract_message_links(message)
+                if links:
+                    message_data['links'] = []
+                    for link in links:
+                        link_info = self.categorize_link(link.url)
+                        message_data['links'].append(link_info)
+                        self.all_links.add(link.url)  # اضافه کردن به مجموعه کلی
                 
                 self.extracted_data['messages'].append(message_data)
                 
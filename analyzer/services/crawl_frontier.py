@@ -0,0 +1,122 @@
+import math
+from typing import Dict, Iterable, Mapping, Optional
+
+from config.settings import FRONTIER_SETTINGS
+from models.data_models import ExtractedLink, FrontierCandidate, LinkKind
+from utils.bloom_filter import BloomFilter
+from utils.logger import logger
+from .storage_backend import StorageBackend
+
+# وزن هر نوع لینک در امتیاز اولویت (لینک دعوت تقریباً همیشه گروه است، منشن اغلب کاربر)
+KIND_WEIGHTS = {
+    LinkKind.TELEGRAM_INVITE: 1.5,
+    LinkKind.TELEGRAM_PUBLIC: 1.0,
+    LinkKind.MENTION: 0.25,
+}
+# لینکی که در text_link پنهان شده عمداً گذاشته شده است
+SOURCE_WEIGHTS = {
+    "entity": 1.2,
+    "text": 1.0,
+}
+
+class CrawlFrontier:
+    """صف کشف: لینک‌های تلگرام پیدا شده در پیام‌ها به عنوان گروه کاندید با اولویت ذخیره می‌شوند"""
+
+    def __init__(self, capacity: int = None, error_rate: float = None, include_mentions: bool = None,
+                 bloom_path: str = None):
+        # seen-set چت‌های حل شده؛ این کلیدها هرگز دوباره به عنوان کاندید درج نمی‌شوند
+        capacity = capacity or FRONTIER_SETTINGS.bloom_capacity
+        error_rate = error_rate or FRONTIER_SETTINGS.bloom_error_rate
+        bloom_path = FRONTIER_SETTINGS.bloom_path if bloom_path is None else bloom_path
+        if bloom_path:
+            # ماندگار روی mmap: بین اجراها باقی می‌ماند و لازم نیست از دیتابیس دوباره ساخته شود
+            self.known = BloomFilter.open(bloom_path, capacity, error_rate)
+        else:
+            self.known = BloomFilter(capacity, error_rate)
+        self.include_mentions = FRONTIER_SETTINGS.include_mentions if include_mentions is None else include_mentions
+        self.pending: Dict[str, FrontierCandidate] = {}
+        self.known_skipped = 0
+        self.inserted = 0
+        self.updated = 0
+
+    async def load(self, storage: StorageBackend) -> int:
+        """ساخت seen-set از کلید چت‌های حل شده در دیتابیس (اگر فایل ماندگار خالی نباشد از همان استفاده می‌شود)"""
+        if self.known.path and len(self.known):
+            logger.info(f"🧭 Frontier seen-set restored from {self.known.path}: {len(self.known)} known chats")
+            return len(self.known)
+
+        loaded = 0
+        async for key in storage.iter_resolved_link_keys():
+            self.known.add(key)
+            loaded += 1
+        logger.info(f"🧭 Frontier seen-set loaded: {loaded} known chats ({self.known.size_bytes / 1024:.0f} KB)")
+        return loaded
+
+    def mark_known(self, keys: Iterable[Optional[str]]):
+        """افزودن کلیدهای یک چت حل شده به seen-set و حذف آنها از کاندیدهای در انتظار"""
+        for key in keys:
+            if key:
+                self.known.add(key)
+                self.pending.pop(key, None)
+
+    def _accepts(self, link: ExtractedLink) -> bool:
+        """فقط لینک‌هایی که بدون عضویت قبلی قابل باز کردن هستند"""
+        if link.kind == LinkKind.MENTION:
+            return self.include_mentions
+        return link.kind in (LinkKind.TELEGRAM_PUBLIC, LinkKind.TELEGRAM_INVITE)
+
+    def observe(self, sightings: Mapping[ExtractedLink, int]) -> int:
+        """ثبت لینک‌های دیده شده در یک چت (لینک -> تعداد پیام‌ها)؛ خروجی تعداد کاندیدهای تازه این فراخوانی"""
+        new_candidates = 0
+        for link, count in sightings.items():
+            key = link.key
+            if not key or not self._accepts(link):
+                continue
+            if key in self.known:
+                self.known_skipped += 1
+                continue
+
+            candidate = self.pending.get(key)
+            if candidate is None:
+                candidate = FrontierCandidate(
+                    link_key=key,
+                    link=link.url,
+                    username=link.identifier if key.startswith('@') else None,
+                    is_public=link.kind != LinkKind.TELEGRAM_INVITE
+                )
+                self.pending[key] = candidate
+                new_candidates += 1
+
+            # تکرار در یک چت با رشد لگاریتمی، هر چت جدید یک امتیاز کامل
+            weight = KIND_WEIGHTS.get(link.kind, 1.0) * SOURCE_WEIGHTS.get(link.source, 1.0)
+            candidate.score += weight * (1 + math.log2(max(count, 1)))
+            candidate.sightings += count
+
+        return new_candidates
+
+    async def flush(self, storage: StorageBackend) -> Dict[str, int]:
+        """نوشتن دسته‌ای کاندیدهای در انتظار در groups"""
+        if not self.pending:
+            return {"inserted": 0, "updated": 0}
+
+        candidates = list(self.pending.values())
+        self.pending = {}
+        counts = await storage.upsert_frontier_candidates(candidates)
+        self.inserted += counts["inserted"]
+        self.updated += counts["updated"]
+        logger.info(f"🧭 Frontier: {counts['inserted']} new candidates, {counts['updated']} re-prioritized")
+        return counts
+
+    def close(self):
+        """ذخیره و بستن seen-set ماندگار"""
+        self.known.close()
+
+    def get_stats(self) -> Dict[str, int]:
+        """آمار صف کشف در این اجرا"""
+        return {
+            'known_chats': len(self.known),
+            'known_skipped': self.known_skipped,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'pending': len(self.pending)
+        }
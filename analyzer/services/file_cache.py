@@ -0,0 +1,176 @@
+import copy
+import os
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config.settings import CACHE_SETTINGS
+from utils.logger import logger
+from .user_json_merger import MERGE_DIR_PREFIX
+
+class LocalFileCache:
+    """کش محلی فایل‌ها بر اساس file_unique_id با حذف LRU و محدودیت حجم"""
+
+    def __init__(self, cache_dir: str, max_bytes: int, parsed_items: int = 0):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.parsed_items = parsed_items
+
+        # key -> اندازه فایل (ترتیب = قدیمی‌ترین استفاده در ابتدا)
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        # نسخه پارس شده فایل‌های پرکاربرد (اختیاری)
+        self._parsed: "OrderedDict[str, Any]" = OrderedDict()
+        # key -> تعداد استفاده‌کنندگانی که هنوز مسیر فایل را در دست دارند؛ این فایل‌ها حذف نمی‌شوند
+        self._pins: Dict[str, int] = {}
+
+        self._load_entries()
+
+    @classmethod
+    def from_settings(cls) -> 'LocalFileCache':
+        """ساخت کش از تنظیمات"""
+        return cls(
+            cache_dir=CACHE_SETTINGS.cache_dir,
+            max_bytes=CACHE_SETTINGS.max_size_mb * 1024 * 1024,
+            parsed_items=CACHE_SETTINGS.parsed_items
+        )
+
+    def _load_entries(self):
+        """بارگذاری فایل‌های موجود کش به ترتیب آخرین دسترسی"""
+        try:
+            files = []
+            for entry in os.scandir(self.cache_dir):
+                if not entry.is_file():
+                    # پوشه‌های کاری ادغام که اجرای قبلی (مثلاً پس از kill) پاک نکرده است
+                    if entry.is_dir() and entry.name.startswith(MERGE_DIR_PREFIX):
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                # فایل‌های نیمه‌کاره از اجرای قبلی حذف می‌شوند
+                if entry.name.endswith('.part'):
+                    os.remove(entry.path)
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+
+            for _, name, size in sorted(files):
+                self._entries[name] = size
+                self._total_bytes += size
+
+            logger.debug(f"📦 File cache loaded: {len(self._entries)} files ({self._total_bytes // 1024} KB)")
+            self._evict()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load file cache {self.cache_dir}: {e}")
+
+    def path_for(self, key: str) -> Path:
+        """مسیر فایل کش برای یک کلید"""
+        return self.cache_dir / key
+
+    def temp_path_for(self, key: str) -> Path:
+        """مسیر موقت برای دانلود قبل از ورود به کش"""
+        return self.cache_dir / f"{key}.part"
+
+    def get_path(self, key: str, pin: bool = False) -> Optional[str]:
+        """دریافت مسیر فایل کش شده و به‌روزرسانی ترتیب LRU (pin: تا unpin حذف نشود)"""
+        if key not in self._entries:
+            return None
+
+        path = self.path_for(key)
+        if not path.exists():
+            self._forget(key)
+            return None
+
+        if pin:
+            self.pin(key)
+        self._entries.move_to_end(key)
+        try:
+            # mtime ترتیب LRU را بین اجراها حفظ می‌کند
+            os.utime(path)
+        except OSError:
+            pass
+        return str(path)
+
+    def put_file(self, key: str, source_path: str, pin: bool = False) -> Optional[str]:
+        """انتقال فایل دانلود شده به کش (pin: تا unpin حذف نشود)"""
+        try:
+            path = self.path_for(key)
+            os.replace(source_path, path)
+
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            size = path.stat().st_size
+            self._entries[key] = size
+            self._total_bytes += size
+
+            if pin:
+                self.pin(key)
+            self._evict(keep=key)
+            return str(path)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not store {key} in file cache: {e}")
+            return None
+
+    def pin(self, key: str):
+        """جلوگیری از حذف فایل تا زمانی که استفاده‌کننده آن را آزاد کند"""
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str):
+        """آزاد کردن فایل pin شده؛ حذف‌های عقب‌افتاده همین‌جا انجام می‌شوند"""
+        count = self._pins.get(key, 0) - 1
+        if count > 0:
+            self._pins[key] = count
+            return
+        self._pins.pop(key, None)
+        self._evict()
+
+    def get_parsed(self, key: str) -> Optional[Any]:
+        """دریافت نسخه پارس شده (یک کپی مستقل برمی‌گردد)"""
+        if key not in self._parsed:
+            return None
+        self._parsed.move_to_end(key)
+        return copy.deepcopy(self._parsed[key])
+
+    def put_parsed(self, key: str, data: Any):
+        """نگهداری نسخه پارس شده در حافظه"""
+        if self.parsed_items <= 0:
+            return
+        self._parsed[key] = copy.deepcopy(data)
+        self._parsed.move_to_end(key)
+        while len(self._parsed) > self.parsed_items:
+            self._parsed.popitem(last=False)
+
+    def _forget(self, key: str):
+        """حذف کلید از ایندکس کش"""
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)
+        self._parsed.pop(key, None)
+
+    def _evict(self, keep: Optional[str] = None):
+        """حذف قدیمی‌ترین فایل‌ها تا رسیدن به محدودیت حجم (فایل‌های pin شده و keep حذف نمی‌شوند)"""
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        for key in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            # فایلی که همین الان اضافه شده یا هنوز در دست استفاده است
+            if key == keep or key in self._pins:
+                continue
+
+            self._forget(key)
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+            logger.debug(f"🧹 Evicted {key} from file cache")
+
+    def get_stats(self) -> dict:
+        """آمار کش"""
+        return {
+            'files': len(self._entries),
+            'total_bytes': self._total_bytes,
+            'max_bytes': self.max_bytes,
+            'parsed_items': len(self._parsed),
+            'pinned': len(self._pins)
+        }
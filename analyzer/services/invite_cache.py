@@ -0,0 +1,118 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config.settings import INVITE_CACHE_SETTINGS
+from utils.logger import logger
+from .storage_backend import StorageBackend
+
+# وضعیت‌هایی که با گذشت زمان تغییر نمی‌کنند (لینک منقضی یا نامعتبر معتبر نمی‌شود)
+INVITE_DEAD_STATUSES = ("expired", "invalid")
+# وضعیت‌های لینک دعوت قابل استفاده
+INVITE_VALID_STATUSES = ("accessible", "private")
+# حداکثر مدت نگهداری نتیجه خوانده شده از دیتابیس در حافظه
+MEMORY_COPY_SECONDS = 300
+
+class InviteCache:
+    """کش نتیجه CheckChatInvite با TTL؛ درخواست‌های همزمان برای یک hash در یک فراخوانی ادغام می‌شوند"""
+
+    def __init__(self, storage: Optional[StorageBackend] = None):
+        self.storage = storage
+        # hash -> (زمان انقضا با monotonic، نتیجه)
+        self._memory: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.probes = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def ttl_seconds(info: Dict[str, Any]) -> int:
+        """مدت اعتبار یک نتیجه بر اساس وضعیت آن"""
+        status = info.get('status')
+        if status in INVITE_VALID_STATUSES:
+            return INVITE_CACHE_SETTINGS.valid_ttl_hours * 3600
+        if status in INVITE_DEAD_STATUSES:
+            return INVITE_CACHE_SETTINGS.invalid_ttl_hours * 3600
+        return INVITE_CACHE_SETTINGS.error_ttl_minutes * 60
+
+    async def _get_storage(self) -> Optional[StorageBackend]:
+        """backend ذخیره‌سازی (در صورت نبود اتصال فقط کش حافظه استفاده می‌شود)"""
+        if self.storage is None:
+            try:
+                from .storage import get_storage_service
+                self.storage = await get_storage_service()
+            except Exception as e:
+                logger.debug(f"⚠️ Invite cache without storage: {e}")
+        return self.storage
+
+    async def get(self, invite_hash: str) -> Optional[Dict[str, Any]]:
+        """نتیجه کش شده از حافظه یا دیتابیس"""
+        cached = self._memory.get(invite_hash)
+        if cached is not None:
+            expires, info = cached
+            if expires > time.monotonic():
+                return info
+            del self._memory[invite_hash]
+
+        storage = await self._get_storage()
+        if storage is None:
+            return None
+        info = await storage.get_invite(invite_hash)
+        if info is not None:
+            # زمان انقضای رکورد دیتابیس برنمی‌گردد؛ کپی حافظه کوتاه‌مدت است
+            self._memory[invite_hash] = (time.monotonic() + min(self.ttl_seconds(info), MEMORY_COPY_SECONDS), info)
+        return info
+
+    async def put(self, invite_hash: str, info: Dict[str, Any]):
+        """ذخیره نتیجه در حافظه و دیتابیس (TTL صفر یعنی بدون کش)"""
+        ttl = self.ttl_seconds(info)
+        if ttl <= 0:
+            return
+        self._memory[invite_hash] = (time.monotonic() + ttl, info)
+
+        storage = await self._get_storage()
+        if storage is not None:
+            await storage.save_invite(invite_hash, info, ttl)
+
+    async def get_or_probe(self, invite_hash: str, probe: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """نتیجه کش شده یا اجرای probe؛ فراخوانی‌های همزمان برای یک hash منتظر همان probe می‌مانند"""
+        info = await self.get(invite_hash)
+        if info is not None:
+            self.hits += 1
+            return info
+
+        pending = self._inflight.get(invite_hash)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[invite_hash] = future
+        try:
+            self.probes += 1
+            info = await probe()
+            await self.put(invite_hash, info)
+            future.set_result(info)
+            return info
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # اگر کسی منتظر نبود، خطای future بازیابی نشده لاگ نشود
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(invite_hash, None)
+
+    def get_stats(self) -> Dict[str, int]:
+        """آمار کش لینک‌های دعوت"""
+        return {
+            'cache_hits': self.hits,
+            'probes': self.probes,
+            'coalesced': self.coalesced,
+            'cached': len(self._memory)
+        }
+
+# کش مشترک پروسه (لینک‌های دعوت بین گروه‌ها زیاد تکرار می‌شوند)
+invite_cache = InviteCache()
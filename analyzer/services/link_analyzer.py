@@ -1,10 +1,11 @@
-import re
 from typing import Dict, List, Optional
-from urllib.parse import urlparse, parse_qs, unquote
 
 from models.data_models import LinkInfo
 from utils.logger import logger
 from .url_resolver import URLResolver
+from .redirect_rules import decode_redirect
+from .link_extractor import extract_links
+from .storage import get_storage_service
 
 class LinkAnalyzer:
     """کلاس تحلیل لینک‌ها"""
@@ -15,7 +16,8 @@ class LinkAnalyzer:
     
     async def initialize_resolver(self):
         """شروع کردن URL resolver"""
-        self.url_resolver = URLResolver(timeout=10, max_redirects=5)
+        storage = await get_storage_service()
+        self.url_resolver = URLResolver(timeout=10, max_redirects=5, storage=storage)
         await self.url_resolver.__aenter__()
     
     async def cleanup_resolver(self):
@@ -58,21 +60,11 @@ class LinkAnalyzer:
         return resolved_links
     
     def extract_telegram_link_from_redirect(self, redirect_url: str) -> Optional[str]:
-        """استخراج لینک تلگرام اصلی از لینک‌های ریدایرکت (legacy method)"""
+        """استخراج لینک تلگرام اصلی از لینک‌های ریدایرکت با قوانین آفلاین (legacy method)"""
         try:
-            # Google Translate links
-            if 'translate.google.com' in redirect_url:
-                parsed = urlparse(redirect_url)
-                params = parse_qs(parsed.query)
-                
-                if 'u' in params:
-                    original_url = unquote(params['u'][0])
-                    if 't.me' in original_url:
-                        return original_url
-            
-            # سایر انواع ریدایرکت‌ها
-            # می‌توانید اینجا انواع دیگر ریدایرکت را اضافه کنید
-            
+            original_url = decode_redirect(redirect_url)
+            if original_url and 't.me' in original_url:
+                return original_url
             return None
         except Exception as e:
             logger.error(f"Error extracting from redirect {redirect_url}: {e}")
@@ -138,29 +130,5 @@ class LinkAnalyzer:
         return link_info
     
     def extract_links_from_text(self, text: str) -> List[str]:
-        """استخراج لینک‌ها از متن"""
-        if not text:
-            return []
-            
-        # الگوهای مختلف لینک
-        patterns = [
-            r'https?://[^\s<>"\']+',
-            r'www\.[^\s<>"\']+',
-            r't\.me/[^\s<>"\']+',
-            r'@[a-zA-Z0-9_]+',
-        ]
-        
-        links = []
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            links.extend(matches)
-        
-        # پاکسازی لینک‌ها
-        cleaned_links = []
-        for link in links:
-            # حذف کاراکترهای اضافی از انتها
-            link = re.sub(r'[.,;:!?)\\]}]+$', '', link)
-            if link:
-                cleaned_links.append(link)
-        
-        return cleaned_links
+        """استخراج لینک‌های نرمال شده از متن"""
+        return [link.url for link in extract_links(text)]
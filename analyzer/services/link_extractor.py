@@ -0,0 +1,143 @@
+import re
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional
+from urllib.parse import urlparse, urlunparse
+
+from models.data_models import ExtractedLink, LinkKind
+from .redirect_rules import TELEGRAM_HOSTS
+
+# الگوی ترکیبی: یک پیمایش متن برای URLها، لینک‌های بدون scheme تلگرام و منشن‌ها
+# lookahead ابتدایی موقعیت‌هایی که با h/w/t/@ شروع نمی‌شوند را سریع رد می‌کند
+LINK_PATTERN = re.compile(r"""
+    (?=[hwt@])
+    (?:
+        (?P<url>(?:https?://|www\.)[^\s<>"']+)
+      | (?P<telegram>(?<![\w./])(?:t|telegram)\.me/[^\s<>"']+)
+      | (?P<mention>(?<![\w@])@[a-zA-Z][a-zA-Z0-9_]{4,31}(?![a-zA-Z0-9_]))
+    )
+""", re.IGNORECASE | re.VERBOSE)
+
+# تعداد لینک‌های خام که نتیجه نرمال‌سازی آنها نگه داشته می‌شود (لینک‌ها در پیام‌ها زیاد تکرار می‌شوند)
+CLASSIFY_CACHE_SIZE = 65536
+
+# کاراکترهایی که معمولاً جزء جمله هستند نه لینک
+TRAILING_PUNCTUATION = '.,;:!?)]}'
+
+USERNAME_PATTERN = re.compile(r'[a-zA-Z][a-zA-Z0-9_]{3,31}')
+# مسیرهای سرویسی t.me که username نیستند
+RESERVED_TELEGRAM_PATHS = {
+    'share', 'addstickers', 'addemoji', 'addlist', 'addtheme', 'iv', 'proxy', 'socks',
+    'setlanguage', 'login', 'bg', 'confirmphone', 'invoice', 'boost', 'giftcode'
+}
+
+def _telegram_link(parsed, raw: str, source: str) -> Optional[ExtractedLink]:
+    """دسته‌بندی و نرمال‌سازی لینک t.me"""
+    parts = [part for part in parsed.path.split('/') if part]
+    if not parts:
+        return None
+
+    head = parts[0]
+    if head.lower() == 'joinchat' and len(parts) > 1:
+        # joinchat/HASH و +HASH یک لینک دعوت هستند
+        return ExtractedLink(f"https://t.me/+{parts[1]}", raw, LinkKind.TELEGRAM_INVITE, parts[1], source)
+    if head.startswith('+') and len(head) > 1:
+        return ExtractedLink(f"https://t.me/{head}", raw, LinkKind.TELEGRAM_INVITE, head[1:], source)
+    if head.lower() == 'c' and len(parts) > 1 and parts[1].isdigit():
+        return ExtractedLink(f"https://t.me/c/{parts[1]}", raw, LinkKind.TELEGRAM_PRIVATE, parts[1], source)
+    if head.lower() == 's' and len(parts) > 1:
+        head = parts[1]  # پیش‌نمایش وب کانال
+
+    if head.lower() in RESERVED_TELEGRAM_PATHS or not USERNAME_PATTERN.fullmatch(head):
+        return None
+
+    # username به بزرگی و کوچکی حروف حساس نیست؛ لینک پیام به خود چت نرمال می‌شود
+    username = head.lower()
+    return ExtractedLink(f"https://t.me/{username}", raw, LinkKind.TELEGRAM_PUBLIC, username, source)
+
+@lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def classify_link(raw: str, source: str = "text") -> Optional[ExtractedLink]:
+    """نرمال‌سازی و تعیین نوع یک لینک خام"""
+    link = raw.rstrip(TRAILING_PUNCTUATION)
+    if not link:
+        return None
+
+    if link.startswith('@'):
+        username = link[1:].lower()
+        return ExtractedLink(f"https://t.me/{username}", raw, LinkKind.MENTION, username, source)
+
+    if not link.lower().startswith(('http://', 'https://')):
+        link = 'https://' + link
+
+    try:
+        parsed = urlparse(link)
+    except ValueError:
+        return None
+
+    host = (parsed.hostname or '').lower()
+    if not host:
+        return None
+    if host in TELEGRAM_HOSTS:
+        telegram_link = _telegram_link(parsed, raw, source)
+        if telegram_link:
+            return telegram_link
+
+    canonical = urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path or '/',
+                            parsed.params, parsed.query, ''))
+    return ExtractedLink(canonical, raw, LinkKind.WEB, host, source)
+
+def _utf16_slice(text: str, offset: int, length: int) -> str:
+    """برش متن با offset و length تلگرام (بر حسب واحدهای UTF-16)"""
+    encoded = str(text).encode('utf-16-le')
+    return encoded[offset * 2:(offset + length) * 2].decode('utf-16-le', errors='ignore')
+
+def _entity_links(text: str, entities: Iterable[Any]) -> List[str]:
+    """لینک‌های entityهای url و text_link (text_link در متن پیام دیده نمی‌شود)"""
+    links = []
+    for entity in entities:
+        entity_type = str(getattr(entity, 'type', '')).lower()
+        if entity_type.endswith('text_link'):
+            url = getattr(entity, 'url', None)
+            if url:
+                links.append(url)
+        elif entity_type.endswith('url') and text:
+            offset, length = getattr(entity, 'offset', None), getattr(entity, 'length', None)
+            if offset is not None and length:
+                links.append(_utf16_slice(text, offset, length))
+    return links
+
+def extract_links(text: Optional[str], entities: Optional[Iterable[Any]] = None) -> List[ExtractedLink]:
+    """استخراج لینک‌های نرمال شده و بدون تکرار از متن در یک پیمایش، به همراه entityهای پیام"""
+    results: List[ExtractedLink] = []
+    seen = set()
+
+    def add(raw: str, source: str):
+        link = classify_link(raw, source)
+        if link and link.url not in seen:
+            seen.add(link.url)
+            results.append(link)
+
+    if text:
+        for match in LINK_PATTERN.finditer(text):
+            add(match.group(0), "text")
+
+    if entities:
+        for raw in _entity_links(text, entities):
+            add(raw, "entity")
+
+    return results
+
+def extract_message_links(message: Any) -> List[ExtractedLink]:
+    """استخراج لینک‌های یک پیام Pyrogram از متن یا caption و entityهای آن"""
+    text = getattr(message, 'text', None)
+    entities = getattr(message, 'entities', None)
+    if not text:
+        text = getattr(message, 'caption', None)
+        entities = getattr(message, 'caption_entities', None)
+    return extract_links(text, entities)
+
+def canonical_link_key(link: Optional[str]) -> Optional[str]:
+    """کلید یکتای چت برای هر شکل لینک (t.me/x، t.me/x/123، telegram.me/X، @x، ?start=...)"""
+    if not link:
+        return None
+    extracted = classify_link(link.strip())
+    return extracted.key if extracted else None
@@ -1,13 +1,15 @@
 import asyncio
 from datetime import datetime
+from collections import Counter
 from typing import Dict, List, Set
 
 from pyrogram import Client
 from pyrogram.types import Message
 from pyrogram.errors import FloodWait
 
-from models.data_models import GroupInfo
+from models.data_models import GroupInfo, ExtractedLink
 from services.link_analyzer import LinkAnalyzer
+from services.link_extractor import extract_message_links
 from config.settings import FILTER_SETTINGS
 from utils.logger import logger
 
@@ -19,6 +21,8 @@ class MessageAnalyzer:
         self.link_analyzer = link_analyzer
         self.processed_users: Dict[int, Dict] = {}
         self.extracted_links: Set[str] = set()
+        # لینک‌های تلگرام -> تعداد پیام‌هایی که در آنها دیده شده‌اند (برای اولویت صف کشف)
+        self.link_sightings: Counter[ExtractedLink] = Counter()
     
     def _should_skip_message(self, message: Message) -> bool:
         """بررسی اینکه آیا پیام باید رد شود یا نه"""
@@ -128,10 +132,11 @@ class MessageAnalyzer:
         
         user_data['messages'].append(message_data)
         
-        # استخراج لینک‌ها از متن پیام
-        if message.text:
-            links = self.link_analyzer.extract_links_from_text(message.text)
-            self.extracted_links.update(links)
+        # استخراج لینک‌ها از متن یا caption پیام و entityهای آن (شامل text_link)
+        for link in extract_message_links(message):
+            self.extracted_links.add(link.url)
+            if link.key:
+                self.link_sightings[link] += 1
     
     def get_stats(self) -> Dict:
         """دریافت آمار پردازش شده"""
@@ -1,16 +1,40 @@
 import asyncio
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, AsyncIterator
+from datetime import datetime, timedelta
 import pymongo
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
-from config.settings import MONGO_CONFIG
-from models.data_models import GroupInfo, ChatType, ScanStatus
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError, ConnectionFailure, ServerSelectionTimeoutError
+from config.settings import MONGO_CONFIG, EXPIRY_SETTINGS
+from models.data_models import GroupInfo, GroupRef, ExtractedLink, FrontierCandidate, ChatType, ScanStatus
 from utils.logger import logger
+from .storage_backend import StorageBackend
 
-class MongoService:
+# کد خطای duplicate key در MongoDB
+DUPLICATE_KEY_ERROR = 11000
+# حداکثر عملیات در هر bulk_write کاربران
+USER_UPSERT_CHUNK_SIZE = 1000
+# حداکثر عملیات در هر bulk_write پیام‌ها
+MESSAGE_UPSERT_CHUNK_SIZE = 1000
+# فیلدهای پروفایل کاربر که در users ذخیره می‌شوند
+USER_PROFILE_FIELDS = (
+    "first_name", "last_name", "current_name", "current_username", "phone_number",
+    "is_bot", "is_verified", "is_restricted", "is_scam", "is_fake", "is_deleted",
+    "is_premium", "language_code", "dc_id"
+)
+# فیلدهای گروه که در آمار تجمیعی شمرده می‌شوند
+GROUP_STATS_FIELDS = {"_id": 0, "last_scan_status": 1, "chat_type": 1, "is_public": 1}
+
+class MongoService(StorageBackend):
     """سرویس MongoDB برای ذخیره اطلاعات گروه‌ها و کاربران"""
     
+    name = "MongoDB"
+    
+    # ایندکس‌ها فقط یک بار در هر پروسه ساخته می‌شوند
+    _indexes_ensured = False
+    
     def __init__(self, connection_string: str = None, database_name: str = None, collection_name: str = None):
         """مقداردهی اولیه سرویس MongoDB"""
         self.connection_string = connection_string or MONGO_CONFIG.connection_string
@@ -20,28 +44,72 @@ class MongoService:
         self.db = None
         self.collection = None
         self.users_collection = None  # کالکشن جدید برای کاربران
+        self.user_files_collection = None  # ایندکس فایل‌های JSON کاربران
+        self.index_state_collection = None  # وضعیت همگام‌سازی ایندکس‌ها
+        self.stats_collection = None  # آمار materialized (اختیاری)
+        self.messages_collection = None  # پیام‌های کاربران
+        self.redirect_cache_collection = None  # کش نتیجه حل لینک‌های ریدایرکت
+        self.scan_journal_collection = None  # سابقه اسکن‌ها
+        self.link_registry_collection = None  # رجیستری لینک‌ها با کلید canonical
+        self.invite_cache_collection = None  # کش نتیجه بررسی لینک‌های دعوت
+        # pymongo همگام است؛ همه فراخوانی‌ها در این executor اجرا می‌شوند تا event loop مسدود نشود
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    async def _run(self, fn, *args, **kwargs):
+        """اجرای یک فراخوانی همگام pymongo در executor اختصاصی"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=MONGO_CONFIG.executor_workers,
+                thread_name_prefix="mongo"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+    
+    async def _find_all(self, collection, query: Dict[str, Any], projection: Dict[str, Any] = None,
+                        sort: List = None, limit: int = 0) -> List[Dict[str, Any]]:
+        """اجرای find و خواندن کامل cursor در executor"""
+        def fetch():
+            cursor = collection.find(query, projection)
+            if sort:
+                cursor = cursor.sort(sort)
+            if limit:
+                cursor = cursor.limit(limit)
+            return list(cursor)
+        
+        return await self._run(fetch)
         
     async def connect(self) -> bool:
         """اتصال به MongoDB"""
         try:
-            # ایجاد اتصال
-            self.client = MongoClient(
+            # ایجاد اتصال (MongoClient خودش pool اتصال را مدیریت می‌کند)
+            self.client = await self._run(
+                MongoClient,
                 self.connection_string,
+                maxPoolSize=MONGO_CONFIG.max_pool_size,
                 serverSelectionTimeoutMS=5000,
                 connectTimeoutMS=5000,
                 socketTimeoutMS=5000
             )
             
             # تست اتصال
-            self.client.admin.command('ping')
+            await self._run(self.client.admin.command, 'ping')
             
             # انتخاب دیتابیس و کالکشن
             self.db = self.client[self.database_name]
             self.collection = self.db[self.collection_name]
             self.users_collection = self.db['users']  # کالکشن جدید برای کاربران
-            
-            # ایجاد ایندکس‌ها برای بهینه‌سازی
-            await self._create_indexes()
+            self.user_files_collection = self.db['user_files']
+            self.index_state_collection = self.db['index_state']
+            self.stats_collection = self.db['stats']
+            self.messages_collection = self.db['messages']
+            self.redirect_cache_collection = self.db['redirect_cache']
+            self.scan_journal_collection = self.db['scan_journal']
+            self.link_registry_collection = self.db['link_registry']
+            self.invite_cache_collection = self.db['invite_cache']
+            
+            # ایجاد ایندکس‌ها برای بهینه‌سازی (یک بار در هر پروسه؛ پس از خطا در اتصال بعدی دوباره تلاش می‌شود)
+            if not MongoService._indexes_ensured:
+                MongoService._indexes_ensured = await self._create_indexes()
             
             logger.info(f"✅ Connected to MongoDB: {self.database_name}.{self.collection_name}")
             logger.info(f"✅ Users collection ready: {self.database_name}.users")
@@ -54,59 +122,236 @@ class MongoService:
             logger.error(f"❌ MongoDB connection error: {e}")
             return False
     
-    async def _create_indexes(self):
-        """ایجاد ایندکس‌های بهینه"""
+    async def _create_indexes(self) -> bool:
+        """ایجاد ایندکس‌های بهینه؛ خروجی True فقط وقتی همه ایندکس‌ها ساخته شده باشند"""
+        created = True
         try:
             # ایندکس برای جستجوی سریع بر اساس chat_id
-            self.collection.create_index("chat_id", unique=True)
+            await self._ensure_chat_id_index()
             
             # ایندکس برای جستجو بر اساس username
-            self.collection.create_index("username", sparse=True)
+            await self._run(self.collection.create_index, "username", sparse=True)
+            
+            # ایندکس کلید canonical لینک (همه شکل‌های یک لینک یک کلید دارند)
+            await self._run(self.collection.create_index, "link_key", sparse=True)
+            await self._run(
+                self.collection.update_many,
+                {"link_key": {"$exists": False}, "username": {"$type": "string"}},
+                [{"$set": {"link_key": {"$concat": ["@", {"$toLower": "$username"}]}}}]
+            )
             
             # ایندکس برای جستجو بر اساس last_scan_time
-            self.collection.create_index("last_scan_time")
+            await self._run(self.collection.create_index, "last_scan_time")
             
             # ایندکس برای جستجو بر اساس last_scan_status
-            self.collection.create_index("last_scan_status")
+            await self._run(self.collection.create_index, "last_scan_status")
+            
+            # ایندکس صف اسکن: گروه‌های آماده به ترتیب فوریت
+            await self._run(
+                self.collection.create_index,
+                [("next_scan_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]
+            )
             
             # ایندکس‌های جدید برای کالکشن کاربران
             if self.users_collection is not None:
-                self.users_collection.create_index("user_id", unique=True)
-                self.users_collection.create_index("first_seen")
-                self.users_collection.create_index("last_seen")
+                await self._run(self.users_collection.create_index, "user_id", unique=True)
+                await self._run(self.users_collection.create_index, "first_seen")
+                await self._run(self.users_collection.create_index, "current_username", sparse=True)
+                await self._run(self.users_collection.create_index, "usernames")
+                await self._run(
+                    self.users_collection.create_index,
+                    [("group_ids", pymongo.ASCENDING), ("last_seen", pymongo.DESCENDING)]
+                )
+            
+            # ایندکس‌های پیام‌ها: کلید یکتا و کوئری‌های کاربر/گروه/زمان
+            if self.messages_collection is not None:
+                await self._run(
+                    self.messages_collection.create_index,
+                    [("group_id", pymongo.ASCENDING), ("message_id", pymongo.ASCENDING)],
+                    unique=True
+                )
+                await self._run(
+                    self.messages_collection.create_index,
+                    [("user_id", pymongo.ASCENDING), ("date", pymongo.ASCENDING)]
+                )
+                await self._run(
+                    self.messages_collection.create_index,
+                    [("group_id", pymongo.ASCENDING), ("date", pymongo.ASCENDING)]
+                )
+            
+            # ایندکس فایل‌های JSON کاربران در چت ذخیره‌سازی
+            if self.user_files_collection is not None:
+                await self._run(
+                    self.user_files_collection.create_index,
+                    [("chat_id", pymongo.ASCENDING), ("message_id", pymongo.ASCENDING)],
+                    unique=True
+                )
+                await self._run(
+                    self.user_files_collection.create_index,
+                    [("user_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)]
+                )
+            
+            if self.scan_journal_collection is not None:
+                await self._run(
+                    self.scan_journal_collection.create_index,
+                    [("chat_id", pymongo.ASCENDING), ("scanned_at", pymongo.DESCENDING)]
+                )
+            
+            # رجیستری لینک‌ها: _id همان کلید canonical است
+            if self.link_registry_collection is not None:
+                await self._run(self.link_registry_collection.create_index, "chat_id", sparse=True)
+            
+            # کش لینک‌های دعوت: MongoDB اسناد را در زمان expires_at حذف می‌کند
+            if self.invite_cache_collection is not None:
+                await self._run(self.invite_cache_collection.create_index, "expires_at", expireAfterSeconds=0)
+            
+            # صف کشف: فقط کاندیدهای دارای اولویت در ایندکس قرار می‌گیرند
+            await self._run(
+                self.collection.create_index,
+                [("priority", pymongo.DESCENDING), ("_id", pymongo.ASCENDING)],
+                partialFilterExpression={"priority": {"$gt": 0}}
+            )
             
             logger.info("✅ MongoDB indexes created successfully")
             
         except Exception as e:
             logger.warning(f"⚠️ Could not create indexes: {e}")
+            created = False
+        
+        return await self._ensure_expiry_indexes() and created
+    
+    async def _ensure_chat_id_index(self):
+        """ایندکس یکتای chat_id فقط روی گروه‌های حل شده؛ گروه‌هایی که فقط لینک دارند chat_id ندارند"""
+        indexes = await self._run(lambda: list(self.collection.list_indexes()))
+        existing = next((index for index in indexes if list(index["key"].items()) == [("chat_id", 1)]), None)
+        if existing is not None and "partialFilterExpression" not in existing:
+            await self._run(self.collection.drop_index, existing["name"])
+            # رکوردهای موقت قدیمی با chat_id=0 ساخته می‌شدند
+            await self._run(self.collection.update_many, {"chat_id": 0}, {"$set": {"chat_id": None}})
+        
+        await self._run(
+            self.collection.create_index,
+            "chat_id",
+            unique=True,
+            partialFilterExpression={"chat_id": {"$type": "number"}}
+        )
+    
+    def _expiry_policies(self) -> List[tuple]:
+        """سیاست انقضای هر کالکشن: (کالکشن، فیلد زمان، روز)"""
+        return [
+            (self.collection, "updated_at", EXPIRY_SETTINGS.groups_days),
+            (self.users_collection, "last_seen", EXPIRY_SETTINGS.users_days),
+            (self.redirect_cache_collection, "resolved_at", EXPIRY_SETTINGS.redirect_cache_days),
+            (self.scan_journal_collection, "scanned_at", EXPIRY_SETTINGS.scan_journal_days)
+        ]
+    
+    async def _ensure_expiry_indexes(self) -> bool:
+        """همگام‌سازی TTL indexها با تنظیمات؛ حذف اسناد قدیمی در پس‌زمینه توسط MongoDB انجام می‌شود"""
+        applied = True
+        for collection, field, days in self._expiry_policies():
+            if collection is None:
+                continue
+            try:
+                await self._ensure_expiry_index(collection, field, days * 86400)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not apply expiry policy on {collection.name}.{field}: {e}")
+                applied = False
+        return applied
+    
+    async def _ensure_expiry_index(self, collection, field: str, expire_seconds: int):
+        """ایجاد یا تغییر ایندکس یک فیلد زمان به TTL (یا ایندکس معمولی وقتی انقضا غیرفعال است)"""
+        indexes = await self._run(lambda: list(collection.list_indexes()))
+        existing = next((index for index in indexes if list(index["key"].items()) == [(field, 1)]), None)
+        current = existing.get("expireAfterSeconds") if existing else None
+        
+        if expire_seconds > 0:
+            if existing is None:
+                await self._run(collection.create_index, field, expireAfterSeconds=expire_seconds)
+            elif current != expire_seconds:
+                # collMod مدت انقضا را عوض می‌کند و ایندکس معمولی را بدون بازسازی به TTL تبدیل می‌کند
+                await self._run(
+                    self.db.command,
+                    "collMod", collection.name,
+                    index={"keyPattern": {field: 1}, "expireAfterSeconds": expire_seconds}
+                )
+            else:
+                return
+            logger.info(f"⏳ Expiry policy: {collection.name}.{field} after {expire_seconds // 86400} days")
+        else:
+            if existing is not None and current is not None:
+                # TTL غیرفعال شده؛ ایندکس معمولی برای کوئری‌ها باقی می‌ماند
+                await self._run(collection.drop_index, existing["name"])
+                existing = None
+                logger.info(f"⏳ Expiry policy disabled: {collection.name}.{field}")
+            if existing is None:
+                await self._run(collection.create_index, field)
+    
+    @property
+    def is_connected(self) -> bool:
+        """آیا اتصال برقرار است"""
+        return self.client is not None and self.collection is not None
     
     async def disconnect(self):
         """قطع اتصال از MongoDB"""
         if self.client:
-            self.client.close()
+            await self._run(self.client.close)
+            self.client = None
+            self.collection = None
             logger.info("✅ Disconnected from MongoDB")
+        
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
     
     async def save_group_info(self, group_info: GroupInfo) -> bool:
-        """ذخیره یا به‌روزرسانی اطلاعات گروه"""
+        """ذخیره یا به‌روزرسانی اطلاعات گروه (بر اساس chat_id، یا link_key برای لینک‌های حل نشده)"""
         try:
             if self.collection is None:
                 logger.error("❌ MongoDB not connected")
                 return False
             
-            # تبدیل به دیکشنری
-            data = group_info.to_dict()
+            if group_info.chat_id is not None:
+                query = {"chat_id": group_info.chat_id}
+            elif group_info.link_key:
+                query = {"link_key": group_info.link_key, "chat_id": None}
+            else:
+                logger.error(f"❌ Group without chat_id or link_key: {group_info.link}")
+                return False
             
-            # استفاده از upsert برای به‌روزرسانی یا درج
-            result = self.collection.update_one(
-                {"chat_id": group_info.chat_id},
-                {"$set": data},
-                upsert=True
+            # تبدیل به دیکشنری؛ aliases جایگزین نمی‌شود و فقط اضافه می‌شود
+            data = group_info.to_dict()
+            aliases = data.pop("aliases", None)
+            update = {"$set": data}
+            if aliases:
+                update["$addToSet"] = {"aliases": {"$each": aliases}}
+            
+            # upsert با دریافت نسخه قبلی برای به‌روزرسانی تدریجی آمار
+            previous = await self._run(
+                self.collection.find_one_and_update,
+                query,
+                update,
+                projection=GROUP_STATS_FIELDS,
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
             )
             
-            if result.upserted_id:
-                logger.info(f"✅ New group saved: {group_info.chat_id}")
+            label = group_info.chat_id if group_info.chat_id is not None else group_info.link_key
+            if previous is None:
+                logger.info(f"✅ New group saved: {label}")
             else:
-                logger.info(f"✅ Group updated: {group_info.chat_id}")
+                logger.info(f"✅ Group updated: {label}")
+            
+            await self._apply_group_stats_delta(previous, data)
+            
+            if group_info.chat_id is not None and group_info.link_key:
+                # رکورد موقت همین لینک (پیش از حل شدن chat_id) در رکورد اصلی ادغام می‌شود
+                placeholder = await self._run(
+                    self.collection.find_one_and_delete,
+                    {"link_key": group_info.link_key, "chat_id": None},
+                    projection=GROUP_STATS_FIELDS
+                )
+                if placeholder is not None:
+                    await self._apply_group_stats_delta(placeholder, None)
             
             return True
             
@@ -120,7 +365,7 @@ class MongoService:
             if self.collection is None:
                 return None
             
-            data = self.collection.find_one({"chat_id": chat_id})
+            data = await self._run(self.collection.find_one, {"chat_id": chat_id})
             if data:
                 return GroupInfo.from_dict(data)
             return None
@@ -130,12 +375,16 @@ class MongoService:
             return None
     
     async def get_group_by_username(self, username: str) -> Optional[GroupInfo]:
-        """دریافت اطلاعات گروه بر اساس username"""
+        """دریافت اطلاعات گروه بر اساس username (بدون حساسیت به بزرگی حروف از طریق link_key)"""
         try:
             if self.collection is None:
                 return None
             
-            data = self.collection.find_one({"username": username})
+            username = username.lstrip('@')
+            data = await self._run(
+                self.collection.find_one,
+                {"$or": [{"link_key": f"@{username.lower()}"}, {"username": username}]}
+            )
             if data:
                 return GroupInfo.from_dict(data)
             return None
@@ -144,15 +393,60 @@ class MongoService:
             logger.error(f"❌ Failed to get group by username: {e}")
             return None
     
+    async def get_group_by_link_key(self, link_key: str) -> Optional[GroupInfo]:
+        """دریافت اطلاعات گروه بر اساس کلید canonical لینک (رکورد حل شده مقدم است)"""
+        try:
+            if self.collection is None:
+                return None
+            
+            docs = await self._find_all(
+                self.collection, {"link_key": link_key},
+                sort=[("chat_id", pymongo.DESCENDING)], limit=1
+            )
+            if docs:
+                return GroupInfo.from_dict(docs[0])
+            return None
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to get group by link key: {e}")
+            return None
+    
+    async def add_group_aliases(self, chat_id: int, aliases: List[str]) -> bool:
+        """ثبت کلید لینک‌های دیگر یک چت در رکورد گروه و حذف رکوردهای موقت آنها"""
+        try:
+            if self.collection is None or not aliases:
+                return False
+            
+            await self._run(
+                self.collection.update_one,
+                {"chat_id": chat_id},
+                {"$addToSet": {"aliases": {"$each": list(aliases)}}}
+            )
+            
+            # کاندیدهای حل نشده همین لینک‌ها دیگر لازم نیستند
+            for alias in aliases:
+                placeholder = await self._run(
+                    self.collection.find_one_and_delete,
+                    {"link_key": alias, "chat_id": None},
+                    projection=GROUP_STATS_FIELDS
+                )
+                if placeholder is not None:
+                    await self._apply_group_stats_delta(placeholder, None)
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to add aliases to group {chat_id}: {e}")
+            return False
+    
     async def get_groups_by_status(self, status: ScanStatus) -> List[GroupInfo]:
         """دریافت گروه‌ها بر اساس وضعیت اسکن"""
         try:
             if self.collection is None:
                 return []
             
-            cursor = self.collection.find({"last_scan_status": status.value})
+            docs = await self._find_all(self.collection, {"last_scan_status": status.value})
             groups = []
-            for data in cursor:
+            for data in docs:
                 groups.append(GroupInfo.from_dict(data))
             
             return groups
@@ -170,12 +464,14 @@ class MongoService:
             from datetime import timedelta
             cutoff_time = datetime.utcnow() - timedelta(hours=hours)
             
-            cursor = self.collection.find({
-                "last_scan_time": {"$gte": cutoff_time}
-            }).sort("last_scan_time", -1)
+            docs = await self._find_all(
+                self.collection,
+                {"last_scan_time": {"$gte": cutoff_time}},
+                sort=[("last_scan_time", pymongo.DESCENDING)]
+            )
             
             groups = []
-            for data in cursor:
+            for data in docs:
                 groups.append(GroupInfo.from_dict(data))
             
             return groups
@@ -184,58 +480,158 @@ class MongoService:
             logger.error(f"❌ Failed to get recent scans: {e}")
             return []
     
-    async def get_failed_scans(self) -> List[GroupInfo]:
-        """دریافت گروه‌هایی که اسکن آنها ناموفق بوده"""
-        return await self.get_groups_by_status(ScanStatus.FAILED)
-    
-    async def get_successful_scans(self) -> List[GroupInfo]:
-        """دریافت گروه‌هایی که اسکن آنها موفق بوده"""
-        return await self.get_groups_by_status(ScanStatus.SUCCESS)
-    
-    async def get_stats(self) -> Dict[str, Any]:
+    async def get_stats(self, use_cache: bool = True) -> Dict[str, Any]:
         """دریافت آمار کلی"""
         try:
             if self.collection is None:
                 return {}
             
-            total_groups = self.collection.count_documents({})
-            successful_scans = self.collection.count_documents({"last_scan_status": ScanStatus.SUCCESS.value})
-            failed_scans = self.collection.count_documents({"last_scan_status": ScanStatus.FAILED.value})
-            
-            # آمار بر اساس نوع چت
-            channel_count = self.collection.count_documents({"chat_type": ChatType.CHANNEL.value})
-            group_count = self.collection.count_documents({"chat_type": ChatType.GROUP.value})
-            supergroup_count = self.collection.count_documents({"chat_type": ChatType.SUPERGROUP.value})
-            
-            # آمار بر اساس public/private
-            public_count = self.collection.count_documents({"is_public": True})
-            private_count = self.collection.count_documents({"is_public": False})
+            if use_cache and MONGO_CONFIG.materialized_stats:
+                counters = await self._run(self.stats_collection.find_one, {"_id": "groups"})
+                if counters is None or self._stats_due_for_recount(counters):
+                    counters = await self.rebuild_group_stats()
+            else:
+                counters = await self._compute_group_counters()
             
-            return {
-                "total_groups": total_groups,
-                "successful_scans": successful_scans,
-                "failed_scans": failed_scans,
-                "success_rate": (successful_scans / total_groups * 100) if total_groups > 0 else 0,
-                "channels": channel_count,
-                "groups": group_count,
-                "supergroups": supergroup_count,
-                "public": public_count,
-                "private": private_count
-            }
+            return self._format_group_stats(counters)
             
         except Exception as e:
             logger.error(f"❌ Failed to get stats: {e}")
             return {}
     
+    async def _compute_group_counters(self) -> Dict[str, Any]:
+        """شمارش همه آمار گروه‌ها با یک aggregation ($facet)"""
+        pipeline = [
+            {"$project": GROUP_STATS_FIELDS},
+            {"$facet": {
+                "total": [{"$count": "count"}],
+                "status": [{"$group": {"_id": "$last_scan_status", "count": {"$sum": 1}}}],
+                "chat_type": [{"$group": {"_id": "$chat_type", "count": {"$sum": 1}}}],
+                "visibility": [{"$group": {"_id": "$is_public", "count": {"$sum": 1}}}]
+            }}
+        ]
+        result = await self._run(lambda: list(self.collection.aggregate(pipeline)))
+        facets = result[0] if result else {}
+        
+        visibility_names = {True: "public", False: "private"}
+        return {
+            "total": facets["total"][0]["count"] if facets.get("total") else 0,
+            "status": {row["_id"]: row["count"] for row in facets.get("status", []) if row["_id"]},
+            "chat_type": {row["_id"]: row["count"] for row in facets.get("chat_type", []) if row["_id"]},
+            "visibility": {
+                visibility_names[row["_id"]]: row["count"]
+                for row in facets.get("visibility", []) if row["_id"] in visibility_names
+            }
+        }
+    
+    @staticmethod
+    def _format_group_stats(counters: Dict[str, Any]) -> Dict[str, Any]:
+        """تبدیل شمارنده‌ها به خروجی get_stats"""
+        status = counters.get("status", {})
+        chat_types = counters.get("chat_type", {})
+        visibility = counters.get("visibility", {})
+        
+        total_groups = counters.get("total", 0)
+        successful_scans = status.get(ScanStatus.SUCCESS.value, 0)
+        
+        return {
+            "total_groups": total_groups,
+            "successful_scans": successful_scans,
+            "failed_scans": status.get(ScanStatus.FAILED.value, 0),
+            "success_rate": (successful_scans / total_groups * 100) if total_groups > 0 else 0,
+            "channels": chat_types.get(ChatType.CHANNEL.value, 0),
+            "groups": chat_types.get(ChatType.GROUP.value, 0),
+            "supergroups": chat_types.get(ChatType.SUPERGROUP.value, 0),
+            "public": visibility.get("public", 0),
+            "private": visibility.get("private", 0)
+        }
+    
+    async def rebuild_group_stats(self) -> Dict[str, Any]:
+        """محاسبه دوباره آمار گروه‌ها و ذخیره در سند materialized"""
+        counters = await self._compute_group_counters()
+        counters["updated_at"] = counters["recounted_at"] = datetime.utcnow()
+        await self._run(
+            self.stats_collection.replace_one,
+            {"_id": "groups"},
+            counters,
+            upsert=True
+        )
+        logger.info(f"✅ Group stats rebuilt: {counters['total']} groups")
+        return counters
+    
+    @staticmethod
+    def _group_stats_keys(doc: Optional[Dict[str, Any]]) -> List[str]:
+        """کلیدهای شمارنده‌ای که یک سند گروه در آنها شمرده می‌شود"""
+        if doc is None:
+            return []
+        
+        keys = ["total"]
+        if doc.get("last_scan_status"):
+            keys.append(f"status.{doc['last_scan_status']}")
+        if doc.get("chat_type"):
+            keys.append(f"chat_type.{doc['chat_type']}")
+        if doc.get("is_public") is True:
+            keys.append("visibility.public")
+        elif doc.get("is_public") is False:
+            keys.append("visibility.private")
+        return keys
+    
+    async def _apply_group_stats_delta(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """به‌روزرسانی تدریجی سند آمار گروه‌ها پس از درج، تغییر یا حذف"""
+        if not MONGO_CONFIG.materialized_stats or self.stats_collection is None:
+            return
+        
+        delta: Dict[str, int] = {}
+        for key in self._group_stats_keys(before):
+            delta[key] = delta.get(key, 0) - 1
+        for key in self._group_stats_keys(after):
+            delta[key] = delta.get(key, 0) + 1
+        delta = {key: value for key, value in delta.items() if value}
+        if not delta:
+            return
+        
+        try:
+            # بدون upsert: تا وقتی سند پایه ساخته نشده، اولین خواندن آن را از نو می‌سازد
+            await self._run(
+                self.stats_collection.update_one,
+                {"_id": "groups"},
+                {"$inc": delta, "$set": {"updated_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Could not update group stats: {e}")
+    
+    @staticmethod
+    def _stats_due_for_recount(doc: Dict[str, Any]) -> bool:
+        """آیا زمان شمارش دوباره سند materialized رسیده است (حذف‌های TTL فقط با شمارش دوباره کم می‌شوند)"""
+        hours = MONGO_CONFIG.stats_recount_hours
+        if hours <= 0:
+            return False
+        recounted_at = doc.get("recounted_at")
+        return recounted_at is None or datetime.utcnow() - recounted_at > timedelta(hours=hours)
+    
+    async def _invalidate_stats(self, name: str):
+        """حذف سند آمار تا در خواندن بعدی از نو ساخته شود"""
+        if not MONGO_CONFIG.materialized_stats or self.stats_collection is None:
+            return
+        try:
+            await self._run(self.stats_collection.delete_one, {"_id": name})
+        except Exception as e:
+            logger.warning(f"⚠️ Could not invalidate {name} stats: {e}")
+    
     async def delete_group(self, chat_id: int) -> bool:
         """حذف گروه از دیتابیس"""
         try:
             if self.collection is None:
                 return False
             
-            result = self.collection.delete_one({"chat_id": chat_id})
-            if result.deleted_count > 0:
+            deleted = await self._run(
+                self.collection.find_one_and_delete,
+                {"chat_id": chat_id},
+                projection=GROUP_STATS_FIELDS
+            )
+            if deleted is not None:
                 logger.info(f"✅ Group deleted: {chat_id}")
+                await self._apply_group_stats_delta(deleted, None)
                 return True
             return False
             
@@ -244,21 +640,27 @@ class MongoService:
             return False
     
     async def cleanup_old_records(self, days: int = 30) -> int:
-        """پاک کردن رکوردهای قدیمی"""
+        """پاک کردن رکوردهای قدیمی (وقتی TTL index گروه‌ها فعال است کاری انجام نمی‌شود)"""
         try:
             if self.collection is None:
                 return 0
             
-            from datetime import timedelta
+            if EXPIRY_SETTINGS.groups_days > 0:
+                logger.debug("⏳ Groups expire through the TTL index, skipping cleanup")
+                return 0
+            
+            # از ایندکس updated_at که توسط سیاست انقضا ساخته می‌شود استفاده می‌کند
             cutoff_time = datetime.utcnow() - timedelta(days=days)
             
-            result = self.collection.delete_many({
+            result = await self._run(self.collection.delete_many, {
                 "updated_at": {"$lt": cutoff_time}
             })
             
             deleted_count = result.deleted_count
             if deleted_count > 0:
                 logger.info(f"✅ Cleaned up {deleted_count} old records")
+                # حذف گروهی دلتای قابل محاسبه ندارد
+                await self._invalidate_stats("groups")
             
             return deleted_count
             
@@ -266,6 +668,267 @@ class MongoService:
             logger.error(f"❌ Failed to cleanup old records: {e}")
             return 0
 
+    async def record_scan(self, chat_id: Optional[int], link: str, status: ScanStatus,
+                          message_count: int = 0, last_message_id: Optional[int] = None,
+                          duration_seconds: float = 0.0) -> bool:
+        """ثبت یک اسکن در scan_journal (با TTL روی scanned_at)"""
+        try:
+            if self.scan_journal_collection is None:
+                return False
+            
+            await self._run(self.scan_journal_collection.insert_one, {
+                "chat_id": chat_id,
+                "link": link,
+                "status": status.value,
+                "message_count": message_count,
+                "last_message_id": last_message_id,
+                "duration_seconds": round(duration_seconds, 2),
+                "scanned_at": datetime.utcnow()
+            })
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to record scan for {link}: {e}")
+            return False
+    
+    async def register_links(self, links: List[ExtractedLink], seen_at: datetime = None) -> Dict[str, int]:
+        """ثبت دسته‌ای لینک‌ها در link_registry؛ شکل‌های مختلف یک لینک در یک رکورد جمع می‌شوند"""
+        counts = {"inserted": 0, "updated": 0}
+        try:
+            if self.link_registry_collection is None:
+                return counts
+            
+            seen_at = seen_at or datetime.utcnow()
+            # یک عملیات برای هر کلید، حتی اگر لینک چند بار تکرار شده باشد
+            by_key: Dict[str, ExtractedLink] = {}
+            for link in links:
+                if link.key and link.key not in by_key:
+                    by_key[link.key] = link
+            if not by_key:
+                return counts
+            
+            operations = [
+                pymongo.UpdateOne(
+                    {"_id": key},
+                    {
+                        "$setOnInsert": {"url": link.url, "kind": link.kind.value, "first_seen": seen_at},
+                        "$set": {"last_seen": seen_at},
+                        "$inc": {"seen_count": 1}
+                    },
+                    upsert=True
+                )
+                for key, link in by_key.items()
+            ]
+            return await self._bulk_upsert(self.link_registry_collection, operations)
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to register links: {e}")
+            return counts
+    
+    async def get_registered_link(self, link_key: str) -> Optional[Dict[str, Any]]:
+        """دریافت رکورد رجیستری یک کلید"""
+        try:
+            if self.link_registry_collection is None:
+                return None
+            
+            data = await self._run(self.link_registry_collection.find_one, {"_id": link_key})
+            if data:
+                data["key"] = data.pop("_id")
+            return data
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to get registered link {link_key}: {e}")
+            return None
+    
+    async def set_link_chat_id(self, link_key: str, chat_id: int) -> bool:
+        """اتصال کلید لینک به chat_id پس از حل شدن"""
+        try:
+            if self.link_registry_collection is None:
+                return False
+            
+            now = datetime.utcnow()
+            await self._run(
+                self.link_registry_collection.update_one,
+                {"_id": link_key},
+                {
+                    "$set": {"chat_id": chat_id, "resolved_at": now},
+                    "$setOnInsert": {"first_seen": now, "last_seen": now, "seen_count": 0}
+                },
+                upsert=True
+            )
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to link {link_key} to chat {chat_id}: {e}")
+            return False
+    
+    async def iter_resolved_link_keys(self, batch_size: int = 5000) -> AsyncIterator[str]:
+        """پیمایش کلید لینک همه چت‌هایی که به chat_id حل شده‌اند (رجیستری و گروه‌ها)"""
+        sources = [
+            (self.link_registry_collection, {"chat_id": {"$ne": None}}, "_id"),
+            (self.collection, {"chat_id": {"$type": "number"}, "link_key": {"$ne": None}}, "link_key")
+        ]
+        try:
+            for collection, query, field in sources:
+                if collection is None:
+                    continue
+                
+                last_id = None
+                while True:
+                    page_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+                    batch = await self._find_all(
+                        collection, page_query, {"_id": 1, field: 1},
+                        sort=[("_id", pymongo.ASCENDING)], limit=batch_size
+                    )
+                    if not batch:
+                        break
+                    
+                    last_id = batch[-1]["_id"]
+                    for data in batch:
+                        yield data[field]
+                    
+                    if len(batch) < batch_size:
+                        break
+        except Exception as e:
+            logger.error(f"❌ Failed to iterate resolved link keys: {e}")
+    
+    async def upsert_frontier_candidates(self, candidates: List[FrontierCandidate]) -> Dict[str, int]:
+        """درج دسته‌ای کاندیدهای کشف شده به عنوان گروه حل نشده یا افزایش اولویت کاندید موجود"""
+        counts = {"inserted": 0, "updated": 0}
+        try:
+            if self.collection is None or not candidates:
+                return counts
+            
+            now = datetime.utcnow()
+            operations = []
+            for candidate in candidates:
+                document = GroupInfo(
+                    chat_id=None,
+                    username=candidate.username,
+                    link=candidate.link,
+                    link_key=candidate.link_key,
+                    is_public=candidate.is_public,
+                    created_at=now
+                ).to_dict()
+                # این فیلدها در $inc و $set به‌روزرسانی می‌شوند
+                for key in ("priority", "discovery_count", "updated_at"):
+                    document.pop(key)
+                
+                operations.append(pymongo.UpdateOne(
+                    {"link_key": candidate.link_key, "chat_id": None},
+                    {
+                        "$setOnInsert": document,
+                        "$inc": {"priority": candidate.score, "discovery_count": candidate.sightings},
+                        "$set": {"updated_at": now}
+                    },
+                    upsert=True
+                ))
+            
+            counts = await self._bulk_upsert(self.collection, operations)
+            if counts["inserted"]:
+                await self._invalidate_stats("groups")
+            return counts
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to upsert frontier candidates: {e}")
+            return counts
+    
+    async def get_frontier_candidates(self, limit: int = 0, due_at: datetime = None) -> List[GroupRef]:
+        """کاندیدهای حل نشده آماده اسکن به ترتیب اولویت"""
+        try:
+            if self.collection is None:
+                return []
+            
+            query: Dict[str, Any] = {"chat_id": None, "priority": {"$gt": 0}}
+            if due_at is not None:
+                query["$or"] = [{"next_scan_at": None}, {"next_scan_at": {"$lte": due_at}}]
+            
+            docs = await self._find_all(
+                self.collection, query, GroupRef.PROJECTION,
+                sort=[("priority", pymongo.DESCENDING), ("_id", pymongo.ASCENDING)], limit=limit
+            )
+            return [GroupRef.from_dict(data) for data in docs]
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to get frontier candidates: {e}")
+            return []
+    
+    async def get_redirect(self, url: str) -> Optional[Dict[str, Any]]:
+        """دریافت نتیجه کش شده حل یک لینک از redirect_cache (اگر منقضی نشده باشد)"""
+        try:
+            if self.redirect_cache_collection is None:
+                return None
+            
+            return await self._run(
+                self.redirect_cache_collection.find_one,
+                {"_id": url, "expires_at": {"$gt": datetime.utcnow()}},
+                {"_id": 0, "outcome": 1, "target": 1, "resolved_at": 1, "expires_at": 1}
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to read redirect cache for {url}: {e}")
+            return None
+    
+    async def save_redirect(self, url: str, outcome: str, target: Optional[str], ttl_seconds: int) -> bool:
+        """ذخیره نتیجه حل یک لینک؛ expires_at مدت اعتبار هر نتیجه و TTL روی resolved_at سقف نگهداری است"""
+        try:
+            if self.redirect_cache_collection is None:
+                return False
+            
+            now = datetime.utcnow()
+            await self._run(
+                self.redirect_cache_collection.replace_one,
+                {"_id": url},
+                {
+                    "outcome": outcome,
+                    "target": target,
+                    "resolved_at": now,
+                    "expires_at": now + timedelta(seconds=ttl_seconds)
+                },
+                upsert=True
+            )
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to save redirect cache for {url}: {e}")
+            return False
+    
+    async def get_invite(self, invite_hash: str) -> Optional[Dict[str, Any]]:
+        """دریافت نتیجه کش شده بررسی یک لینک دعوت (اگر منقضی نشده باشد)"""
+        try:
+            if self.invite_cache_collection is None:
+                return None
+            
+            data = await self._run(
+                self.invite_cache_collection.find_one,
+                {"_id": invite_hash, "expires_at": {"$gt": datetime.utcnow()}},
+                {"_id": 0, "info": 1}
+            )
+            return data["info"] if data else None
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to read invite cache for {invite_hash}: {e}")
+            return None
+    
+    async def save_invite(self, invite_hash: str, info: Dict[str, Any], ttl_seconds: int) -> bool:
+        """ذخیره نتیجه بررسی یک لینک دعوت با مدت اعتبار مشخص"""
+        try:
+            if self.invite_cache_collection is None:
+                return False
+            
+            now = datetime.utcnow()
+            await self._run(
+                self.invite_cache_collection.replace_one,
+                {"_id": invite_hash},
+                {"info": info, "checked_at": now, "expires_at": now + timedelta(seconds=ttl_seconds)},
+                upsert=True
+            )
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to save invite cache for {invite_hash}: {e}")
+            return False
+    
     async def get_all_groups(self) -> List[GroupInfo]:
         """دریافت تمام گروه‌ها از دیتابیس"""
         try:
@@ -273,9 +936,9 @@ class MongoService:
                 logger.error("❌ MongoDB not connected")
                 return []
             
-            cursor = self.collection.find({})
+            docs = await self._find_all(self.collection, {})
             groups = []
-            for data in cursor:
+            for data in docs:
                 try:
                     group_info = GroupInfo.from_dict(data)
                     groups.append(group_info)
@@ -290,15 +953,112 @@ class MongoService:
             logger.error(f"❌ Failed to get all groups: {e}")
             return []
     
+    @staticmethod
+    def build_group_filter(due_at: datetime = None, chat_type: ChatType = None,
+                           status: ScanStatus = None, is_public: bool = None) -> Dict[str, Any]:
+        """ساخت فیلتر سمت سرور برای کوئری گروه‌ها"""
+        query: Dict[str, Any] = {}
+        if due_at is not None:
+            # گروه‌هایی که هرگز زمان‌بندی نشده‌اند یا زمان اسکن بعدی‌شان رسیده است
+            query["$or"] = [
+                {"next_scan_at": None},
+                {"next_scan_at": {"$lte": due_at}}
+            ]
+        if chat_type is not None:
+            query["chat_type"] = chat_type.value
+        if status is not None:
+            query["last_scan_status"] = status.value
+        if is_public is not None:
+            query["is_public"] = is_public
+        return query
+    
+    @staticmethod
+    def _keyset_after(field: str, value: Any, last_id: Any) -> Dict[str, Any]:
+        """شرط صفحه بعد در صفحه‌بندی keyset روی (field, _id)"""
+        if value is None:
+            # null در MongoDB قبل از همه مقادیر مرتب می‌شود
+            return {"$or": [
+                {field: None, "_id": {"$gt": last_id}},
+                {field: {"$ne": None}}
+            ]}
+        return {"$or": [
+            {field: {"$gt": value}},
+            {field: value, "_id": {"$gt": last_id}}
+        ]}
+    
+    async def iter_groups(self, due_at: datetime = None, chat_type: ChatType = None,
+                          status: ScanStatus = None, is_public: bool = None,
+                          projection: Dict[str, Any] = None, batch_size: int = 500) -> AsyncIterator[GroupRef]:
+        """پیمایش جریانی گروه‌ها به صورت GroupRef؛ با due_at فقط گروه‌های آماده به ترتیب فوریت برمی‌گردند"""
+        if self.collection is None:
+            logger.error("❌ MongoDB not connected")
+            return
+        
+        query = self.build_group_filter(due_at, chat_type, status, is_public)
+        fields = dict(projection or GroupRef.PROJECTION)
+        fields["_id"] = 1
+        
+        # در حالت due ترتیب بر اساس next_scan_at است (زمان‌بندی نشده‌ها و عقب‌افتاده‌ترین‌ها اول)
+        sort_field = "next_scan_at" if due_at is not None else "_id"
+        sort = [("_id", pymongo.ASCENDING)]
+        if sort_field != "_id":
+            sort.insert(0, (sort_field, pymongo.ASCENDING))
+            fields[sort_field] = 1
+        
+        # صفحه‌بندی keyset: هر دسته یک کوئری کوتاه است و cursor باز بین اسکن‌های طولانی منقضی نمی‌شود
+        last_doc = None
+        try:
+            while True:
+                page_query = query
+                if last_doc is not None:
+                    if sort_field == "_id":
+                        after = {"_id": {"$gt": last_doc["_id"]}}
+                    else:
+                        after = self._keyset_after(sort_field, last_doc.get(sort_field), last_doc["_id"])
+                    page_query = {"$and": [query, after]}
+                
+                batch = await self._find_all(self.collection, page_query, fields, sort=sort, limit=batch_size)
+                if not batch:
+                    break
+                
+                last_doc = batch[-1]
+                for data in batch:
+                    yield GroupRef.from_dict(data)
+                
+                if len(batch) < batch_size:
+                    break
+        except Exception as e:
+            logger.error(f"❌ Failed to iterate groups: {e}")
+    
+    async def backfill_next_scan_at(self, interval_minutes: int) -> int:
+        """محاسبه next_scan_at برای اسناد قدیمی که فقط last_scan_time دارند"""
+        try:
+            if self.collection is None:
+                return 0
+            
+            result = await self._run(
+                self.collection.update_many,
+                {"next_scan_at": {"$exists": False}, "last_scan_time": {"$type": "date"}},
+                [{"$set": {"next_scan_at": {"$add": ["$last_scan_time", interval_minutes * 60 * 1000]}}}]
+            )
+            
+            if result.modified_count > 0:
+                logger.info(f"✅ Scheduled next scan for {result.modified_count} existing groups")
+            return result.modified_count
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to backfill next_scan_at: {e}")
+            return 0
+    
     async def get_groups_by_type(self, chat_type: ChatType) -> List[GroupInfo]:
         """دریافت گروه‌ها بر اساس نوع چت"""
         try:
             if self.collection is None:
                 return []
             
-            cursor = self.collection.find({"chat_type": chat_type.value})
+            docs = await self._find_all(self.collection, {"chat_type": chat_type.value})
             groups = []
-            for data in cursor:
+            for data in docs:
                 try:
                     group_info = GroupInfo.from_dict(data)
                     groups.append(group_info)
@@ -313,6 +1073,42 @@ class MongoService:
             logger.error(f"❌ Failed to get groups by type: {e}")
             return []
 
+    @staticmethod
+    def _user_seen_upsert(user_id: int, seen_at: datetime) -> pymongo.UpdateOne:
+        """عملیات upsert کاربر: first_seen فقط هنگام درج و last_seen فقط رو به جلو"""
+        return pymongo.UpdateOne(
+            {"user_id": user_id},
+            {
+                "$setOnInsert": {"first_seen": seen_at},
+                "$max": {"last_seen": seen_at}
+            },
+            upsert=True
+        )
+    
+    async def _bulk_upsert_users(self, operations: List[pymongo.UpdateOne]) -> Dict[str, int]:
+        """bulk upsert روی کالکشن users"""
+        return await self._bulk_upsert(self.users_collection, operations)
+    
+    async def _bulk_upsert(self, collection, operations: List[pymongo.UpdateOne]) -> Dict[str, int]:
+        """اجرای bulk upsert؛ خطای duplicate key ناشی از upsert همزمان یک بار دوباره اجرا می‌شود"""
+        try:
+            result = await self._run(collection.bulk_write, operations, ordered=False)
+            return {"inserted": result.upserted_count, "updated": result.matched_count}
+        
+        except BulkWriteError as e:
+            details = e.details or {}
+            write_errors = details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in write_errors):
+                raise
+            
+            counts = {"inserted": details.get("nUpserted", 0), "updated": details.get("nMatched", 0)}
+            # سند توسط نویسنده دیگری درج شده؛ اجرای دوباره به update تبدیل می‌شود
+            retry_operations = [operations[error["index"]] for error in write_errors]
+            retry_result = await self._run(collection.bulk_write, retry_operations, ordered=False)
+            counts["inserted"] += retry_result.upserted_count
+            counts["updated"] += retry_result.matched_count
+            return counts
+    
     async def save_user_id(self, user_id: int) -> bool:
         """ذخیره user_id در کالکشن users"""
         try:
@@ -320,27 +1116,13 @@ class MongoService:
                 logger.error("❌ MongoDB users collection not connected")
                 return False
             
-            # بررسی اینکه آیا کاربر قبلاً وجود دارد
-            existing_user = self.users_collection.find_one({"user_id": user_id})
-            
-            if existing_user:
-                # به‌روزرسانی last_seen
-                result = self.users_collection.update_one(
-                    {"user_id": user_id},
-                    {"$set": {"last_seen": datetime.utcnow()}}
-                )
-                if result.modified_count > 0:
-                    logger.debug(f"✅ Updated user {user_id} last_seen")
+            seen_at = datetime.utcnow()
+            counts = await self._bulk_upsert_users([self._user_seen_upsert(user_id, seen_at)])
+            await self._record_new_users(counts["inserted"], seen_at)
+            if counts["inserted"]:
+                logger.debug(f"✅ New user {user_id} saved to database")
             else:
-                # درج کاربر جدید
-                user_data = {
-                    "user_id": user_id,
-                    "first_seen": datetime.utcnow(),
-                    "last_seen": datetime.utcnow()
-                }
-                result = self.users_collection.insert_one(user_data)
-                if result.inserted_id:
-                    logger.debug(f"✅ New user {user_id} saved to database")
+                logger.debug(f"✅ Updated user {user_id} last_seen")
             
             return True
             
@@ -348,56 +1130,158 @@ class MongoService:
             logger.error(f"❌ Failed to save user {user_id}: {e}")
             return False
     
-    async def save_multiple_user_ids(self, user_ids: List[int]) -> int:
-        """ذخیره چندین user_id به صورت بهینه"""
+    async def bulk_upsert_user_ids(self, user_ids: List[int], seen_at: datetime = None) -> Dict[str, int]:
+        """upsert دسته‌ای کاربران در bulk_writeهای چند تایی؛ خروجی شامل تعداد درج و به‌روزرسانی است"""
+        counts = {"inserted": 0, "updated": 0}
         try:
             if self.users_collection is None:
                 logger.error("❌ MongoDB users collection not connected")
-                return 0
+                return counts
+            
+            # حذف تکرار با حفظ ترتیب
+            unique_ids = list(dict.fromkeys(user_ids))
+            if not unique_ids:
+                return counts
+            
+            seen_at = seen_at or datetime.utcnow()
+            for chunk_start in range(0, len(unique_ids), USER_UPSERT_CHUNK_SIZE):
+                chunk = unique_ids[chunk_start:chunk_start + USER_UPSERT_CHUNK_SIZE]
+                chunk_counts = await self._bulk_upsert_users(
+                    [self._user_seen_upsert(user_id, seen_at) for user_id in chunk]
+                )
+                counts["inserted"] += chunk_counts["inserted"]
+                counts["updated"] += chunk_counts["updated"]
             
-            if not user_ids:
-                return 0
+            await self._record_new_users(counts["inserted"], seen_at)
+            return counts
             
-            current_time = datetime.utcnow()
-            saved_count = 0
+        except Exception as e:
+            logger.error(f"❌ Failed to upsert users: {e}")
+            return counts
+    
+    @staticmethod
+    def _user_profile_upsert(profile: Dict[str, Any], seen_at: datetime) -> pymongo.UpdateOne:
+        """عملیات upsert پروفایل کاربر به همراه تاریخچه نام‌ها و گروه‌ها"""
+        fields = {field: profile[field] for field in USER_PROFILE_FIELDS if field in profile}
+        
+        add_to_set = {}
+        usernames = [entry["username"] for entry in profile.get("username_history", []) if entry.get("username")]
+        names = [entry["name"] for entry in profile.get("name_history", []) if entry.get("name")]
+        group_ids = [group["group_id"] for group in profile.get("joined_groups", []) if group.get("group_id")]
+        if usernames:
+            add_to_set["usernames"] = {"$each": usernames}
+        if names:
+            add_to_set["names"] = {"$each": names}
+        if group_ids:
+            add_to_set["group_ids"] = {"$each": group_ids}
+        
+        update: Dict[str, Any] = {
+            "$setOnInsert": {"first_seen": seen_at},
+            "$max": {"last_seen": seen_at},
+            "$set": fields
+        }
+        if add_to_set:
+            update["$addToSet"] = add_to_set
+        
+        return pymongo.UpdateOne({"user_id": profile["user_id"]}, update, upsert=True)
+    
+    async def bulk_upsert_user_profiles(self, profiles: List[Dict[str, Any]], seen_at: datetime = None) -> Dict[str, int]:
+        """upsert دسته‌ای پروفایل کامل کاربران (usernames/names/group_ids به صورت مجموعه)"""
+        counts = {"inserted": 0, "updated": 0}
+        try:
+            if self.users_collection is None:
+                logger.error("❌ MongoDB users collection not connected")
+                return counts
             
-            # استفاده از bulk operations برای بهینه‌سازی
-            bulk_operations = []
+            if not profiles:
+                return counts
             
-            for user_id in user_ids:
-                # بررسی اینکه آیا کاربر قبلاً وجود دارد
-                existing_user = self.users_collection.find_one({"user_id": user_id})
-                
-                if existing_user:
-                    # به‌روزرسانی last_seen
-                    bulk_operations.append(
-                        pymongo.UpdateOne(
-                            {"user_id": user_id},
-                            {"$set": {"last_seen": current_time}},
-                            upsert=False
-                        )
-                    )
-                else:
-                    # درج کاربر جدید
-                    user_data = {
-                        "user_id": user_id,
-                        "first_seen": current_time,
-                        "last_seen": current_time
-                    }
-                    bulk_operations.append(
-                        pymongo.InsertOne(user_data)
+            seen_at = seen_at or datetime.utcnow()
+            for chunk_start in range(0, len(profiles), USER_UPSERT_CHUNK_SIZE):
+                chunk = profiles[chunk_start:chunk_start + USER_UPSERT_CHUNK_SIZE]
+                chunk_counts = await self._bulk_upsert_users(
+                    [self._user_profile_upsert(profile, seen_at) for profile in chunk]
+                )
+                counts["inserted"] += chunk_counts["inserted"]
+                counts["updated"] += chunk_counts["updated"]
+            
+            await self._record_new_users(counts["inserted"], seen_at)
+            logger.info(f"✅ Upserted {len(profiles)} user profiles ({counts['inserted']} new, {counts['updated']} updated)")
+            return counts
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to upsert user profiles: {e}")
+            return counts
+    
+    async def save_messages(self, messages: List[Dict[str, Any]]) -> Dict[str, int]:
+        """upsert دسته‌ای پیام‌ها با کلید (group_id, message_id)"""
+        counts = {"inserted": 0, "updated": 0}
+        try:
+            if self.messages_collection is None:
+                logger.error("❌ MongoDB messages collection not connected")
+                return counts
+            
+            if not messages:
+                return counts
+            
+            for chunk_start in range(0, len(messages), MESSAGE_UPSERT_CHUNK_SIZE):
+                chunk = messages[chunk_start:chunk_start + MESSAGE_UPSERT_CHUNK_SIZE]
+                operations = [
+                    pymongo.UpdateOne(
+                        {"group_id": message["group_id"], "message_id": message["message_id"]},
+                        {"$set": message},
+                        upsert=True
                     )
+                    for message in chunk
+                ]
+                chunk_counts = await self._bulk_upsert(self.messages_collection, operations)
+                counts["inserted"] += chunk_counts["inserted"]
+                counts["updated"] += chunk_counts["updated"]
             
-            if bulk_operations:
-                result = self.users_collection.bulk_write(bulk_operations, ordered=False)
-                saved_count = result.upserted_count + result.modified_count
-                logger.info(f"✅ Saved {saved_count} users to database")
+            logger.info(f"✅ Saved {len(messages)} messages ({counts['inserted']} new, {counts['updated']} updated)")
+            return counts
             
-            return saved_count
+        except Exception as e:
+            logger.error(f"❌ Failed to save messages: {e}")
+            return counts
+    
+    async def get_user_messages(self, user_id: int, group_id: int = None, limit: int = 0) -> List[Dict[str, Any]]:
+        """دریافت پیام‌های یک کاربر به ترتیب زمان (یک کوئری ایندکس‌دار)"""
+        try:
+            if self.messages_collection is None:
+                return []
+            
+            query: Dict[str, Any] = {"user_id": user_id}
+            if group_id is not None:
+                query["group_id"] = group_id
+            
+            return await self._find_all(
+                self.messages_collection, query, {"_id": 0},
+                sort=[("date", pymongo.ASCENDING)], limit=limit
+            )
             
         except Exception as e:
-            logger.error(f"❌ Failed to save multiple users: {e}")
-            return 0
+            logger.error(f"❌ Failed to get messages for user {user_id}: {e}")
+            return []
+    
+    async def get_group_messages(self, group_id: int, since: datetime = None, limit: int = 0) -> List[Dict[str, Any]]:
+        """دریافت پیام‌های یک گروه از یک زمان به بعد"""
+        try:
+            if self.messages_collection is None:
+                return []
+            
+            query: Dict[str, Any] = {"group_id": group_id}
+            if since is not None:
+                query["date"] = {"$gte": since}
+            
+            return await self._find_all(
+                self.messages_collection, query, {"_id": 0},
+                sort=[("date", pymongo.ASCENDING)], limit=limit
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to get messages for group {group_id}: {e}")
+            return []
     
     async def get_user_count(self) -> int:
         """دریافت تعداد کل کاربران"""
@@ -405,7 +1289,7 @@ class MongoService:
             if self.users_collection is None:
                 return 0
             
-            return self.users_collection.count_documents({})
+            return await self._run(self.users_collection.count_documents, {})
             
         except Exception as e:
             logger.error(f"❌ Failed to get user count: {e}")
@@ -420,48 +1304,147 @@ class MongoService:
             from datetime import timedelta
             cutoff_time = datetime.utcnow() - timedelta(hours=hours)
             
-            cursor = self.users_collection.find({
-                "last_seen": {"$gte": cutoff_time}
-            }).sort("last_seen", -1)
+            docs = await self._find_all(
+                self.users_collection,
+                {"last_seen": {"$gte": cutoff_time}},
+                {"user_id": 1},
+                sort=[("last_seen", pymongo.DESCENDING)]
+            )
             
-            user_ids = [doc["user_id"] for doc in cursor]
+            user_ids = [doc["user_id"] for doc in docs]
             return user_ids
             
         except Exception as e:
             logger.error(f"❌ Failed to get recent users: {e}")
             return []
     
-    async def get_user_stats(self) -> Dict[str, Any]:
+    async def get_user_stats(self, use_cache: bool = True) -> Dict[str, Any]:
         """دریافت آمار کاربران"""
         try:
             if self.users_collection is None:
                 return {}
             
-            total_users = self.users_collection.count_documents({})
-            
-            # کاربران امروز
-            from datetime import timedelta
-            today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_users = self.users_collection.count_documents({
-                "first_seen": {"$gte": today}
-            })
-            
-            # کاربران هفته گذشته
-            week_ago = datetime.utcnow() - timedelta(days=7)
-            week_users = self.users_collection.count_documents({
-                "first_seen": {"$gte": week_ago}
-            })
+            now = datetime.utcnow()
+            today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            week_ago = now - timedelta(days=7)
+            
+            if use_cache and MONGO_CONFIG.materialized_stats:
+                stats = await self._get_cached_user_stats(today, week_ago)
+                if stats is not None:
+                    return stats
+            
+            # تعداد کل از metadata کالکشن (بدون اسکن)
+            total_users = await self._run(self.users_collection.estimated_document_count)
+            
+            # یک aggregation روی بازه ایندکس‌دار first_seen
+            pipeline = [
+                {"$match": {"first_seen": {"$gte": week_ago}}},
+                {"$facet": {
+                    "today": [{"$match": {"first_seen": {"$gte": today}}}, {"$count": "count"}],
+                    "week": [{"$match": {"first_seen": {"$gte": week_ago}}}, {"$count": "count"}]
+                }}
+            ]
+            result = await self._run(lambda: list(self.users_collection.aggregate(pipeline)))
+            facets = result[0] if result else {}
             
             return {
                 "total_users": total_users,
-                "today_new_users": today_users,
-                "week_new_users": week_users
+                "today_new_users": facets["today"][0]["count"] if facets.get("today") else 0,
+                "week_new_users": facets["week"][0]["count"] if facets.get("week") else 0
             }
             
         except Exception as e:
             logger.error(f"❌ Failed to get user stats: {e}")
             return {}
     
+    @staticmethod
+    def _user_day_key(day: datetime) -> str:
+        """شناسه سند شمارنده کاربران جدید یک روز"""
+        return f"users_new:{day.strftime('%Y-%m-%d')}"
+    
+    async def _get_cached_user_stats(self, today: datetime, week_ago: datetime) -> Optional[Dict[str, Any]]:
+        """آمار کاربران از اسناد materialized (دقت هفتگی در حد روز)"""
+        totals = await self._run(self.stats_collection.find_one, {"_id": "users"})
+        if totals is None or self._stats_due_for_recount(totals):
+            await self.rebuild_user_stats()
+            totals = await self._run(self.stats_collection.find_one, {"_id": "users"})
+            if totals is None:
+                return None
+        
+        days = await self._find_all(
+            self.stats_collection,
+            {"_id": {"$gte": self._user_day_key(week_ago), "$lte": self._user_day_key(today)}}
+        )
+        today_key = self._user_day_key(today)
+        
+        return {
+            "total_users": totals.get("total", 0),
+            "today_new_users": sum(day.get("count", 0) for day in days if day["_id"] == today_key),
+            "week_new_users": sum(day.get("count", 0) for day in days)
+        }
+    
+    async def rebuild_user_stats(self) -> bool:
+        """محاسبه دوباره آمار کاربران (کل و کاربران جدید هر روز در هفته اخیر)؛ کاربران حذف شده با TTL فقط اینجا کم می‌شوند"""
+        try:
+            if self.users_collection is None or self.stats_collection is None:
+                return False
+            
+            now = datetime.utcnow()
+            total_users = await self._run(self.users_collection.count_documents, {})
+            week_start = (now - timedelta(days=7)).replace(hour=0, minute=0, second=0, microsecond=0)
+            pipeline = [
+                {"$match": {"first_seen": {"$gte": week_start}}},
+                {"$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$first_seen"}},
+                    "count": {"$sum": 1}
+                }}
+            ]
+            days = await self._run(lambda: list(self.users_collection.aggregate(pipeline)))
+            
+            operations = [
+                pymongo.ReplaceOne(
+                    {"_id": "users"},
+                    {"total": total_users, "updated_at": now, "recounted_at": now},
+                    upsert=True
+                )
+            ]
+            for day in days:
+                operations.append(pymongo.ReplaceOne(
+                    {"_id": f"users_new:{day['_id']}"},
+                    {"count": day["count"]},
+                    upsert=True
+                ))
+            await self._run(self.stats_collection.bulk_write, operations, ordered=True)
+            
+            logger.info(f"✅ User stats rebuilt: {total_users} users")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to rebuild user stats: {e}")
+            return False
+    
+    async def _record_new_users(self, count: int, seen_at: datetime):
+        """افزایش شمارنده‌های materialized کاربران پس از درج"""
+        if not count or not MONGO_CONFIG.materialized_stats or self.stats_collection is None:
+            return
+        
+        try:
+            # شمارنده کل فقط وقتی سند پایه وجود دارد؛ در غیر این صورت خواندن بعدی آن را می‌سازد
+            result = await self._run(
+                self.stats_collection.update_one,
+                {"_id": "users"},
+                {"$inc": {"total": count}, "$set": {"updated_at": datetime.utcnow()}}
+            )
+            if result.matched_count:
+                await self._run(
+                    self.stats_collection.update_one,
+                    {"_id": self._user_day_key(seen_at)},
+                    {"$inc": {"count": count}},
+                    upsert=True
+                )
+        except Exception as e:
+            logger.warning(f"⚠️ Could not update user stats: {e}")
+    
     async def save_user_final_json_filename(self, user_id: int, filename: str) -> bool:
         """ذخیره نام فایل JSON نهایی کاربر"""
         try:
@@ -470,17 +1453,22 @@ class MongoService:
                 return False
             
             # به‌روزرسانی یا درج نام فایل نهایی
-            result = self.users_collection.update_one(
+            now = datetime.utcnow()
+            result = await self._run(
+                self.users_collection.update_one,
                 {"user_id": user_id},
                 {
+                    "$setOnInsert": {"first_seen": now},
                     "$set": {
                         "final_json_filename": filename,
-                        "final_json_updated": datetime.utcnow(),
-                        "last_seen": datetime.utcnow()
+                        "final_json_updated": now,
+                        "last_seen": now
                     }
                 },
                 upsert=True
             )
+            if result.upserted_id is not None:
+                await self._record_new_users(1, now)
             
             if result.modified_count > 0 or result.upserted_id:
                 logger.info(f"✅ Saved final JSON filename for user {user_id}: {filename}")
@@ -499,7 +1487,7 @@ class MongoService:
             if self.users_collection is None:
                 return None
             
-            user_data = self.users_collection.find_one({"user_id": user_id})
+            user_data = await self._run(self.users_collection.find_one, {"user_id": user_id})
             if user_data and "final_json_filename" in user_data:
                 return user_data["final_json_filename"]
             
@@ -509,6 +1497,35 @@ class MongoService:
             logger.error(f"❌ Failed to get final JSON filename for user {user_id}: {e}")
             return None
     
+    async def get_user_document(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """دریافت سند کامل کاربر"""
+        try:
+            if self.users_collection is None:
+                return None
+            
+            return await self._run(self.users_collection.find_one, {"user_id": user_id}, {"_id": 0})
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to get user {user_id}: {e}")
+            return None
+    
+    async def get_users_with_final_json(self) -> List[Dict[str, Any]]:
+        """دریافت کاربرانی که فایل JSON نهایی دارند (جدیدترین در ابتدا)"""
+        try:
+            if self.users_collection is None:
+                return []
+            
+            return await self._find_all(
+                self.users_collection,
+                {"final_json_filename": {"$exists": True}},
+                {"_id": 0},
+                sort=[("final_json_updated", pymongo.DESCENDING)]
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to get users with final JSON: {e}")
+            return []
+    
     async def update_user_final_json_info(self, user_id: int, filename: str, message_count: int = 0) -> bool:
         """به‌روزرسانی اطلاعات فایل JSON نهایی کاربر"""
         try:
@@ -516,18 +1533,22 @@ class MongoService:
                 logger.error("❌ MongoDB users collection not connected")
                 return False
             
+            now = datetime.utcnow()
             update_data = {
                 "final_json_filename": filename,
-                "final_json_updated": datetime.utcnow(),
+                "final_json_updated": now,
                 "final_json_message_count": message_count,
-                "last_seen": datetime.utcnow()
+                "last_seen": now
             }
             
-            result = self.users_collection.update_one(
+            result = await self._run(
+                self.users_collection.update_one,
                 {"user_id": user_id},
-                {"$set": update_data},
+                {"$setOnInsert": {"first_seen": now}, "$set": update_data},
                 upsert=True
             )
+            if result.upserted_id is not None:
+                await self._record_new_users(1, now)
             
             if result.modified_count > 0 or result.upserted_id:
                 logger.info(f"✅ Updated final JSON info for user {user_id}: {filename} ({message_count} messages)")
@@ -540,17 +1561,187 @@ class MongoService:
             logger.error(f"❌ Failed to update final JSON info for user {user_id}: {e}")
             return False
 
-class MongoServiceManager:
-    """مدیر اتصال MongoDB"""
+    async def update_multiple_user_final_json_info(self, records: List[Dict[str, Any]]) -> int:
+        """به‌روزرسانی دسته‌ای اطلاعات فایل‌های JSON نهایی (user_id, filename, message_count)"""
+        try:
+            if self.users_collection is None:
+                logger.error("❌ MongoDB users collection not connected")
+                return 0
+            
+            if not records:
+                return 0
+            
+            current_time = datetime.utcnow()
+            bulk_operations = [
+                pymongo.UpdateOne(
+                    {"user_id": record["user_id"]},
+                    {
+                        "$setOnInsert": {"first_seen": current_time},
+                        "$set": {
+                            "final_json_filename": record["filename"],
+                            "final_json_updated": current_time,
+                            "final_json_message_count": record.get("message_count", 0),
+                            "last_seen": current_time
+                        }
+                    },
+                    upsert=True
+                )
+                for record in records
+            ]
+            
+            result = await self._run(self.users_collection.bulk_write, bulk_operations, ordered=False)
+            await self._record_new_users(result.upserted_count, current_time)
+            updated_count = result.upserted_count + result.modified_count
+            logger.info(f"✅ Updated final JSON info for {updated_count} users")
+            return updated_count
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to update final JSON info in bulk: {e}")
+            return 0
+    
+    async def save_user_file_entries(self, entries: List[Dict[str, Any]]) -> int:
+        """ذخیره دسته‌ای ورودی‌های ایندکس فایل‌های کاربران"""
+        try:
+            if self.user_files_collection is None:
+                logger.error("❌ MongoDB user_files collection not connected")
+                return 0
+            
+            if not entries:
+                return 0
+            
+            bulk_operations = [
+                pymongo.UpdateOne(
+                    {"chat_id": entry["chat_id"], "message_id": entry["message_id"]},
+                    {"$set": entry},
+                    upsert=True
+                )
+                for entry in entries
+            ]
+            
+            result = await self._run(self.user_files_collection.bulk_write, bulk_operations, ordered=False)
+            # ورودی‌هایی که بدون تغییر دوباره ذخیره شده‌اند هم نوشته شده حساب می‌شوند
+            saved_count = result.upserted_count + result.matched_count
+            logger.debug(f"✅ Indexed {saved_count} user files")
+            return saved_count
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to save user file entries: {e}")
+            return 0
+    
+    async def get_user_file_entries(self, user_id: int, chat_id: int) -> List[Dict[str, Any]]:
+        """دریافت فایل‌های یک کاربر از ایندکس (مرتب بر اساس timestamp)"""
+        try:
+            if self.user_files_collection is None:
+                return []
+            
+            return await self._find_all(
+                self.user_files_collection,
+                {"user_id": user_id, "chat_id": chat_id},
+                {"_id": 0},
+                sort=[("timestamp", pymongo.ASCENDING), ("message_id", pymongo.ASCENDING)]
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to get user file entries for {user_id}: {e}")
+            return []
+    
+    async def get_all_user_file_entries(self, chat_id: int) -> List[Dict[str, Any]]:
+        """دریافت کل ایندکس فایل‌های یک چت با یک کوئری مرتب بر اساس کاربر"""
+        try:
+            if self.user_files_collection is None:
+                return []
+            
+            return await self._find_all(
+                self.user_files_collection,
+                {"chat_id": chat_id},
+                {"_id": 0},
+                sort=[("user_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)]
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to get user file entries for chat {chat_id}: {e}")
+            return []
+    
+    async def get_index_position(self, name: str) -> int:
+        """دریافت بالاترین message_id ایندکس شده"""
+        try:
+            if self.index_state_collection is None:
+                return 0
+            
+            state = await self._run(self.index_state_collection.find_one, {"name": name})
+            return int(state.get("last_message_id", 0)) if state else 0
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to get index position for {name}: {e}")
+            return 0
     
-    def __init__(self):
-        self.service = MongoService()
+    async def set_index_position(self, name: str, last_message_id: int) -> bool:
+        """ذخیره بالاترین message_id ایندکس شده"""
+        try:
+            if self.index_state_collection is None:
+                return False
+            
+            await self._run(
+                self.index_state_collection.update_one,
+                {"name": name},
+                {
+                    "$max": {"last_message_id": last_message_id},
+                    "$set": {"updated_at": datetime.utcnow()}
+                },
+                upsert=True
+            )
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to set index position for {name}: {e}")
+            return False
+
+# سرویس مشترک در سطح پروسه
+_shared_service: Optional[MongoService] = None
+_shared_lock = asyncio.Lock()
+_last_failed_attempt: float = 0.0
+# فاصله بین تلاش‌های مجدد اتصال پس از شکست (ثانیه)
+RECONNECT_COOLDOWN_SECONDS = 30
+
+async def get_mongo_service() -> MongoService:
+    """دریافت سرویس مشترک MongoDB (اتصال به صورت lazy و فقط یک بار ساخته می‌شود)"""
+    global _shared_service, _last_failed_attempt
+    
+    if _shared_service is not None and _shared_service.is_connected:
+        return _shared_service
+    
+    async with _shared_lock:
+        if _shared_service is not None and _shared_service.is_connected:
+            return _shared_service
+        
+        service = _shared_service or MongoService()
+        _shared_service = service
+        
+        # پس از شکست، تا پایان cooldown دوباره تلاش نمی‌کنیم تا هر فراخوانی ۵ ثانیه منتظر نماند
+        if _last_failed_attempt and time.monotonic() - _last_failed_attempt < RECONNECT_COOLDOWN_SECONDS:
+            return service
+        
+        if not await service.connect():
+            _last_failed_attempt = time.monotonic()
+        
+        return service
+
+async def close_mongo_service():
+    """بستن اتصال مشترک در پایان پروسه"""
+    global _shared_service
+    
+    if _shared_service is not None:
+        await _shared_service.disconnect()
+        _shared_service = None
+
+class MongoServiceManager:
+    """دسترسی به سرویس مشترک MongoDB (چرخه عمر اتصال در اختیار این کلاس نیست)"""
     
     async def __aenter__(self):
         """ورود به context manager"""
-        await self.service.connect()
+        self.service = await get_mongo_service()
         return self.service
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """خروج از context manager"""
-        await self.service.disconnect() 
\ No newline at end of file
+        """خروج از context manager (اتصال مشترک باز می‌ماند)"""
+        return False
@@ -0,0 +1,223 @@
+import re
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, unquote, urlencode, ParseResult
+
+from utils.logger import logger
+
+# حداکثر عمق باز کردن لینک‌های پوششی تو در تو
+MAX_DECODE_DEPTH = 5
+
+# لینک تلگرام داخل یک متن یا URL رمزگشایی شده (شامل لینک‌های دعوت با +)
+TELEGRAM_URL_PATTERN = re.compile(r'https?://(?:t|telegram)\.me/[a-zA-Z0-9_/+\-]+', re.IGNORECASE)
+TELEGRAM_HOSTS = ('t.me', 'telegram.me', 'www.t.me', 'www.telegram.me')
+
+# نام پارامترهای رایج که مقصد ریدایرکت را نگه می‌دارند
+REDIRECT_PARAM_NAMES = (
+    'url', 'u', 'q', 'target', 'to', 'link', 'dest', 'destination',
+    'redirect', 'redirect_url', 'redirect_uri', 'goto', 'out', 'r'
+)
+
+def percent_decode(value: str, max_rounds: int = 3) -> str:
+    """رمزگشایی درصدی تکراری برای مقادیری که چند بار encode شده‌اند"""
+    for _ in range(max_rounds):
+        decoded = unquote(value)
+        if decoded == value:
+            break
+        value = decoded
+    return value
+
+def _http_target(value: str) -> Optional[str]:
+    """مقدار پارامتر اگر (پس از رمزگشایی) یک URL کامل باشد؛ رمزگشایی با رسیدن به URL متوقف می‌شود تا query مقصد دست نخورد"""
+    target = value.strip()
+    for _ in range(3):
+        if target.lower().startswith(('http://', 'https://')):
+            return target
+        target = unquote(target)
+    return target if target.lower().startswith(('http://', 'https://')) else None
+
+class RedirectRule(ABC):
+    """قانون رمزگشایی آفلاین یک نوع لینک پوششی"""
+
+    name = "rule"
+
+    @abstractmethod
+    def decode(self, url: str, parsed: ParseResult) -> Optional[str]:
+        """لینک مقصد یا None اگر این قانون به لینک مربوط نیست"""
+
+class QueryParamRule(RedirectRule):
+    """مقصد در یک پارامتر query روی hostهای مشخص (مثل l.facebook.com/l.php?u=)"""
+
+    def __init__(self, name: str, host_pattern: str, params: Iterable[str], path_prefix: str = ''):
+        self.name = name
+        self.host_pattern = re.compile(host_pattern, re.IGNORECASE)
+        self.params = tuple(params)
+        self.path_prefix = path_prefix
+
+    def decode(self, url: str, parsed: ParseResult) -> Optional[str]:
+        if not self.host_pattern.fullmatch(parsed.hostname or ''):
+            return None
+        if not parsed.path.startswith(self.path_prefix):
+            return None
+
+        query = parse_qs(parsed.query)
+        for param in self.params:
+            for value in query.get(param, []):
+                target = _http_target(value)
+                if target:
+                    return target
+        return None
+
+class TranslateGoogRule(RedirectRule):
+    """پروکسی ترجمه گوگل: host اصلی در زیردامنه translate.goog کد شده است (- به . و -- به -)"""
+
+    name = "translate_goog"
+    SUFFIX = '.translate.goog'
+
+    def decode(self, url: str, parsed: ParseResult) -> Optional[str]:
+        host = (parsed.hostname or '').lower()
+        if not host.endswith(self.SUFFIX):
+            return None
+
+        encoded_host = host[:-len(self.SUFFIX)]
+        original_host = encoded_host.replace('--', '\0').replace('-', '.').replace('\0', '-')
+
+        # پارامترهای _x_tr_* مربوط به خود مترجم هستند
+        query = [(k, v) for k, values in parse_qs(parsed.query, keep_blank_values=True).items()
+                 for v in values if not k.startswith('_x_tr_')]
+        target = f"https://{original_host}{parsed.path or '/'}"
+        if query:
+            target += '?' + urlencode(query)
+        return target
+
+class AmpCacheRule(RedirectRule):
+    """کش AMP (cdn.ampproject.org و google.com/amp): مقصد در مسیر URL است، s/ یعنی https"""
+
+    name = "amp_cache"
+    GOOGLE_HOST = re.compile(r'(?:www\.)?google\.[a-z.]+', re.IGNORECASE)
+
+    def decode(self, url: str, parsed: ParseResult) -> Optional[str]:
+        host = (parsed.hostname or '').lower()
+        parts = parsed.path.lstrip('/').split('/')
+
+        if host == 'cdn.ampproject.org' or host.endswith('.cdn.ampproject.org'):
+            parts = parts[1:]  # نوع محتوا (c، v، i، ...)
+        elif self.GOOGLE_HOST.fullmatch(host) and parts[0] == 'amp':
+            parts = parts[1:]
+        else:
+            return None
+
+        secure = bool(parts) and parts[0] == 's'
+        if secure:
+            parts = parts[1:]
+        if not parts or '.' not in parts[0]:
+            return None
+
+        target = f"{'https' if secure else 'http'}://{'/'.join(parts)}"
+        if parsed.query:
+            target += '?' + parsed.query
+        return target
+
+class EmbeddedTelegramRule(RedirectRule):
+    """هر لینکی که پس از رمزگشایی درصدی یک لینک تلگرام در خود دارد"""
+
+    name = "embedded_telegram"
+
+    def decode(self, url: str, parsed: ParseResult) -> Optional[str]:
+        if (parsed.hostname or '').lower() in TELEGRAM_HOSTS:
+            return None
+
+        match = TELEGRAM_URL_PATTERN.search(percent_decode(url))
+        return match.group(0) if match else None
+
+class GenericParamRule(RedirectRule):
+    """پارامترهای رایج ریدایرکت (url، to، goto، ...) یا query که خودش یک URL است (href.li/?https://...)"""
+
+    name = "generic_param"
+
+    def decode(self, url: str, parsed: ParseResult) -> Optional[str]:
+        if not parsed.query:
+            return None
+
+        target = _http_target(parsed.query)
+        if target:
+            return target
+
+        query = parse_qs(parsed.query)
+        for param in REDIRECT_PARAM_NAMES:
+            for value in query.get(param, []):
+                target = _http_target(value)
+                if target:
+                    return target
+        return None
+
+# ترتیب مهم است: قوانین مخصوص host اول، قوانین عمومی در انتها
+DEFAULT_RULES: List[RedirectRule] = [
+    QueryParamRule("google_translate", r'translate\.google(?:usercontent)?\.[a-z.]+', ('u',)),
+    QueryParamRule("google_redirect", r'(?:www\.)?google\.[a-z.]+', ('q', 'url'), path_prefix='/url'),
+    QueryParamRule("facebook", r'lm?\.facebook\.com|l\.messenger\.com', ('u',)),
+    QueryParamRule("instagram", r'l\.instagram\.com', ('u',)),
+    QueryParamRule("youtube", r'(?:www\.)?youtube\.com', ('q',), path_prefix='/redirect'),
+    QueryParamRule("vk", r'(?:m\.)?vk\.com', ('to',), path_prefix='/away.php'),
+    TranslateGoogRule(),
+    AmpCacheRule(),
+    EmbeddedTelegramRule(),
+    GenericParamRule(),
+]
+
+class RedirectDecoder:
+    """موتور رمزگشایی آفلاین لینک‌های پوششی؛ فقط کوتاه‌کننده‌های واقعاً مبهم به درخواست HTTP نیاز دارند"""
+
+    def __init__(self, rules: Optional[List[RedirectRule]] = None, max_depth: int = MAX_DECODE_DEPTH):
+        self.rules: List[RedirectRule] = list(DEFAULT_RULES if rules is None else rules)
+        self.max_depth = max_depth
+
+    def register(self, rule: RedirectRule, first: bool = True):
+        """افزودن یک قانون جدید (به صورت پیش‌فرض با اولویت بالاتر از قوانین موجود)"""
+        if first:
+            self.rules.insert(0, rule)
+        else:
+            self.rules.append(rule)
+
+    def decode_once(self, url: str) -> Optional[Tuple[str, str]]:
+        """یک مرحله رمزگشایی؛ خروجی (نام قانون، مقصد)"""
+        try:
+            parsed = urlparse(url)
+        except ValueError:
+            return None
+
+        for rule in self.rules:
+            try:
+                target = rule.decode(url, parsed)
+            except Exception as e:
+                logger.debug(f"⚠️ Redirect rule {rule.name} failed on {url}: {e}")
+                continue
+            if target and target != url:
+                return rule.name, target
+        return None
+
+    def decode(self, url: str) -> Optional[str]:
+        """رمزگشایی بازگشتی لینک‌های تو در تو؛ None اگر هیچ قانونی اعمال نشد"""
+        current = url
+        seen = {url}
+
+        for _ in range(self.max_depth):
+            result = self.decode_once(current)
+            if not result:
+                break
+
+            rule_name, target = result
+            if target in seen:
+                break
+            logger.debug(f"🧩 Decoded {rule_name}: {current} -> {target}")
+            seen.add(target)
+            current = target
+
+        return current if current != url else None
+
+# رمزگشای مشترک با قوانین پیش‌فرض
+redirect_decoder = RedirectDecoder()
+
+def decode_redirect(url: str) -> Optional[str]:
+    """رمزگشایی آفلاین یک لینک پوششی با قوانین پیش‌فرض"""
+    return redirect_decoder.decode(url)
@@ -0,0 +1,1450 @@
+import asyncio
+import functools
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, List, Dict, Any, AsyncIterator
+
+from config.settings import STORAGE_CONFIG, EXPIRY_SETTINGS
+from models.data_models import GroupInfo, GroupRef, ExtractedLink, FrontierCandidate, ChatType, ScanStatus
+from utils.logger import logger
+from .storage_backend import StorageBackend
+
+# ستون‌های جدول groups (هم‌نام با فیلدهای GroupInfo؛ aliases جداگانه ادغام می‌شود)
+GROUP_COLUMNS = (
+    "chat_id", "username", "link", "link_key", "chat_type", "is_public", "last_scan_time",
+    "last_message_id", "start_message_id", "last_scan_status", "scan_count",
+    "next_scan_at", "priority", "discovery_count", "created_at", "updated_at"
+)
+# فیلدهای پروفایل کاربر که ستون جداگانه دارند
+USER_PROFILE_FIELDS = (
+    "first_name", "last_name", "current_name", "current_username", "phone_number",
+    "is_bot", "is_verified", "is_restricted", "is_scam", "is_fake", "is_deleted",
+    "is_premium", "language_code", "dc_id"
+)
+# فیلدهای مجموعه‌ای پروفایل (ذخیره به صورت آرایه JSON)
+USER_SET_FIELDS = ("usernames", "names", "group_ids")
+# فیلدهای تاریخ که به صورت متن ISO ذخیره می‌شوند
+DATETIME_FIELDS = (
+    "last_scan_time", "next_scan_at", "created_at", "updated_at",
+    "first_seen", "last_seen", "final_json_updated", "date", "scanned_at"
+)
+# ستون‌هایی که بعد از نسخه اول schema اضافه شده‌اند: (جدول، ستون، نوع)
+ADDED_COLUMNS = (
+    ("groups", "link_key", "TEXT"),
+    ("groups", "priority", "REAL DEFAULT 0"),
+    ("groups", "discovery_count", "INTEGER DEFAULT 0"),
+    ("groups", "aliases", "TEXT"),
+)
+# حداکثر متغیرهای هر کوئری IN
+SQLITE_IN_CHUNK_SIZE = 500
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER UNIQUE,
+    username TEXT,
+    link TEXT,
+    link_key TEXT,
+    chat_type TEXT,
+    is_public INTEGER,
+    last_scan_time TEXT,
+    last_message_id INTEGER,
+    start_message_id INTEGER,
+    last_scan_status TEXT,
+    scan_count INTEGER DEFAULT 0,
+    next_scan_at TEXT,
+    priority REAL DEFAULT 0,
+    discovery_count INTEGER DEFAULT 0,
+    aliases TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS groups_username ON groups(username);
+CREATE INDEX IF NOT EXISTS groups_link_key ON groups(link_key);
+CREATE INDEX IF NOT EXISTS groups_next_scan ON groups(next_scan_at, id);
+CREATE INDEX IF NOT EXISTS groups_updated_at ON groups(updated_at);
+CREATE INDEX IF NOT EXISTS groups_priority ON groups(priority DESC, id) WHERE priority > 0;
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    first_seen TEXT,
+    last_seen TEXT,
+    {", ".join(f"{field} {'INTEGER' if field.startswith('is_') or field == 'dc_id' else 'TEXT'}" for field in USER_PROFILE_FIELDS)},
+    usernames TEXT,
+    names TEXT,
+    group_ids TEXT,
+    final_json_filename TEXT,
+    final_json_updated TEXT,
+    final_json_message_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS users_first_seen ON users(first_seen);
+CREATE INDEX IF NOT EXISTS users_last_seen ON users(last_seen);
+CREATE INDEX IF NOT EXISTS users_final_json ON users(final_json_updated) WHERE final_json_filename IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS messages (
+    group_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    user_id INTEGER,
+    date TEXT,
+    document TEXT NOT NULL,
+    PRIMARY KEY (group_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS messages_user_date ON messages(user_id, date);
+CREATE INDEX IF NOT EXISTS messages_group_date ON messages(group_id, date);
+
+CREATE TABLE IF NOT EXISTS user_files (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    user_id INTEGER,
+    timestamp TEXT,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (chat_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS user_files_user ON user_files(user_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS index_state (
+    name TEXT PRIMARY KEY,
+    last_message_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS scan_journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER,
+    link TEXT,
+    status TEXT,
+    message_count INTEGER,
+    last_message_id INTEGER,
+    duration_seconds REAL,
+    scanned_at TEXT
+);
+CREATE INDEX IF NOT EXISTS scan_journal_chat ON scan_journal(chat_id, scanned_at);
+CREATE INDEX IF NOT EXISTS scan_journal_scanned_at ON scan_journal(scanned_at);
+
+CREATE TABLE IF NOT EXISTS redirect_cache (
+    url TEXT PRIMARY KEY,
+    outcome TEXT NOT NULL,
+    target TEXT,
+    resolved_at TEXT,
+    expires_at TEXT
+);
+CREATE INDEX IF NOT EXISTS redirect_cache_resolved_at ON redirect_cache(resolved_at);
+
+CREATE TABLE IF NOT EXISTS link_registry (
+    key TEXT PRIMARY KEY,
+    url TEXT,
+    kind TEXT,
+    chat_id INTEGER,
+    first_seen TEXT,
+    last_seen TEXT,
+    seen_count INTEGER NOT NULL DEFAULT 0,
+    resolved_at TEXT
+);
+CREATE INDEX IF NOT EXISTS link_registry_chat ON link_registry(chat_id);
+
+CREATE TABLE IF NOT EXISTS invite_cache (
+    invite_hash TEXT PRIMARY KEY,
+    info TEXT NOT NULL,
+    checked_at TEXT,
+    expires_at TEXT
+);
+CREATE INDEX IF NOT EXISTS invite_cache_expires_at ON invite_cache(expires_at);
+"""
+
+def _to_db(value: Any) -> Any:
+    """تبدیل مقدار پایتون به مقدار قابل ذخیره در SQLite"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (ChatType, ScanStatus)):
+        return value.value
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+def _from_db_datetime(value: Optional[str]) -> Optional[datetime]:
+    """تبدیل متن ISO به datetime"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def _json_default(value: Any) -> Any:
+    """سریال‌سازی datetime داخل سندهای JSON"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+class SQLiteService(StorageBackend):
+    """backend ذخیره‌سازی محلی با SQLite (حالت WAL و تراکنش‌های دسته‌ای)"""
+
+    name = "SQLite"
+
+    def __init__(self, db_path: str = None):
+        """مقداردهی اولیه سرویس SQLite"""
+        self.db_path = db_path or STORAGE_CONFIG.sqlite_path
+        self.conn: Optional[sqlite3.Connection] = None
+        # sqlite3 همگام است؛ همه دسترسی‌ها در یک thread اجرا می‌شوند تا event loop مسدود نشود
+        # و نوشتن‌ها بدون قفل اضافه پشت سر هم قرار بگیرند
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _run(self, fn, *args, **kwargs):
+        """اجرای یک فراخوانی همگام در thread اختصاصی SQLite"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def connect(self) -> bool:
+        """باز کردن فایل دیتابیس و ساخت جداول"""
+        try:
+            await self._run(self._connect_sync)
+            logger.info(f"✅ Connected to SQLite: {self.db_path}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ SQLite connection error: {e}")
+            self.conn = None
+            return False
+
+    def _connect_sync(self):
+        """اتصال همگام و تنظیمات WAL"""
+        if self.db_path != ":memory:":
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        self._add_missing_columns_sync(conn)
+        conn.executescript(SCHEMA)
+        # کلید canonical برای گروه‌های قدیمی که username دارند
+        with conn:
+            conn.execute(
+                "UPDATE groups SET link_key = '@' || lower(username) WHERE link_key IS NULL AND username IS NOT NULL"
+            )
+        self.conn = conn
+        self._purge_expired_sync()
+
+    @staticmethod
+    def _add_missing_columns_sync(conn: sqlite3.Connection):
+        """افزودن ستون‌های جدید به جداول دیتابیس‌های قدیمی پیش از ساخت ایندکس‌ها"""
+        for table, column, column_type in ADDED_COLUMNS:
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if columns and column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                logger.info(f"🔧 Added column {table}.{column}")
+
+    @property
+    def is_connected(self) -> bool:
+        """آیا اتصال برقرار است"""
+        return self.conn is not None
+
+    async def disconnect(self):
+        """بستن دیتابیس"""
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+            logger.info("✅ Disconnected from SQLite")
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # ---------- ابزارهای داخلی ----------
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """اجرای کوئری خواندنی"""
+        return self.conn.execute(sql, params).fetchall()
+
+    def _purge_expired_sync(self):
+        """حذف رکوردهای منقضی (معادل TTL index در MongoDB) هنگام اتصال"""
+        policies = [
+            ("groups", "updated_at", EXPIRY_SETTINGS.groups_days),
+            ("users", "last_seen", EXPIRY_SETTINGS.users_days),
+            ("redirect_cache", "resolved_at", EXPIRY_SETTINGS.redirect_cache_days),
+            ("scan_journal", "scanned_at", EXPIRY_SETTINGS.scan_journal_days)
+        ]
+        with self.conn:
+            for table, field, days in policies:
+                if days > 0:
+                    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+                    deleted = self.conn.execute(f"DELETE FROM {table} WHERE {field} < ?", (cutoff,)).rowcount
+                    if deleted:
+                        logger.info(f"⏳ Expired {deleted} rows from {table}")
+            # نتایج منقضی کش لینک‌های دعوت (معادل TTL روی expires_at)
+            self.conn.execute("DELETE FROM invite_cache WHERE expires_at < ?", (datetime.utcnow().isoformat(),))
+
+    @staticmethod
+    def _row_to_group(row: sqlite3.Row) -> GroupInfo:
+        """تبدیل ردیف groups به GroupInfo"""
+        data = {column: row[column] for column in GROUP_COLUMNS}
+        data["is_public"] = bool(data["is_public"])
+        data["scan_count"] = data["scan_count"] or 0
+        data["priority"] = data["priority"] or 0.0
+        data["discovery_count"] = data["discovery_count"] or 0
+        data["aliases"] = json.loads(row["aliases"]) if row["aliases"] else []
+        for field in ("last_scan_time", "next_scan_at", "created_at", "updated_at"):
+            data[field] = _from_db_datetime(data[field])
+        return GroupInfo.from_dict(data)
+
+    @staticmethod
+    def _row_to_user(row: sqlite3.Row) -> Dict[str, Any]:
+        """تبدیل ردیف users به دیکشنری مشابه سند MongoDB"""
+        user = {}
+        for key in row.keys():
+            value = row[key]
+            if value is None:
+                continue
+            if key in USER_SET_FIELDS:
+                value = json.loads(value)
+            elif key in DATETIME_FIELDS:
+                value = _from_db_datetime(value)
+            elif key.startswith("is_"):
+                value = bool(value)
+            user[key] = value
+        return user
+
+    def _groups_where(self, sql: str, params: tuple = ()) -> List[GroupInfo]:
+        """دریافت گروه‌ها با یک شرط"""
+        groups = []
+        for row in self._query(f"SELECT * FROM groups {sql}", params):
+            try:
+                groups.append(self._row_to_group(row))
+            except Exception as e:
+                logger.warning(f"⚠️ Could not parse group data: {e}")
+        return groups
+
+    # ---------- گروه‌ها ----------
+
+    async def save_group_info(self, group_info: GroupInfo) -> bool:
+        """ذخیره یا به‌روزرسانی اطلاعات گروه (بر اساس chat_id، یا link_key برای لینک‌های حل نشده)"""
+        try:
+            if self.conn is None:
+                logger.error("❌ SQLite not connected")
+                return False
+
+            if group_info.chat_id is None and not group_info.link_key:
+                logger.error(f"❌ Group without chat_id or link_key: {group_info.link}")
+                return False
+
+            data = group_info.to_dict()
+            values = tuple(_to_db(data.get(column)) for column in GROUP_COLUMNS)
+            updates = ", ".join(f"{column} = excluded.{column}" for column in GROUP_COLUMNS if column != "chat_id")
+            assignments = ", ".join(f"{column} = ?" for column in GROUP_COLUMNS)
+            insert_sql = f"INSERT INTO groups ({', '.join(GROUP_COLUMNS)}) VALUES ({', '.join('?' * len(GROUP_COLUMNS))})"
+
+            def save():
+                with self.conn:
+                    if group_info.chat_id is None:
+                        # لینک حل نشده: یک رکورد موقت برای هر link_key
+                        row = self.conn.execute(
+                            "SELECT id FROM groups WHERE link_key = ? AND chat_id IS NULL", (group_info.link_key,)
+                        ).fetchone()
+                        if row is not None:
+                            self.conn.execute(f"UPDATE groups SET {assignments} WHERE id = ?", values + (row["id"],))
+                        else:
+                            self.conn.execute(insert_sql, values)
+                        return row is not None
+
+                    existed = self.conn.execute(
+                        "SELECT 1 FROM groups WHERE chat_id = ?", (group_info.chat_id,)
+                    ).fetchone() is not None
+                    self.conn.execute(f"{insert_sql} ON CONFLICT(chat_id) DO UPDATE SET {updates}", values)
+                    if group_info.link_key:
+                        # رکورد موقت همین لینک در رکورد اصلی ادغام می‌شود
+                        self.conn.execute(
+                            "DELETE FROM groups WHERE link_key = ? AND chat_id IS NULL", (group_info.link_key,)
+                        )
+                    if group_info.aliases:
+                        self._add_aliases_sync(group_info.chat_id, group_info.aliases)
+                return existed
+
+            label = group_info.chat_id if group_info.chat_id is not None else group_info.link_key
+            if await self._run(save):
+                logger.info(f"✅ Group updated: {label}")
+            else:
+                logger.info(f"✅ New group saved: {label}")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Failed to save group info: {e}")
+            return False
+
+    def _add_aliases_sync(self, chat_id: int, aliases: List[str]):
+        """ادغام aliases در آرایه JSON رکورد گروه (معادل $addToSet)"""
+        row = self.conn.execute("SELECT aliases FROM groups WHERE chat_id = ?", (chat_id,)).fetchone()
+        if row is None:
+            return
+        current = json.loads(row["aliases"]) if row["aliases"] else []
+        merged = current + [alias for alias in dict.fromkeys(aliases) if alias not in current]
+        if len(merged) != len(current):
+            self.conn.execute(
+                "UPDATE groups SET aliases = ? WHERE chat_id = ?", (json.dumps(merged, ensure_ascii=False), chat_id)
+            )
+
+    async def add_group_aliases(self, chat_id: int, aliases: List[str]) -> bool:
+        """ثبت کلید لینک‌های دیگر یک چت در رکورد گروه و حذف رکوردهای موقت آنها"""
+        try:
+            if self.conn is None or not aliases:
+                return False
+
+            def update():
+                with self.conn:
+                    self._add_aliases_sync(chat_id, aliases)
+                    # کاندیدهای حل نشده همین لینک‌ها دیگر لازم نیستند
+                    self.conn.executemany(
+                        "DELETE FROM groups WHERE link_key = ? AND chat_id IS NULL", [(alias,) for alias in aliases]
+                    )
+
+            await self._run(update)
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Failed to add aliases to group {chat_id}: {e}")
+            return False
+
+    async def get_group_info(self, chat_id: int) -> Optional[GroupInfo]:
+        """دریافت اطلاعات گروه بر اساس chat_id"""
+        try:
+            if self.conn is None:
+                return None
+            groups = await self._run(self._groups_where, "WHERE chat_id = ?", (chat_id,))
+            return groups[0] if groups else None
+        except Exception as e:
+            logger.error(f"❌ Failed to get group info: {e}")
+            return None
+
+    async def get_group_by_username(self, username: str) -> Optional[GroupInfo]:
+        """دریافت اطلاعات گروه بر اساس username"""
+        try:
+            if self.conn is None:
+                return None
+            username = username.lstrip('@')
+            groups = await self._run(
+                self._groups_where, "WHERE link_key = ? OR username = ? LIMIT 1", (f"@{username.lower()}", username)
+            )
+            return groups[0] if groups else None
+        except Exception as e:
+            logger.error(f"❌ Failed to get group by username: {e}")
+            return None
+
+    async def get_group_by_link_key(self, link_key: str) -> Optional[GroupInfo]:
+        """دریافت اطلاعات گروه بر اساس کلید canonical لینک (رکورد حل شده مقدم است)"""
+        try:
+            if self.conn is None:
+                return None
+            groups = await self._run(
+                self._groups_where, "WHERE link_key = ? ORDER BY chat_id IS NULL LIMIT 1", (link_key,)
+            )
+            return groups[0] if groups else None
+        except Exception as e:
+            logger.error(f"❌ Failed to get group by link key: {e}")
+            return None
+
+    async def get_groups_by_status(self, status: ScanStatus) -> List[GroupInfo]:
+        """دریافت گروه‌ها بر اساس وضعیت اسکن"""
+        try:
+            if self.conn is None:
+                return []
+            return await self._run(self._groups_where, "WHERE last_scan_status = ?", (status.value,))
+        except Exception as e:
+            logger.error(f"❌ Failed to get groups by status: {e}")
+            return []
+
+    async def get_groups_by_type(self, chat_type: ChatType) -> List[GroupInfo]:
+        """دریافت گروه‌ها بر اساس نوع چت"""
+        try:
+            if self.conn is None:
+                return []
+            groups = await self._run(self._groups_where, "WHERE chat_type = ?", (chat_type.value,))
+            logger.info(f"✅ Retrieved {len(groups)} {chat_type.value} groups from SQLite")
+            return groups
+        except Exception as e:
+            logger.error(f"❌ Failed to get groups by type: {e}")
+            return []
+
+    async def get_recent_scans(self, hours: int = 24) -> List[GroupInfo]:
+        """دریافت گروه‌هایی که در ساعات اخیر اسکن شده‌اند"""
+        try:
+            if self.conn is None:
+                return []
+            cutoff_time = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+            return await self._run(
+                self._groups_where,
+                "WHERE last_scan_time >= ? ORDER BY last_scan_time DESC", (cutoff_time,)
+            )
+        except Exception as e:
+            logger.error(f"❌ Failed to get recent scans: {e}")
+            return []
+
+    async def get_all_groups(self) -> List[GroupInfo]:
+        """دریافت تمام گروه‌ها"""
+        try:
+            if self.conn is None:
+                logger.error("❌ SQLite not connected")
+                return []
+            groups = await self._run(self._groups_where, "")
+            logger.info(f"✅ Retrieved {len(groups)} groups from SQLite")
+            return groups
+        except Exception as e:
+            logger.error(f"❌ Failed to get all groups: {e}")
+            return []
+
+    async def iter_groups(self, due_at: datetime = None, chat_type: ChatType = None,
+                          status: ScanStatus = None, is_public: bool = None,
+                          projection: Dict[str, Any] = None, batch_size: int = 500) -> AsyncIterator[GroupRef]:
+        """پیمایش جریانی گروه‌ها به صورت GroupRef؛ با due_at فقط گروه‌های آماده به ترتیب فوریت برمی‌گردند"""
+        if self.conn is None:
+            logger.error("❌ SQLite not connected")
+            return
+
+        conditions, params = [], []
+        if due_at is not None:
+            conditions.append("(next_scan_at IS NULL OR next_scan_at <= ?)")
+            params.append(due_at.isoformat())
+        if chat_type is not None:
+            conditions.append("chat_type = ?")
+            params.append(chat_type.value)
+        if status is not None:
+            conditions.append("last_scan_status = ?")
+            params.append(status.value)
+        if is_public is not None:
+            conditions.append("is_public = ?")
+            params.append(int(is_public))
+
+        fields = [field for field in (projection or GroupRef.PROJECTION) if field in GROUP_COLUMNS]
+        columns = ", ".join(["id", "next_scan_at"] + [field for field in fields if field != "next_scan_at"])
+        order = "next_scan_at, id" if due_at is not None else "id"
+
+        # صفحه‌بندی keyset مشابه MongoService (NULL در SQLite هم قبل از همه مرتب می‌شود)
+        last_row = None
+        try:
+            while True:
+                page_conditions, page_params = list(conditions), list(params)
+                if last_row is not None:
+                    if due_at is None:
+                        page_conditions.append("id > ?")
+                        page_params.append(last_row["id"])
+                    elif last_row["next_scan_at"] is None:
+                        page_conditions.append("((next_scan_at IS NULL AND id > ?) OR next_scan_at IS NOT NULL)")
+                        page_params.append(last_row["id"])
+                    else:
+                        page_conditions.append("(next_scan_at > ? OR (next_scan_at = ? AND id > ?))")
+                        page_params.extend([last_row["next_scan_at"], last_row["next_scan_at"], last_row["id"]])
+
+                where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+                batch = await self._run(
+                    self._query,
+                    f"SELECT {columns} FROM groups {where} ORDER BY {order} LIMIT ?",
+                    tuple(page_params) + (batch_size,)
+                )
+                if not batch:
+                    break
+
+                last_row = batch[-1]
+                for row in batch:
+                    data = {field: row[field] for field in fields}
+                    if "is_public" in data and data["is_public"] is not None:
+                        data["is_public"] = bool(data["is_public"])
+                    for field in ("last_scan_time", "next_scan_at"):
+                        if field in data:
+                            data[field] = _from_db_datetime(data[field])
+                    yield GroupRef.from_dict(data)
+
+                if len(batch) < batch_size:
+                    break
+        except Exception as e:
+            logger.error(f"❌ Failed to iterate groups: {e}")
+
+    async def backfill_next_scan_at(self, interval_minutes: int) -> int:
+        """محاسبه next_scan_at برای گروه‌های قدیمی که فقط last_scan_time دارند"""
+        try:
+            if self.conn is None:
+                return 0
+
+            groups = await self._run(
+                self._query,
+                "SELECT id, last_scan_time FROM groups WHERE next_scan_at IS NULL AND last_scan_time IS NOT NULL"
+            )
+            updates = []
+            for row in groups:
+                last_scan_time = _from_db_datetime(row["last_scan_time"])
+                if last_scan_time:
+                    updates.append(((last_scan_time + timedelta(minutes=interval_minutes)).isoformat(), row["id"]))
+
+            if updates:
+                def apply():
+                    with self.conn:
+                        self.conn.executemany("UPDATE groups SET next_scan_at = ? WHERE id = ?", updates)
+                await self._run(apply)
+                logger.info(f"✅ Scheduled next scan for {len(updates)} existing groups")
+            return len(updates)
+
+        except Exception as e:
+            logger.error(f"❌ Failed to backfill next_scan_at: {e}")
+            return 0
+
+    async def delete_group(self, chat_id: int) -> bool:
+        """حذف گروه"""
+        try:
+            if self.conn is None:
+                return False
+
+            def delete():
+                with self.conn:
+                    return self.conn.execute("DELETE FROM groups WHERE chat_id = ?", (chat_id,)).rowcount
+
+            if await self._run(delete):
+                logger.info(f"✅ Group deleted: {chat_id}")
+                return True
+            return False
+
+        except Exception as e:
+            logger.error(f"❌ Failed to delete group: {e}")
+            return False
+
+    async def cleanup_old_records(self, days: int = 30) -> int:
+        """پاک کردن رکوردهای قدیمی (با ایندکس updated_at)"""
+        try:
+            if self.conn is None:
+                return 0
+
+            cutoff_time = (datetime.utcnow() - timedelta(days=days)).isoformat()
+
+            def delete():
+                with self.conn:
+                    return self.conn.execute("DELETE FROM groups WHERE updated_at < ?", (cutoff_time,)).rowcount
+
+            deleted_count = await self._run(delete)
+            if deleted_count > 0:
+                logger.info(f"✅ Cleaned up {deleted_count} old records")
+            return deleted_count
+
+        except Exception as e:
+            logger.error(f"❌ Failed to cleanup old records: {e}")
+            return 0
+
+    async def get_stats(self, use_cache: bool = True) -> Dict[str, Any]:
+        """دریافت آمار کلی با یک کوئری"""
+        try:
+            if self.conn is None:
+                return {}
+
+            rows = await self._run(self._query, """
+                SELECT
+                    COUNT(*) AS total_groups,
+                    SUM(last_scan_status = ?) AS successful_scans,
+                    SUM(last_scan_status = ?) AS failed_scans,
+                    SUM(chat_type = ?) AS channels,
+                    SUM(chat_type = ?) AS groups,
+                    SUM(chat_type = ?) AS supergroups,
+                    SUM(is_public = 1) AS public,
+                    SUM(is_public = 0) AS private
+                FROM groups
+            """, (
+                ScanStatus.SUCCESS.value, ScanStatus.FAILED.value,
+                ChatType.CHANNEL.value, ChatType.GROUP.value, ChatType.SUPERGROUP.value
+            ))
+            stats = {key: rows[0][key] or 0 for key in rows[0].keys()}
+
+            total_groups = stats["total_groups"]
+            stats["success_rate"] = (stats["successful_scans"] / total_groups * 100) if total_groups > 0 else 0
+            return stats
+
+        except Exception as e:
+            logger.error(f"❌ Failed to get stats: {e}")
+            return {}
+
+    async def record_scan(self, chat_id: Optional[int], link: str, status: ScanStatus,
+                          message_count: int = 0, last_message_id: Optional[int] = None,
+                          duration_seconds: float = 0.0) -> bool:
+        """ثبت یک اسکن در scan_journal"""
+        try:
+            if self.conn is None:
+                return False
+
+            def insert():
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT INTO scan_journal (chat_id, link, status, message_count, last_message_id, "
+                        "duration_seconds, scanned_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (chat_id, link, status.value, message_count, last_message_id,
+                         round(duration_seconds, 2), datetime.utcnow().isoformat())
+                    )
+
+            await self._run(insert)
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Failed to record scan for {link}: {e}")
+            return False
+
+    async def register_links(self, links: List[ExtractedLink], seen_at: datetime = None) -> Dict[str, int]:
+        """ثبت دسته‌ای لینک‌ها در link_registry؛ شکل‌های مختلف یک لینک در یک رکورد جمع می‌شوند"""
+        counts = {"inserted": 0, "updated": 0}
+        try:
+            if self.conn is None:
+                return counts
+
+            by_key: Dict[str, ExtractedLink] = {}
+            for link in links:
+                if link.key and link.key not in by_key:
+                    by_key[link.key] = link
+            if not by_key:
+                return counts
+
+            seen = (seen_at or datetime.utcnow()).isoformat()
+            keys = list(by_key)
+
+            def upsert():
+                with self.conn:
+                    existing = 0
+                    for chunk_start in range(0, len(keys), SQLITE_IN_CHUNK_SIZE):
+                        chunk = keys[chunk_start:chunk_start + SQLITE_IN_CHUNK_SIZE]
+                        existing += self.conn.execute(
+                            f"SELECT COUNT(*) FROM link_registry WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                        ).fetchone()[0]
+                    self.conn.executemany(
+                        "INSERT INTO link_registry (key, url, kind, first_seen, last_seen, seen_count) "
+                        "VALUES (?, ?, ?, ?, ?, 1) "
+                        "ON CONFLICT(key) DO UPDATE SET last_seen = excluded.last_seen, seen_count = seen_count + 1",
+                        [(key, link.url, link.kind.value, seen, seen) for key, link in by_key.items()]
+                    )
+                return existing
+
+            updated = await self._run(upsert)
+            counts["updated"] = updated
+            counts["inserted"] = len(keys) - updated
+            return counts
+
+        except Exception as e:
+            logger.error(f"❌ Failed to register links: {e}")
+            return counts
+
+    async def get_registered_link(self, link_key: str) -> Optional[Dict[str, Any]]:
+        """دریافت رکورد رجیستری یک کلید"""
+        try:
+            if self.conn is None:
+                return None
+
+            rows = await self._run(self._query, "SELECT * FROM link_registry WHERE key = ?", (link_key,))
+            if not rows:
+                return None
+
+            data = {key: rows[0][key] for key in rows[0].keys() if rows[0][key] is not None}
+            for field in ("first_seen", "last_seen", "resolved_at"):
+                if field in data:
+                    data[field] = _from_db_datetime(data[field])
+            return data
+
+        except Exception as e:
+            logger.error(f"❌ Failed to get registered link {link_key}: {e}")
+            return None
+
+    async def set_link_chat_id(self, link_key: str, chat_id: int) -> bool:
+        """اتصال کلید لینک به chat_id پس از حل شدن"""
+        try:
+            if self.conn is None:
+                return False
+
+            now = datetime.utcnow().isoformat()
+
+            def update():
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT INTO link_registry (key, chat_id, first_seen, last_seen, seen_count, resolved_at) "
+                        "VALUES (?, ?, ?, ?, 0, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET chat_id = excluded.chat_id, resolved_at = excluded.resolved_at",
+                        (link_key, chat_id, now, now, now)
+                    )
+
+            await self._run(update)
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Failed to link {link_key} to chat {chat_id}: {e}")
+            return False
+
+    async def iter_resolved_link_keys(self, batch_size: int = 5000) -> AsyncIterator[str]:
+        """پیمایش کلید لینک همه چت‌هایی که به chat_id حل شده‌اند (رجیستری و گروه‌ها)"""
+        if self.conn is None:
+            logger.error("❌ SQLite not connected")
+            return
+
+        sources = [
+            "SELECT key FROM link_registry WHERE chat_id IS NOT NULL AND key > ? ORDER BY key LIMIT ?",
+            "SELECT link_key AS key FROM groups WHERE chat_id IS NOT NULL AND link_key > ? ORDER BY link_key LIMIT ?"
+        ]
+        try:
+            for sql in sources:
+                last_key = ""
+                while True:
+                    batch = await self._run(self._query, sql, (last_key, batch_size))
+                    if not batch:
+                        break
+
+                    last_key = batch[-1]["key"]
+                    for row in batch:
+                        yield row["key"]
+
+                    if len(batch) < batch_size:
+                        break
+        except Exception as e:
+            logger.error(f"❌ Failed to iterate resolved link keys: {e}")
+
+    async def upsert_frontier_candidates(self, candidates: List[FrontierCandidate]) -> Dict[str, int]:
+        """درج دسته‌ای کاندیدهای کشف شده به عنوان گروه حل نشده یا افزایش اولویت کاندید موجود"""
+        counts = {"inserted": 0, "updated": 0}
+        try:
+            if self.conn is None or not candidates:
+                return counts
+
+            now = datetime.utcnow()
+            insert_sql = f"INSERT INTO groups ({', '.join(GROUP_COLUMNS)}) VALUES ({', '.join('?' * len(GROUP_COLUMNS))})"
+
+            def upsert():
+                updated = 0
+                with self.conn:
+                    for candidate in candidates:
+                        cursor = self.conn.execute(
+                            "UPDATE groups SET priority = COALESCE(priority, 0) + ?, "
+                            "discovery_count = COALESCE(discovery_count, 0) + ?, updated_at = ? "
+                            "WHERE link_key = ? AND chat_id IS NULL",
+                            (candidate.score, candidate.sightings, now.isoformat(), candidate.link_key)
+                        )
+                        if cursor.rowcount:
+                            updated += 1
+                            continue
+
+                        data = GroupInfo(
+                            chat_id=None,
+                            username=candidate.username,
+                            link=candidate.link,
+                            link_key=candidate.link_key,
+                            is_public=candidate.is_public,
+                            priority=candidate.score,
+                            discovery_count=candidate.sightings,
+                            created_at=now,
+                            updated_at=now
+                        ).to_dict()
+                        self.conn.execute(insert_sql, tuple(_to_db(data.get(column)) for column in GROUP_COLUMNS))
+                return updated
+
+            counts["updated"] = await self._run(upsert)
+            counts["inserted"] = len(candidates) - counts["updated"]
+            return counts
+
+        except Exception as e:
+            logger.error(f"❌ Failed to upsert frontier candidates: {e}")
+            return counts
+
+    async def get_frontier_candidates(self, limit: int = 0, due_at: datetime = None) -> List[GroupRef]:
+        """کاندیدهای حل نشده آماده اسکن به ترتیب اولویت"""
+        try:
+            if self.conn is None:
+                return []
+
+            conditions, params = ["chat_id IS NULL", "priority > 0"], []
+            if due_at is not None:
+                conditions.append("(next_scan_at IS NULL OR next_scan_at <= ?)")
+                params.append(due_at.isoformat())
+
+            fields = [field for field in GroupRef.PROJECTION if field in GROUP_COLUMNS]
+            rows = await self._run(
+                self._query,
+                f"SELECT {', '.join(fields)} FROM groups WHERE {' AND '.join(conditions)} "
+                f"ORDER BY priority DESC, id LIMIT ?",
+                tuple(params) + (limit or -1,)
+            )
+
+            candidates = []
+            for row in rows:
+                data = {field: row[field] for field in fields}
+                data["is_public"] = bool(data["is_public"])
+                for field in ("last_scan_time", "next_scan_at"):
+                    data[field] = _from_db_datetime(data[field])
+                candidates.append(GroupRef.from_dict(data))
+            return candidates
+
+        except Exception as e:
+            logger.error(f"❌ Failed to get frontier candidates: {e}")
+            return []
+
+    async def get_redirect(self, url: str) -> Optional[Dict[str, Any]]:
+        """دریافت نتیجه کش شده حل یک لینک (اگر منقضی نشده باشد)"""
+        try:
+            if self.conn is None:
+                return None
+
+            rows = await self._run(
+                self._query,
+                "SELECT outcome, target, resolved_at, expires_at FROM redirect_cache WHERE url = ? AND expires_at > ?",
+                (url, datetime.utcnow().isoformat())
+            )
+            if not rows:
+                return None
+
+            row = rows[0]
+            return {
+                "outcome": row["outcome"],
+                "target": row["target"],
+                "resolved_at": _from_db_datetime(row["resolved_at"]),
+                "expires_at": _from_db_datetime(row["expires_at"])
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Failed to read redirect cache for {url}: {e}")
+            return None
+
+    async def save_redirect(self, url: str, outcome: str, target: Optional[str], ttl_seconds: int) -> bool:
+        """ذخیره نتیجه حل یک لینک با مدت اعتبار مشخص"""
+        try:
+            if self.conn is None:
+                return False
+
+            now = datetime.utcnow()
+
+            def upsert():
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO redirect_cache (url, outcome, target, resolved_at, expires_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (url, outcome, target, now.isoformat(), (now + timedelta(seconds=ttl_seconds)).isoformat())
+                    )
+
+            await self._run(upsert)
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Failed to save redirect cache for {url}: {e}")
+            return False
+
+    async def get_invite(self, invite_hash: str) -> Optional[Dict[str, Any]]:
+        """دریافت نتیجه کش شده بررسی یک لینک دعوت (اگر منقضی نشده باشد)"""
+        try:
+            if self.conn is None:
+                return None
+
+            rows = await self._run(
+                self._query,
+                "SELECT info FROM invite_cache WHERE invite_hash = ? AND expires_at > ?",
+                (invite_hash, datetime.utcnow().isoformat())
+            )
+            return json.loads(rows[0]["info"]) if rows else None
+
+        except Exception as e:
+            logger.error(f"❌ Failed to read invite cache for {invite_hash}: {e}")
+            return None
+
+    async def save_invite(self, invite_hash: str, info: Dict[str, Any], ttl_seconds: int) -> bool:
+        """ذخیره نتیجه بررسی یک لینک دعوت با مدت اعتبار مشخص"""
+        try:
+            if self.conn is None:
+                return False
+
+            now = datetime.utcnow()
+
+            def upsert():
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO invite_cache (invite_hash, info, checked_at, expires_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (invite_hash, json.dumps(info, default=_json_default), now.isoformat(),
+                         (now + timedelta(seconds=ttl_seconds)).isoformat())
+                    )
+
+            await self._run(upsert)
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Failed to save invite cache for {invite_hash}: {e}")
+            return False
+
+    # ---------- کاربران ----------
+
+    def _existing_user_ids(self, user_ids: List[int]) -> set:
+        """user_idهای موجود از یک لیست"""
+        existing = set()
+        for chunk_start in range(0, len(user_ids), SQLITE_IN_CHUNK_SIZE):
+            chunk = user_ids[chunk_start:chunk_start + SQLITE_IN_CHUNK_SIZE]
+            rows = self.conn.execute(
+                f"SELECT user_id FROM users WHERE user_id IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            existing.update(row["user_id"] for row in rows)
+        return existing
+
+    async def save_user_id(self, user_id: int) -> bool:
+        """ذخیره user_id"""
+        counts = await self.bulk_upsert_user_ids([user_id])
+        return bool(counts["inserted"] or counts["updated"])
+
+    async def bulk_upsert_user_ids(self, user_ids: List[int], seen_at: datetime = None) -> Dict[str, int]:
+        """upsert دسته‌ای کاربران در یک تراکنش"""
+        counts = {"inserted": 0, "updated": 0}
+        try:
+            if self.conn is None:
+                logger.error("❌ SQLite not connected")
+                return counts
+
+            unique_ids = list(dict.fromkeys(user_ids))
+            if not unique_ids:
+                return counts
+
+            seen = (seen_at or datetime.utcnow()).isoformat()
+
+            def upsert():
+                with self.conn:
+                    existing = self._existing_user_ids(unique_ids)
+                    self.conn.executemany(
+                        "INSERT INTO users (user_id, first_seen, last_seen) VALUES (?, ?, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET last_seen = MAX(COALESCE(last_seen, ''), excluded.last_seen)",
+                        [(user_id, seen, seen) for user_id in unique_ids]
+                    )
+                return len(existing)
+
+            updated = await self._run(upsert)
+            counts["updated"] = updated
+            counts["inserted"] = len(unique_ids) - updated
+            return counts
+
+        except Exception as e:
+            logger.error(f"❌ Failed to upsert users: {e}")
+            return counts
+
+    async def bulk_upsert_user_profiles(self, profiles: List[Dict[str, Any]], seen_at: datetime = None) -> Dict[str, int]:
+        """upsert دسته‌ای پروفایل کامل کاربران (usernames/names/group_ids به صورت مجموعه)"""
+        counts = {"inserted": 0, "updated": 0}
+        try:
+            if self.conn is None:
+                logger.error("❌ SQLite not connected")
+                return counts
+
+            if not profiles:
+                return counts
+
+            seen = (seen_at or datetime.utcnow()).isoformat()
+
+            def upsert():
+                with self.conn:
+                    user_ids = [profile["user_id"] for profile in profiles]
+                    current_sets = {}
+                    for chunk_start in range(0, len(user_ids), SQLITE_IN_CHUNK_SIZE):
+                        chunk = user_ids[chunk_start:chunk_start + SQLITE_IN_CHUNK_SIZE]
+                        rows = self.conn.execute(
+                            f"SELECT user_id, usernames, names, group_ids FROM users "
+                            f"WHERE user_id IN ({', '.join('?' * len(chunk))})", chunk
+                        ).fetchall()
+                        for row in rows:
+                            current_sets[row["user_id"]] = {
+                                field: json.loads(row[field]) if row[field] else [] for field in USER_SET_FIELDS
+                            }
+
+                    rows_to_write = []
+                    for profile in profiles:
+                        sets = current_sets.get(profile["user_id"], {field: [] for field in USER_SET_FIELDS})
+                        new_values = {
+                            "usernames": [e["username"] for e in profile.get("username_history", []) if e.get("username")],
+                            "names": [e["name"] for e in profile.get("name_history", []) if e.get("name")],
+                            "group_ids": [g["group_id"] for g in profile.get("joined_groups", []) if g.get("group_id")]
+                        }
+                        merged = {
+                            field: sets[field] + [value for value in dict.fromkeys(new_values[field]) if value not in sets[field]]
+                            for field in USER_SET_FIELDS
+                        }
+                        rows_to_write.append(
+                            (profile["user_id"], seen, seen)
+                            + tuple(_to_db(profile.get(field)) for field in USER_PROFILE_FIELDS)
+                            + tuple(json.dumps(merged[field], ensure_ascii=False) for field in USER_SET_FIELDS)
+                        )
+
+                    columns = ("user_id", "first_seen", "last_seen") + USER_PROFILE_FIELDS + USER_SET_FIELDS
+                    updates = ", ".join(
+                        [f"{field} = COALESCE(excluded.{field}, {field})" for field in USER_PROFILE_FIELDS]
+                        + [f"{field} = excluded.{field}" for field in USER_SET_FIELDS]
+                        + ["last_seen = MAX(COALESCE(last_seen, ''), excluded.last_seen)"]
+                    )
+                    self.conn.executemany(
+                        f"INSERT INTO users ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                        f"ON CONFLICT(user_id) DO UPDATE SET {updates}",
+                        rows_to_write
+                    )
+                return len(current_sets)
+
+            updated = await self._run(upsert)
+            counts["updated"] = updated
+            counts["inserted"] = len({profile["user_id"] for profile in profiles}) - updated
+            logger.info(f"✅ Upserted {len(profiles)} user profiles ({counts['inserted']} new, {counts['updated']} updated)")
+            return counts
+
+        except Exception as e:
+            logger.error(f"❌ Failed to upsert user profiles: {e}")
+            return counts
+
+    async def get_user_count(self) -> int:
+        """دریافت تعداد کل کاربران"""
+        try:
+            if self.conn is None:
+                return 0
+            rows = await self._run(self._query, "SELECT COUNT(*) AS count FROM users")
+            return rows[0]["count"]
+        except Exception as e:
+            logger.error(f"❌ Failed to get user count: {e}")
+            return 0
+
+    async def get_recent_users(self, hours: int = 24) -> List[int]:
+        """دریافت کاربرانی که در ساعات اخیر دیده شده‌اند"""
+        try:
+            if self.conn is None:
+                return []
+            cutoff_time = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+            rows = await self._run(
+                self._query,
+                "SELECT user_id FROM users WHERE last_seen >= ? ORDER BY last_seen DESC", (cutoff_time,)
+            )
+            return [row["user_id"] for row in rows]
+        except Exception as e:
+            logger.error(f"❌ Failed to get recent users: {e}")
+            return []
+
+    async def get_user_stats(self, use_cache: bool = True) -> Dict[str, Any]:
+        """دریافت آمار کاربران با یک کوئری"""
+        try:
+            if self.conn is None:
+                return {}
+
+            now = datetime.utcnow()
+            today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            week_ago = now - timedelta(days=7)
+
+            rows = await self._run(self._query, """
+                SELECT
+                    (SELECT COUNT(*) FROM users) AS total_users,
+                    (SELECT COUNT(*) FROM users WHERE first_seen >= ?) AS today_new_users,
+                    (SELECT COUNT(*) FROM users WHERE first_seen >= ?) AS week_new_users
+            """, (today.isoformat(), week_ago.isoformat()))
+            return {key: rows[0][key] for key in rows[0].keys()}
+
+        except Exception as e:
+            logger.error(f"❌ Failed to get user stats: {e}")
+            return {}
+
+    async def get_user_document(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """دریافت سند کامل کاربر"""
+        try:
+            if self.conn is None:
+                return None
+            rows = await self._run(self._query, "SELECT * FROM users WHERE user_id = ?", (user_id,))
+            return self._row_to_user(rows[0]) if rows else None
+        except Exception as e:
+            logger.error(f"❌ Failed to get user {user_id}: {e}")
+            return None
+
+    async def get_users_with_final_json(self) -> List[Dict[str, Any]]:
+        """دریافت کاربرانی که فایل JSON نهایی دارند (جدیدترین در ابتدا)"""
+        try:
+            if self.conn is None:
+                return []
+            rows = await self._run(
+                self._query,
+                "SELECT * FROM users WHERE final_json_filename IS NOT NULL ORDER BY final_json_updated DESC"
+            )
+            return [self._row_to_user(row) for row in rows]
+        except Exception as e:
+            logger.error(f"❌ Failed to get users with final JSON: {e}")
+            return []
+
+    async def save_user_final_json_filename(self, user_id: int, filename: str) -> bool:
+        """ذخیره نام فایل JSON نهایی کاربر"""
+        try:
+            if self.conn is None:
+                logger.error("❌ SQLite not connected")
+                return False
+
+            now = datetime.utcnow().isoformat()
+
+            def save():
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT INTO users (user_id, first_seen, last_seen, final_json_filename, final_json_updated) "
+                        "VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+                        "final_json_filename = excluded.final_json_filename, "
+                        "final_json_updated = excluded.final_json_updated, last_seen = excluded.last_seen",
+                        (user_id, now, now, filename, now)
+                    )
+
+            await self._run(save)
+            logger.info(f"✅ Saved final JSON filename for user {user_id}: {filename}")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Failed to save final JSON filename for user {user_id}: {e}")
+            return False
+
+    async def get_user_final_json_filename(self, user_id: int) -> Optional[str]:
+        """دریافت نام فایل JSON نهایی کاربر"""
+        try:
+            if self.conn is None:
+                return None
+            rows = await self._run(self._query, "SELECT final_json_filename FROM users WHERE user_id = ?", (user_id,))
+            return rows[0]["final_json_filename"] if rows else None
+        except Exception as e:
+            logger.error(f"❌ Failed to get final JSON filename for user {user_id}: {e}")
+            return None
+
+    async def update_user_final_json_info(self, user_id: int, filename: str, message_count: int = 0) -> bool:
+        """به‌روزرسانی اطلاعات فایل JSON نهایی کاربر"""
+        updated = await self.update_multiple_user_final_json_info([
+            {"user_id": user_id, "filename": filename, "message_count": message_count}
+        ])
+        if updated:
+            logger.info(f"✅ Updated final JSON info for user {user_id}: {filename} ({message_count} messages)")
+        return bool(updated)
+
+    async def update_multiple_user_final_json_info(self, records: List[Dict[str, Any]]) -> int:
+        """به‌روزرسانی دسته‌ای اطلاعات فایل‌های JSON نهایی (user_id, filename, message_count)"""
+        try:
+            if self.conn is None:
+                logger.error("❌ SQLite not connected")
+                return 0
+
+            if not records:
+                return 0
+
+            now = datetime.utcnow().isoformat()
+            rows = [
+                (record["user_id"], now, now, record["filename"], now, record.get("message_count", 0))
+                for record in records
+            ]
+
+            def save():
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT INTO users (user_id, first_seen, last_seen, final_json_filename, final_json_updated, "
+                        "final_json_message_count) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+                        "final_json_filename = excluded.final_json_filename, "
+                        "final_json_updated = excluded.final_json_updated, "
+                        "final_json_message_count = excluded.final_json_message_count, "
+                        "last_seen = excluded.last_seen",
+                        rows
+                    )
+
+            await self._run(save)
+            return len(rows)
+
+        except Exception as e:
+            logger.error(f"❌ Failed to update final JSON info in bulk: {e}")
+            return 0
+
+    # ---------- پیام‌ها ----------
+
+    async def save_messages(self, messages: List[Dict[str, Any]]) -> Dict[str, int]:
+        """upsert دسته‌ای پیام‌ها با کلید (group_id, message_id) در یک تراکنش"""
+        counts = {"inserted": 0, "updated": 0}
+        try:
+            if self.conn is None:
+                logger.error("❌ SQLite not connected")
+                return counts
+
+            if not messages:
+                return counts
+
+            rows = [
+                (
+                    message["group_id"], message["message_id"], message.get("user_id"),
+                    _to_db(message.get("date")),
+                    json.dumps(message, ensure_ascii=False, default=_json_default)
+                )
+                for message in messages
+            ]
+
+            def save():
+                with self.conn:
+                    before = self.conn.total_changes
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO messages (group_id, message_id, user_id, date, document) "
+                        "VALUES (?, ?, ?, ?, ?)", rows
+                    )
+                    inserted = self.conn.total_changes - before
+                    self.conn.executemany(
+                        "UPDATE messages SET user_id = ?, date = ?, document = ? WHERE group_id = ? AND message_id = ?",
+                        [(row[2], row[3], row[4], row[0], row[1]) for row in rows]
+                    )
+                return inserted
+
+            inserted = await self._run(save)
+            counts["inserted"] = inserted
+            counts["updated"] = len(rows) - inserted
+            logger.info(f"✅ Saved {len(messages)} messages ({counts['inserted']} new, {counts['updated']} updated)")
+            return counts
+
+        except Exception as e:
+            logger.error(f"❌ Failed to save messages: {e}")
+            return counts
+
+    @staticmethod
+    def _row_to_message(row: sqlite3.Row) -> Dict[str, Any]:
+        """تبدیل ردیف messages به سند پیام"""
+        message = json.loads(row["document"])
+        if message.get("date"):
+            message["date"] = _from_db_datetime(message["date"])
+        return message
+
+    async def get_user_messages(self, user_id: int, group_id: int = None, limit: int = 0) -> List[Dict[str, Any]]:
+        """دریافت پیام‌های یک کاربر به ترتیب زمان"""
+        try:
+            if self.conn is None:
+                return []
+
+            sql, params = "SELECT document FROM messages WHERE user_id = ?", [user_id]
+            if group_id is not None:
+                sql += " AND group_id = ?"
+                params.append(group_id)
+            sql += " ORDER BY date"
+            if limit:
+                sql += " LIMIT ?"
+                params.append(limit)
+
+            rows = await self._run(self._query, sql, tuple(params))
+            return [self._row_to_message(row) for row in rows]
+
+        except Exception as e:
+            logger.error(f"❌ Failed to get messages for user {user_id}: {e}")
+            return []
+
+    async def get_group_messages(self, group_id: int, since: datetime = None, limit: int = 0) -> List[Dict[str, Any]]:
+        """دریافت پیام‌های یک گروه از یک زمان به بعد"""
+        try:
+            if self.conn is None:
+                return []
+
+            sql, params = "SELECT document FROM messages WHERE group_id = ?", [group_id]
+            if since is not None:
+                sql += " AND date >= ?"
+                params.append(since.isoformat())
+            sql += " ORDER BY date"
+            if limit:
+                sql += " LIMIT ?"
+                params.append(limit)
+
+            rows = await self._run(self._query, sql, tuple(params))
+            return [self._row_to_message(row) for row in rows]
+
+        except Exception as e:
+            logger.error(f"❌ Failed to get messages for group {group_id}: {e}")
+            return []
+
+    # ---------- ایندکس فایل‌های JSON کاربران ----------
+
+    async def save_user_file_entries(self, entries: List[Dict[str, Any]]) -> int:
+        """ذخیره دسته‌ای ورودی‌های ایندکس فایل‌های کاربران"""
+        try:
+            if self.conn is None:
+                logger.error("❌ SQLite not connected")
+                return 0
+
+            if not entries:
+                return 0
+
+            rows = [
+                (
+                    entry["chat_id"], entry["message_id"], entry.get("user_id"),
+                    _to_db(entry.get("timestamp")),
+                    json.dumps(entry, ensure_ascii=False, default=_json_default)
+                )
+                for entry in entries
+            ]
+
+            def save():
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT INTO user_files (chat_id, message_id, user_id, timestamp, entry) VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT(chat_id, message_id) DO UPDATE SET user_id = excluded.user_id, "
+                        "timestamp = excluded.timestamp, entry = excluded.entry",
+                        rows
+                    )
+
+            await self._run(save)
+            logger.debug(f"✅ Indexed {len(rows)} user files")
+            return len(rows)
+
+        except Exception as e:
+            logger.error(f"❌ Failed to save user file entries: {e}")
+            return 0
+
+    @staticmethod
+    def _row_to_user_file(row: sqlite3.Row) -> Dict[str, Any]:
+        """تبدیل ردیف user_files به ورودی ایندکس (فیلدهای تاریخ به datetime برمی‌گردند)"""
+        entry = json.loads(row["entry"])
+        for field in ("timestamp", "date"):
+            if entry.get(field):
+                entry[field] = _from_db_datetime(entry[field])
+        return entry
+
+    async def get_user_file_entries(self, user_id: int, chat_id: int) -> List[Dict[str, Any]]:
+        """دریافت فایل‌های یک کاربر از ایندکس (مرتب بر اساس timestamp)"""
+        try:
+            if self.conn is None:
+                return []
+            rows = await self._run(
+                self._query,
+                "SELECT entry FROM user_files WHERE user_id = ? AND chat_id = ? ORDER BY timestamp, message_id",
+                (user_id, chat_id)
+            )
+            return [self._row_to_user_file(row) for row in rows]
+        except Exception as e:
+            logger.error(f"❌ Failed to get user file entries for {user_id}: {e}")
+            return []
+
+    async def get_all_user_file_entries(self, chat_id: int) -> List[Dict[str, Any]]:
+        """دریافت کل ایندکس فایل‌های یک چت مرتب بر اساس کاربر"""
+        try:
+            if self.conn is None:
+                return []
+            rows = await self._run(
+                self._query,
+                "SELECT entry FROM user_files WHERE chat_id = ? ORDER BY user_id, timestamp",
+                (chat_id,)
+            )
+            return [self._row_to_user_file(row) for row in rows]
+        except Exception as e:
+            logger.error(f"❌ Failed to get user file entries for chat {chat_id}: {e}")
+            return []
+
+    async def get_index_position(self, name: str) -> int:
+        """دریافت بالاترین message_id ایندکس شده"""
+        try:
+            if self.conn is None:
+                return 0
+            rows = await self._run(self._query, "SELECT last_message_id FROM index_state WHERE name = ?", (name,))
+            return int(rows[0]["last_message_id"]) if rows else 0
+        except Exception as e:
+            logger.error(f"❌ Failed to get index position for {name}: {e}")
+            return 0
+
+    async def set_index_position(self, name: str, last_message_id: int) -> bool:
+        """ذخیره بالاترین message_id ایندکس شده"""
+        try:
+            if self.conn is None:
+                return False
+
+            def save():
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT INTO index_state (name, last_message_id, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET "
+                        "last_message_id = MAX(last_message_id, excluded.last_message_id), "
+                        "updated_at = excluded.updated_at",
+                        (name, last_message_id, datetime.utcnow().isoformat())
+                    )
+
+            await self._run(save)
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Failed to set index position for {name}: {e}")
+            return False
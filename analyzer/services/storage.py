@@ -0,0 +1,61 @@
+import asyncio
+from typing import Optional
+
+from config.settings import STORAGE_CONFIG
+from utils.logger import logger
+from .storage_backend import StorageBackend
+
+# سرویس SQLite مشترک در سطح پروسه (MongoDB سرویس مشترک خودش را دارد)
+_sqlite_service: Optional[StorageBackend] = None
+_sqlite_lock = asyncio.Lock()
+
+async def get_storage_service() -> StorageBackend:
+    """دریافت backend ذخیره‌سازی انتخاب شده در تنظیمات (STORAGE_BACKEND)"""
+    global _sqlite_service
+
+    if STORAGE_CONFIG.backend == 'sqlite':
+        if _sqlite_service is not None and _sqlite_service.is_connected:
+            return _sqlite_service
+
+        async with _sqlite_lock:
+            if _sqlite_service is None or not _sqlite_service.is_connected:
+                # import تنبل تا در حالت SQLite نیازی به pymongo نباشد
+                from .sqlite_service import SQLiteService
+                _sqlite_service = SQLiteService()
+                await _sqlite_service.connect()
+            return _sqlite_service
+
+    from .mongo_service import get_mongo_service
+    return await get_mongo_service()
+
+async def close_storage_service():
+    """بستن backend ذخیره‌سازی در پایان پروسه"""
+    global _sqlite_service
+
+    if STORAGE_CONFIG.backend == 'sqlite':
+        if _sqlite_service is not None:
+            await _sqlite_service.disconnect()
+            _sqlite_service = None
+        return
+
+    from .mongo_service import close_mongo_service
+    await close_mongo_service()
+
+class StorageManager:
+    """دسترسی به backend ذخیره‌سازی مشترک (چرخه عمر اتصال در اختیار این کلاس نیست)"""
+
+    async def __aenter__(self) -> StorageBackend:
+        """ورود به context manager"""
+        self.service = await get_storage_service()
+        return self.service
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """خروج از context manager (اتصال مشترک باز می‌ماند)"""
+        return False
+
+def log_storage_backend():
+    """لاگ backend انتخاب شده"""
+    if STORAGE_CONFIG.backend == 'sqlite':
+        logger.info(f"   💾 Storage backend: SQLite ({STORAGE_CONFIG.sqlite_path})")
+    else:
+        logger.info("   💾 Storage backend: MongoDB")
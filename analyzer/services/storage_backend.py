@@ -0,0 +1,247 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Optional, List, Dict, Any, AsyncIterator
+
+from models.data_models import GroupInfo, GroupRef, ChatType, ScanStatus, ExtractedLink, FrontierCandidate
+from utils.logger import logger
+
+class StorageBackend(ABC):
+    """رابط مشترک ذخیره‌سازی (MongoDB یا SQLite)"""
+
+    # نام backend برای لاگ‌ها
+    name = "storage"
+
+    # ---------- اتصال ----------
+
+    @abstractmethod
+    async def connect(self) -> bool:
+        """اتصال به backend"""
+
+    @abstractmethod
+    async def disconnect(self):
+        """بستن اتصال"""
+
+    @property
+    @abstractmethod
+    def is_connected(self) -> bool:
+        """آیا اتصال برقرار است"""
+
+    # ---------- گروه‌ها ----------
+
+    @abstractmethod
+    async def save_group_info(self, group_info: GroupInfo) -> bool:
+        """ذخیره یا به‌روزرسانی اطلاعات گروه"""
+
+    @abstractmethod
+    async def get_group_info(self, chat_id: int) -> Optional[GroupInfo]:
+        """دریافت اطلاعات گروه بر اساس chat_id"""
+
+    @abstractmethod
+    async def get_group_by_username(self, username: str) -> Optional[GroupInfo]:
+        """دریافت اطلاعات گروه بر اساس username"""
+
+    @abstractmethod
+    async def get_group_by_link_key(self, link_key: str) -> Optional[GroupInfo]:
+        """دریافت اطلاعات گروه بر اساس کلید canonical لینک"""
+
+    @abstractmethod
+    async def add_group_aliases(self, chat_id: int, aliases: List[str]) -> bool:
+        """ثبت کلید لینک‌های دیگر یک چت در رکورد گروه و حذف رکوردهای موقت آنها"""
+
+    @abstractmethod
+    async def get_groups_by_status(self, status: ScanStatus) -> List[GroupInfo]:
+        """دریافت گروه‌ها بر اساس وضعیت اسکن"""
+
+    @abstractmethod
+    async def get_groups_by_type(self, chat_type: ChatType) -> List[GroupInfo]:
+        """دریافت گروه‌ها بر اساس نوع چت"""
+
+    @abstractmethod
+    async def get_recent_scans(self, hours: int = 24) -> List[GroupInfo]:
+        """دریافت گروه‌هایی که در ساعات اخیر اسکن شده‌اند"""
+
+    @abstractmethod
+    async def get_all_groups(self) -> List[GroupInfo]:
+        """دریافت تمام گروه‌ها"""
+
+    @abstractmethod
+    def iter_groups(self, due_at: datetime = None, chat_type: ChatType = None,
+                    status: ScanStatus = None, is_public: bool = None,
+                    projection: Dict[str, Any] = None, batch_size: int = 500) -> AsyncIterator[GroupRef]:
+        """پیمایش جریانی گروه‌ها به صورت GroupRef"""
+
+    @abstractmethod
+    async def backfill_next_scan_at(self, interval_minutes: int) -> int:
+        """محاسبه next_scan_at برای گروه‌های قدیمی"""
+
+    @abstractmethod
+    async def delete_group(self, chat_id: int) -> bool:
+        """حذف گروه"""
+
+    @abstractmethod
+    async def cleanup_old_records(self, days: int = 30) -> int:
+        """پاک کردن رکوردهای قدیمی"""
+
+    @abstractmethod
+    async def get_stats(self, use_cache: bool = True) -> Dict[str, Any]:
+        """دریافت آمار کلی گروه‌ها"""
+
+    @abstractmethod
+    async def record_scan(self, chat_id: Optional[int], link: str, status: ScanStatus,
+                          message_count: int = 0, last_message_id: Optional[int] = None,
+                          duration_seconds: float = 0.0) -> bool:
+        """ثبت یک اسکن در سابقه اسکن‌ها"""
+
+    # ---------- رجیستری لینک‌ها ----------
+
+    @abstractmethod
+    async def register_links(self, links: List[ExtractedLink], seen_at: datetime = None) -> Dict[str, int]:
+        """ثبت دسته‌ای لینک‌ها در رجیستری با کلید canonical (هر چت یک رکورد)"""
+
+    @abstractmethod
+    async def get_registered_link(self, link_key: str) -> Optional[Dict[str, Any]]:
+        """دریافت رکورد رجیستری یک کلید"""
+
+    @abstractmethod
+    async def set_link_chat_id(self, link_key: str, chat_id: int) -> bool:
+        """اتصال کلید لینک به chat_id پس از حل شدن"""
+
+    @abstractmethod
+    def iter_resolved_link_keys(self, batch_size: int = 5000) -> AsyncIterator[str]:
+        """پیمایش کلید لینک همه چت‌هایی که به chat_id حل شده‌اند (برای ساخت seen-set صف کشف)"""
+
+    # ---------- صف کشف ----------
+
+    @abstractmethod
+    async def upsert_frontier_candidates(self, candidates: List[FrontierCandidate]) -> Dict[str, int]:
+        """درج دسته‌ای کاندیدهای کشف شده به عنوان گروه حل نشده یا افزایش اولویت کاندید موجود"""
+
+    @abstractmethod
+    async def get_frontier_candidates(self, limit: int = 0, due_at: datetime = None) -> List[GroupRef]:
+        """کاندیدهای حل نشده آماده اسکن به ترتیب اولویت"""
+
+    # ---------- کش ریدایرکت ----------
+
+    @abstractmethod
+    async def get_redirect(self, url: str) -> Optional[Dict[str, Any]]:
+        """دریافت نتیجه کش شده حل یک لینک (اگر منقضی نشده باشد)"""
+
+    @abstractmethod
+    async def save_redirect(self, url: str, outcome: str, target: Optional[str], ttl_seconds: int) -> bool:
+        """ذخیره نتیجه حل یک لینک با مدت اعتبار مشخص"""
+
+    # ---------- کش لینک‌های دعوت ----------
+
+    @abstractmethod
+    async def get_invite(self, invite_hash: str) -> Optional[Dict[str, Any]]:
+        """دریافت نتیجه کش شده بررسی یک لینک دعوت (اگر منقضی نشده باشد)"""
+
+    @abstractmethod
+    async def save_invite(self, invite_hash: str, info: Dict[str, Any], ttl_seconds: int) -> bool:
+        """ذخیره نتیجه بررسی یک لینک دعوت با مدت اعتبار مشخص"""
+
+    async def get_failed_scans(self) -> List[GroupInfo]:
+        """دریافت گروه‌هایی که اسکن آنها ناموفق بوده"""
+        return await self.get_groups_by_status(ScanStatus.FAILED)
+
+    async def get_successful_scans(self) -> List[GroupInfo]:
+        """دریافت گروه‌هایی که اسکن آنها موفق بوده"""
+        return await self.get_groups_by_status(ScanStatus.SUCCESS)
+
+    # ---------- کاربران ----------
+
+    @abstractmethod
+    async def save_user_id(self, user_id: int) -> bool:
+        """ذخیره user_id"""
+
+    @abstractmethod
+    async def bulk_upsert_user_ids(self, user_ids: List[int], seen_at: datetime = None) -> Dict[str, int]:
+        """upsert دسته‌ای کاربران؛ خروجی شامل تعداد درج و به‌روزرسانی است"""
+
+    @abstractmethod
+    async def bulk_upsert_user_profiles(self, profiles: List[Dict[str, Any]], seen_at: datetime = None) -> Dict[str, int]:
+        """upsert دسته‌ای پروفایل کامل کاربران"""
+
+    @abstractmethod
+    async def get_user_count(self) -> int:
+        """دریافت تعداد کل کاربران"""
+
+    @abstractmethod
+    async def get_recent_users(self, hours: int = 24) -> List[int]:
+        """دریافت کاربرانی که در ساعات اخیر دیده شده‌اند"""
+
+    @abstractmethod
+    async def get_user_stats(self, use_cache: bool = True) -> Dict[str, Any]:
+        """دریافت آمار کاربران"""
+
+    @abstractmethod
+    async def get_user_document(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """دریافت سند کامل کاربر"""
+
+    @abstractmethod
+    async def get_users_with_final_json(self) -> List[Dict[str, Any]]:
+        """دریافت کاربرانی که فایل JSON نهایی دارند (جدیدترین در ابتدا)"""
+
+    @abstractmethod
+    async def save_user_final_json_filename(self, user_id: int, filename: str) -> bool:
+        """ذخیره نام فایل JSON نهایی کاربر"""
+
+    @abstractmethod
+    async def get_user_final_json_filename(self, user_id: int) -> Optional[str]:
+        """دریافت نام فایل JSON نهایی کاربر"""
+
+    @abstractmethod
+    async def update_user_final_json_info(self, user_id: int, filename: str, message_count: int = 0) -> bool:
+        """به‌روزرسانی اطلاعات فایل JSON نهایی کاربر"""
+
+    @abstractmethod
+    async def update_multiple_user_final_json_info(self, records: List[Dict[str, Any]]) -> int:
+        """به‌روزرسانی دسته‌ای اطلاعات فایل‌های JSON نهایی"""
+
+    async def save_multiple_user_ids(self, user_ids: List[int]) -> int:
+        """ذخیره چندین user_id به صورت بهینه"""
+        if not user_ids:
+            return 0
+
+        counts = await self.bulk_upsert_user_ids(user_ids)
+        saved_count = counts["inserted"] + counts["updated"]
+        if saved_count:
+            logger.info(f"✅ Saved {saved_count} users to {self.name} ({counts['inserted']} new, {counts['updated']} updated)")
+
+        return saved_count
+
+    # ---------- پیام‌ها ----------
+
+    @abstractmethod
+    async def save_messages(self, messages: List[Dict[str, Any]]) -> Dict[str, int]:
+        """upsert دسته‌ای پیام‌ها با کلید (group_id, message_id)"""
+
+    @abstractmethod
+    async def get_user_messages(self, user_id: int, group_id: int = None, limit: int = 0) -> List[Dict[str, Any]]:
+        """دریافت پیام‌های یک کاربر به ترتیب زمان"""
+
+    @abstractmethod
+    async def get_group_messages(self, group_id: int, since: datetime = None, limit: int = 0) -> List[Dict[str, Any]]:
+        """دریافت پیام‌های یک گروه از یک زمان به بعد"""
+
+    # ---------- ایندکس فایل‌های JSON کاربران ----------
+
+    @abstractmethod
+    async def save_user_file_entries(self, entries: List[Dict[str, Any]]) -> int:
+        """ذخیره دسته‌ای ورودی‌های ایندکس فایل‌های کاربران؛ خروجی تعداد ورودی‌های ذخیره شده (در خطا کمتر از len(entries))"""
+
+    @abstractmethod
+    async def get_user_file_entries(self, user_id: int, chat_id: int) -> List[Dict[str, Any]]:
+        """دریافت فایل‌های یک کاربر از ایندکس"""
+
+    @abstractmethod
+    async def get_all_user_file_entries(self, chat_id: int) -> List[Dict[str, Any]]:
+        """دریافت کل ایندکس فایل‌های یک چت مرتب بر اساس کاربر"""
+
+    @abstractmethod
+    async def get_index_position(self, name: str) -> int:
+        """دریافت بالاترین message_id ایندکس شده"""
+
+    @abstractmethod
+    async def set_index_position(self, name: str, last_message_id: int) -> bool:
+        """ذخیره بالاترین message_id ایندکس شده"""
@@ -1,9 +1,35 @@
 import asyncio
-from typing import Optional, List
+from typing import Any, AsyncIterator, Callable, Optional, List
 from pyrogram import Client
 from pyrogram.errors import FloodWait, ChatAdminRequired, ChannelPrivate
-from config.settings import TelegramConfig, MESSAGE_SETTINGS, MEMBER_SETTINGS, FILTER_SETTINGS
+from config.settings import TelegramConfig, MESSAGE_SETTINGS, MEMBER_SETTINGS, FILTER_SETTINGS, RATE_LIMIT_SETTINGS
+from models.data_models import ChatType
 from utils.logger import logger
+from utils.rate_limiter import RateLimiter, get_rate_limiter
+
+# تعداد آیتم هر درخواست pyrogram؛ پیش از هر صفحه یک توکن از limiter مشترک گرفته می‌شود
+HISTORY_PAGE_SIZE = 100
+MEMBERS_PAGE_SIZE = 200
+
+def telegram_rate_limiter() -> RateLimiter:
+    """limiter مشترک همه درخواست‌های API تلگرام در این پروسه"""
+    return get_rate_limiter(
+        "telegram", RATE_LIMIT_SETTINGS.telegram_per_second, RATE_LIMIT_SETTINGS.telegram_burst
+    )
+
+# انواع چتی که پیام‌ها و اعضایشان اسکن می‌شوند
+GROUP_CHAT_TYPES = (ChatType.GROUP, ChatType.SUPERGROUP)
+
+def get_chat_type(chat) -> ChatType:
+    """تبدیل نوع چت pyrogram به ChatType (گفتگو با ربات هم چت خصوصی است)"""
+    chat_type = str(getattr(chat, 'type', ''))
+    if chat_type == 'ChatType.CHANNEL':
+        return ChatType.CHANNEL
+    if chat_type == 'ChatType.SUPERGROUP':
+        return ChatType.SUPERGROUP
+    if chat_type in ('ChatType.PRIVATE', 'ChatType.BOT'):
+        return ChatType.PRIVATE
+    return ChatType.GROUP
 
 class TelegramClientManager:
     """مدیریت کلاینت تلگرام"""
@@ -76,13 +102,14 @@ class TelegramClientManager:
             logger.info(f"🔍 Gettin info for: {username}")
             
             # بررسی لینک‌های خصوصی
-            if username.startswith('joinchat/'):
-                logger.info(f"🔐 Private invite link detected: {username}")
-                # برای لینک‌های خصوصی، از لینک کامل استفاده کن
-                chat = await self.client.get_chat(chat_link)
-            else:
-                # برای لینک‌های عمومی
-                chat = await self.client.get_chat(username)
+            async with telegram_rate_limiter():
+                if username.startswith('joinchat/'):
+                    logger.info(f"🔐 Private invite link detected: {username}")
+                    # برای لینک‌های خصوصی، از لینک کامل استفاده کن
+                    chat = await self.client.get_chat(chat_link)
+                else:
+                    # برای لینک‌های عمومی
+                    chat = await self.client.get_chat(username)
             
             logger.info(f"✅ Found chat: {chat.title} (ID: {chat.id}, Members: {getattr(chat, 'members_count', 'N/A')})")
             return chat
@@ -92,7 +119,7 @@ class TelegramClientManager:
             return None
         except FloodWait as e:
             logger.warning(f"⏳ Rate limit hit, waiting {e.value} seconds...")
-            await asyncio.sleep(e.value)
+            telegram_rate_limiter().pause(e.value)
             return await self.get_chat_info(chat_link)
         except Exception as e:
             logger.error(f"❌ Error getting chat info for {chat_link}: {e}")
@@ -147,8 +174,55 @@ class TelegramClientManager:
             logger.error(f"❌ Error extracting username from {chat_link}: {e}")
             return chat_link
     
-    async def get_chat_messages(self, chat_id, limit: int = None):
-        """دریافت پیام‌های چت به صورت batch"""
+    async def _paced(self, items: AsyncIterator, page_size: int) -> AsyncIterator:
+        """پیمایش نتایج صفحه‌بندی شده pyrogram با گرفتن توکن limiter پیش از درخواست هر صفحه"""
+        limiter = telegram_rate_limiter()
+        iterator = items.__aiter__()
+        fetched = 0
+        while True:
+            if fetched % page_size == 0:
+                await limiter.acquire()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            fetched += 1
+            yield item
+    
+    async def get_history_page(self, chat_id, limit: int = HISTORY_PAGE_SIZE) -> List:
+        """دریافت جدیدترین صفحه تاریخچه چت با یک درخواست"""
+        limit = min(limit, HISTORY_PAGE_SIZE)
+        if limit <= 0:
+            return []
+        try:
+            return [message async for message in self._paced(self.client.get_chat_history(chat_id, limit=limit), HISTORY_PAGE_SIZE)]
+        except FloodWait as e:
+            logger.warning(f"⏳ Rate limit hit, waiting {e.value} seconds...")
+            telegram_rate_limiter().pause(e.value)
+            return await self.get_history_page(chat_id, limit)
+        except Exception as e:
+            logger.error(f"❌ Error getting history page: {e}")
+            return []
+    
+    async def _history(self, chat_id, limit: int, first_page: Optional[List] = None) -> AsyncIterator:
+        """تاریخچه چت از جدید به قدیم؛ صفحه اول از پیش دریافت شده دوباره درخواست نمی‌شود"""
+        if first_page:
+            for message in first_page[:limit]:
+                yield message
+            # صفحه ناقص یعنی تاریخچه تمام شده است
+            if len(first_page) >= limit or len(first_page) < HISTORY_PAGE_SIZE:
+                return
+            history = self.client.get_chat_history(
+                chat_id, limit=limit - len(first_page), offset_id=first_page[-1].id
+            )
+        else:
+            history = self.client.get_chat_history(chat_id, limit=limit)
+        
+        async for message in self._paced(history, HISTORY_PAGE_SIZE):
+            yield message
+    
+    async def get_chat_messages(self, chat_id, limit: int = None, first_page: Optional[List] = None):
+        """دریافت پیام‌های چت به صورت batch (first_page: صفحه اول پیش‌بارگذاری شده)"""
         try:
             limit = limit or MESSAGE_SETTINGS.limit
             batch_size = MESSAGE_SETTINGS.batch_size
@@ -163,7 +237,7 @@ class TelegramClientManager:
             messages = []
             collected = 0
             
-            async for message in self.client.get_chat_history(chat_id, limit=limit):
+            async for message in self._history(chat_id, limit, first_page):
                 # فیلتر کردن پیام‌های اسکن
                 should_skip = False
                 if message.text and FILTER_SETTINGS.filter_scan_messages:
@@ -194,14 +268,14 @@ class TelegramClientManager:
             
         except FloodWait as e:
             logger.warning(f"⏳ Rate limit hit, waiting {e.value} seconds...")
-            await asyncio.sleep(e.value)
-            return await self.get_chat_messages(chat_id, limit)
+            telegram_rate_limiter().pause(e.value)
+            return await self.get_chat_messages(chat_id, limit, first_page)
         except Exception as e:
             logger.error(f"❌ Error getting messages: {e}")
             return []
     
-    async def get_chat_members(self, chat_id):
-        """دریافت اعضای چت"""
+    async def get_chat_members(self, chat_id, on_member: Optional[Callable[[Any], None]] = None):
+        """دریافت اعضای چت (on_member هر عضو را همان لحظه دریافت می‌کند)"""
         members = []
         
         if not MEMBER_SETTINGS.get_members:
@@ -219,13 +293,15 @@ class TelegramClientManager:
             user_ids_to_save = []  # لیست user_id ها برای ذخیره در دیتابیس
             
             try:
-                async for member in self.client.get_chat_members(chat_id):
+                async for member in self._paced(self.client.get_chat_members(chat_id), MEMBERS_PAGE_SIZE):
                     # فیلتر کردن بات‌ها اگر نیاز باشد
                     if not include_bots and getattr(member.user, 'is_bot', False):
                         continue
                     
                     members.append(member)
                     collected += 1
+                    if on_member:
+                        on_member(member)
                     
                     # اضافه کردن user_id به لیست برای ذخیره در دیتابیس
                     if hasattr(member.user, 'id') and member.user.id:
@@ -243,9 +319,9 @@ class TelegramClientManager:
                 # ذخیره user_id ها در دیتابیس
                 if user_ids_to_save:
                     try:
-                        from services.mongo_service import MongoServiceManager
-                        async with MongoServiceManager() as mongo_service:
-                            saved_count = await mongo_service.save_multiple_user_ids(user_ids_to_save)
+                        from services.storage import StorageManager
+                        async with StorageManager() as storage:
+                            saved_count = await storage.save_multiple_user_ids(user_ids_to_save)
                             if saved_count > 0:
                                 logger.info(f"💾 Saved {saved_count} user IDs to database")
                     except Exception as e:
@@ -261,13 +337,14 @@ class TelegramClientManager:
             
         except FloodWait as e:
             logger.warning(f"⏳ Rate limit hit for members, waiting {e.value} seconds...")
-            await asyncio.sleep(e.value)
-            return await self.get_chat_members(chat_id)
+            telegram_rate_limiter().pause(e.value)
+            return await self.get_chat_members(chat_id, on_member)
         except Exception as e:
             logger.error(f"❌ Error getting chat members: {e}")
             return members
     
-    async def get_chat_members_basic(self, chat_id, limit: int = 1000):
+    async def get_chat_members_basic(self, chat_id, limit: int = 1000,
+                                     on_member: Optional[Callable[[Any], None]] = None):
         """دریافت اعضای چت به روش پایه (برای چت‌هایی که دسترسی کامل ندارند)"""
         try:
             logger.info(f"👥 Getting basic member info from chat {chat_id}...")
@@ -277,11 +354,13 @@ class TelegramClientManager:
             user_ids_to_save = []  # لیست user_id ها برای ذخیره در دیتابیس
             
             # دریافت کاربران از پیام‌های اخیر
-            async for message in self.client.get_chat_history(chat_id, limit=limit):
+            async for message in self._paced(self.client.get_chat_history(chat_id, limit=limit), HISTORY_PAGE_SIZE):
                 if message.from_user and message.from_user.id not in user_ids:
                     members.append(message.from_user)
                     user_ids.add(message.from_user.id)
                     user_ids_to_save.append(message.from_user.id)
+                    if on_member:
+                        on_member(message.from_user)
                     
                     if len(members) % 50 == 0:
                         logger.info(f"👥 Found {len(members)} unique users from messages...")
@@ -289,9 +368,9 @@ class TelegramClientManager:
             # ذخیره user_id ها در دیتابیس
             if user_ids_to_save:
                 try:
-                    from services.mongo_service import MongoServiceManager
-                    async with MongoServiceManager() as mongo_service:
-                        saved_count = await mongo_service.save_multiple_user_ids(user_ids_to_save)
+                    from services.storage import StorageManager
+                    async with StorageManager() as storage:
+                        saved_count = await storage.save_multiple_user_ids(user_ids_to_save)
                         if saved_count > 0:
                             logger.info(f"💾 Saved {saved_count} user IDs from messages to database")
                 except Exception as e:
@@ -304,6 +383,31 @@ class TelegramClientManager:
             logger.error(f"❌ Error getting basic member info: {e}")
             return []
     
+    async def _get_members_with_fallback(self, chat_id, on_member: Optional[Callable[[Any], None]] = None):
+        """لیست کامل اعضا، یا در صورت خطا کاربران پیام‌های اخیر"""
+        if not MEMBER_SETTINGS.get_members:
+            return []
+        try:
+            # ابتدا سعی کنید لیست کامل اعضا را دریافت کنید
+            return await self.get_chat_members(chat_id, on_member)
+        except Exception:
+            # اگر نتوانستید، از پیام‌ها اطلاعات کاربران را استخراج کنید
+            logger.info("🔄 Falling back to extracting users from messages...")
+            return await self.get_chat_members_basic(chat_id, MESSAGE_SETTINGS.limit, on_member)
+    
+    async def get_chat_contents(self, chat_id, on_member: Optional[Callable[[Any], None]] = None,
+                                first_page: Optional[List] = None):
+        """دریافت همزمان پیام‌ها و اعضای چتی که نوع آن قبلاً بررسی شده است
+        
+        هر دو زیر limiter مشترک تلگرام اجرا می‌شوند، پس زمان اسکن تقریباً برابر کندترین آنهاست نه مجموعشان.
+        on_member هر عضو را در حین دریافت می‌گیرد تا پردازش اعضا با دریافت پیام‌ها همپوشانی داشته باشد.
+        """
+        messages, members = await asyncio.gather(
+            self.get_chat_messages(chat_id, first_page=first_page),
+            self._get_members_with_fallback(chat_id, on_member)
+        )
+        return messages, members
+    
     async def analyze_chat_complete(self, chat_link: str):
         """تحلیل کامل چت (پیام‌ها + اعضا)"""
         try:
@@ -312,20 +416,7 @@ class TelegramClientManager:
             if not chat:
                 return None, [], []
             
-            # دریافت پیام‌ها
-            messages = await self.get_chat_messages(chat.id)
-            
-            # دریافت اعضا
-            members = []
-            if MEMBER_SETTINGS.get_members:
-                try:
-                    # ابتدا سعی کنید لیست کامل اعضا را دریافت کنید
-                    members = await self.get_chat_members(chat.id)
-                except:
-                    # اگر نتوانستید، از پیام‌ها اطلاعات کاربران را استخراج کنید
-                    logger.info("� Falling back to extracting users from messages...")
-                    members = await self.get_chat_members_basic(chat.id, MESSAGE_SETTINGS.limit)
-            
+            messages, members = await self.get_chat_contents(chat.id)
             return chat, messages, members
             
         except Exception as e:
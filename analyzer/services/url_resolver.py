@@ -1,22 +1,63 @@
 import aiohttp
 import asyncio
-from typing import Optional, Dict, List
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Tuple
 from urllib.parse import urlparse, urljoin
 import re
+from config.settings import REDIRECT_CACHE_SETTINGS, RESOLVER_SETTINGS
 from utils.logger import logger
+from .redirect_rules import RedirectDecoder, redirect_decoder
+from .storage_backend import StorageBackend
+
+# نتیجه‌های ممکن حل یک لینک (هر کدام مدت اعتبار جداگانه در کش دارند)
+REDIRECT_TELEGRAM = "telegram"
+REDIRECT_NON_TELEGRAM = "non_telegram"
+REDIRECT_FAILED = "failed"
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# وضعیت‌هایی که پس از HEAD باید با GET دوباره امتحان شوند
+HEAD_RETRY_STATUSES = (400, 403, 404, 405, 501)
+# وضعیت‌هایی که نشان می‌دهد host اصلاً HEAD را پشتیبانی نمی‌کند
+HEAD_UNSUPPORTED_STATUSES = (405, 501)
 
 class URLResolver:
     """کلاس حل کردن URL ها و بررسی ریدایرکت‌ها"""
     
-    def __init__(self, timeout: int = 10, max_redirects: int = 5):
+    def __init__(self, timeout: int = 10, max_redirects: int = 5, storage: Optional[StorageBackend] = None,
+                 max_concurrency: int = None, per_host_limit: int = None, host_delay_seconds: float = None,
+                 decoder: Optional[RedirectDecoder] = None):
         self.timeout = timeout
         self.max_redirects = max_redirects
         self.session: Optional[aiohttp.ClientSession] = None
-        self.redirect_cache: Dict[str, str] = {}
+        # لینک‌های پوششی شناخته شده بدون درخواست HTTP باز می‌شوند
+        self.decoder = decoder or redirect_decoder
+        self.offline_decodes = 0
+        # محدودیت همزمانی کلی، همزمانی هر host و فاصله بین درخواست‌های یک host
+        self.max_concurrency = max_concurrency or RESOLVER_SETTINGS.max_concurrency
+        self.per_host_limit = per_host_limit or RESOLVER_SETTINGS.per_host_limit
+        self.host_delay_seconds = RESOLVER_SETTINGS.host_delay_seconds if host_delay_seconds is None else host_delay_seconds
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._host_next_request: Dict[str, float] = {}
+        self._head_unsupported_hosts: set = set()
+        # کش حافظه جلوی کش ماندگار storage (بین اجراها مشترک است)
+        self.storage = storage
+        self.redirect_cache: Dict[str, Optional[str]] = {}
+        self.redirect_expiry: Dict[str, datetime] = {}
+        self.cache_hits = 0
+        self.http_requests = 0
         
     async def __aenter__(self):
-        """شروع session"""
+        """شروع session (اتصال‌های keep-alive بین درخواست‌ها و لینک‌ها دوباره استفاده می‌شوند)"""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
         self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=self.per_host_limit,
+                ttl_dns_cache=300
+            ),
             timeout=aiohttp.ClientTimeout(total=self.timeout),
             headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -33,9 +74,9 @@ class URLResolver:
         """بررسی اینکه آیا URL یک لینک تلگرام است"""
         # بررسی اینکه آیا URL مستقیماً لینک تلگرام است (نه شامل آن)
         telegram_direct_patterns = [
-            r'^https?://t\.me/[a-zA-Z0-9_/]+$',
-            r'^https?://telegram\.me/[a-zA-Z0-9_/]+$',
-            r'^https?://web\.telegram\.org/[a-zA-Z0-9_/]+$',
+            r'^https?://t\.me/[a-zA-Z0-9_/+\-]+$',
+            r'^https?://telegram\.me/[a-zA-Z0-9_/+\-]+$',
+            r'^https?://web\.telegram\.org/[a-zA-Z0-9_/+\-]+$',
             r'^@[a-zA-Z0-9_]{5,}$',  # username format
             r'^\+[0-9]{10,}$',  # phone number format
         ]
@@ -48,9 +89,9 @@ class URLResolver:
     def extract_telegram_link(self, url: str) -> Optional[str]:
         """استخراج لینک تلگرام از URL"""
         telegram_patterns = [
-            r'(https?://t\.me/[a-zA-Z0-9_/]+)',
-            r'(https?://telegram\.me/[a-zA-Z0-9_/]+)',
-            r'(https?://web\.telegram\.org/[a-zA-Z0-9_/]+)',
+            r'(https?://t\.me/[a-zA-Z0-9_/+\-]+)',
+            r'(https?://telegram\.me/[a-zA-Z0-9_/+\-]+)',
+            r'(https?://web\.telegram\.org/[a-zA-Z0-9_/+\-]+)',
             r'(@[a-zA-Z0-9_]{5,})',  # username format
             r'(\+[0-9]{10,})',  # phone number format
         ]
@@ -61,51 +102,143 @@ class URLResolver:
                 return match.group(1)
         return None
     
+    def _outcome_ttl(self, outcome: str) -> int:
+        """مدت اعتبار کش هر نتیجه بر حسب ثانیه"""
+        if outcome == REDIRECT_TELEGRAM:
+            return REDIRECT_CACHE_SETTINGS.telegram_ttl_hours * 3600
+        if outcome == REDIRECT_NON_TELEGRAM:
+            return REDIRECT_CACHE_SETTINGS.non_telegram_ttl_hours * 3600
+        return REDIRECT_CACHE_SETTINGS.failed_ttl_minutes * 60
+    
+    def _remember(self, url: str, target: Optional[str], expires_at: Optional[datetime] = None):
+        """ذخیره نتیجه در کش حافظه (بدون expires_at یعنی نتیجه قطعی و بدون انقضا)"""
+        self.redirect_cache[url] = target
+        if expires_at is not None:
+            self.redirect_expiry[url] = expires_at
+    
+    async def _lookup_cache(self, url: str) -> Tuple[bool, Optional[str]]:
+        """جستجوی نتیجه در کش حافظه و سپس کش ماندگار؛ خروجی (یافت شد، مقصد)"""
+        if url in self.redirect_cache:
+            expires_at = self.redirect_expiry.get(url)
+            if expires_at is None or expires_at > datetime.utcnow():
+                return True, self.redirect_cache[url]
+            del self.redirect_cache[url]
+            del self.redirect_expiry[url]
+        
+        if self.storage is not None:
+            cached = await self.storage.get_redirect(url)
+            if cached:
+                self._remember(url, cached.get("target"), cached.get("expires_at"))
+                return True, cached.get("target")
+        
+        return False, None
+    
+    async def _store_result(self, url: str, outcome: str, target: Optional[str]):
+        """ذخیره نتیجه حل لینک در کش حافظه و کش ماندگار با مدت اعتبار نتیجه"""
+        ttl_seconds = self._outcome_ttl(outcome)
+        if ttl_seconds <= 0:
+            return
+        
+        self._remember(url, target, datetime.utcnow() + timedelta(seconds=ttl_seconds))
+        if self.storage is not None:
+            await self.storage.save_redirect(url, outcome, target, ttl_seconds)
+    
     async def resolve_url(self, url: str) -> Optional[str]:
         """حل کردن URL و بررسی ریدایرکت‌ها"""
         if not self.session:
             logger.error("❌ Session not initialized. Use async context manager.")
             return None
         
-        # اگر قبلاً حل شده، از cache استفاده کن
-        if url in self.redirect_cache:
-            return self.redirect_cache[url]
-        
         try:
-            logger.info(f"🔍 Resolving URL: {url}")
-            
             # ابتدا بررسی کنیم که آیا URL شامل لینک تلگرام است
             extracted_telegram = self.extract_telegram_link(url)
             if extracted_telegram:
                 logger.info(f"✅ Found Telegram link in URL: {url} -> {extracted_telegram}")
-                self.redirect_cache[url] = extracted_telegram
+                self._remember(url, extracted_telegram)
                 return extracted_telegram
             
             # اگر URL از قبل لینک تلگرام است، نیازی به حل کردن نیست
             if self.is_telegram_link(url):
                 logger.info(f"✅ Already a Telegram link: {url}")
-                self.redirect_cache[url] = url
+                self._remember(url, url)
                 return url
             
-            # حل کردن URL
-            final_url = await self._follow_redirects(url)
+            # لینک‌های پوششی (ترجمه گوگل، فیسبوک، AMP، پارامترهای encode شده) به صورت آفلاین باز می‌شوند
+            follow_url = url
+            decoded_url = self.decoder.decode(url)
+            if decoded_url:
+                decoded_telegram = self.extract_telegram_link(decoded_url)
+                if decoded_telegram:
+                    logger.info(f"🧩 Decoded Telegram link offline: {url} -> {decoded_telegram}")
+                    self.offline_decodes += 1
+                    self._remember(url, decoded_telegram)
+                    return decoded_telegram
+                follow_url = decoded_url
+            
+            # اگر قبلاً حل شده (در همین اجرا یا اجراهای قبلی)، بدون درخواست HTTP از کش استفاده کن
+            found, cached_target = await self._lookup_cache(url)
+            if found:
+                self.cache_hits += 1
+                logger.debug(f"💾 Redirect cache hit: {url} -> {cached_target}")
+                return cached_target if cached_target and self.is_telegram_link(cached_target) else None
+            
+            logger.info(f"🔍 Resolving URL: {follow_url}")
+            
+            # حل کردن URL (فقط کوتاه‌کننده‌های مبهم به این مرحله می‌رسند)
+            final_url = await self._follow_redirects(follow_url)
             
             if final_url and self.is_telegram_link(final_url):
                 logger.info(f"✅ Redirect resolved to Telegram: {url} -> {final_url}")
-                self.redirect_cache[url] = final_url
+                await self._store_result(url, REDIRECT_TELEGRAM, final_url)
                 return final_url
             elif final_url:
                 logger.warning(f"⚠️ Redirect not to Telegram: {url} -> {final_url}")
-                self.redirect_cache[url] = final_url
+                await self._store_result(url, REDIRECT_NON_TELEGRAM, final_url)
                 return None
             else:
+                # کش منفی: لینک‌های خراب تا مدت کوتاهی دوباره درخواست نمی‌شوند
                 logger.error(f"❌ Could not resolve URL: {url}")
+                await self._store_result(url, REDIRECT_FAILED, None)
                 return None
                 
         except Exception as e:
             logger.error(f"❌ Error resolving URL {url}: {e}")
             return None
     
+    @asynccontextmanager
+    async def _request_slot(self, url: str):
+        """گرفتن جایگاه درخواست: ابتدا سهم host، سپس سهم کلی و رعایت فاصله بین درخواست‌های یک host"""
+        host = urlparse(url).hostname or ''
+        host_semaphore = self._host_semaphores.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+        
+        async with host_semaphore:
+            # زمان‌بندی بدون await انجام می‌شود تا درخواست‌های همزمان یک host پشت سر هم قرار بگیرند
+            now = time.monotonic()
+            start_at = max(now, self._host_next_request.get(host, 0.0))
+            self._host_next_request[host] = start_at + self.host_delay_seconds
+            if start_at > now:
+                await asyncio.sleep(start_at - now)
+            
+            async with self._semaphore:
+                self.http_requests += 1
+                yield
+    
+    async def _request_hop(self, url: str) -> Tuple[int, Optional[str], str]:
+        """یک درخواست بدون دنبال کردن ریدایرکت: HEAD و در صورت عدم پشتیبانی GET بدون خواندن body"""
+        host = urlparse(url).hostname or ''
+        
+        if host not in self._head_unsupported_hosts:
+            async with self._request_slot(url):
+                async with self.session.head(url, allow_redirects=False) as response:
+                    if response.status not in HEAD_RETRY_STATUSES:
+                        return response.status, response.headers.get('Location'), str(response.url)
+                    if response.status in HEAD_UNSUPPORTED_STATUSES:
+                        self._head_unsupported_hosts.add(host)
+        
+        async with self._request_slot(url):
+            async with self.session.get(url, allow_redirects=False) as response:
+                return response.status, response.headers.get('Location'), str(response.url)
+    
     async def _follow_redirects(self, url: str) -> Optional[str]:
         """دنبال کردن ریدایرکت‌ها"""
         if not self.session:
@@ -118,24 +251,27 @@ class URLResolver:
             while redirect_count < self.max_redirects:
                 logger.debug(f"🔗 Following redirect {redirect_count + 1}: {current_url}")
                 
-                async with self.session.get(current_url, allow_redirects=False) as response:
-                    if response.status in [301, 302, 303, 307, 308]:
-                        # ریدایرکت
-                        redirect_url = response.headers.get('Location')
-                        if redirect_url:
-                            # تبدیل به absolute URL اگر relative باشد
-                            if not redirect_url.startswith(('http://', 'https://')):
-                                redirect_url = urljoin(current_url, redirect_url)
-                            
-                            current_url = redirect_url
-                            redirect_count += 1
-                            continue
-                        else:
-                            logger.warning(f"⚠️ Redirect status but no Location header: {current_url}")
-                            break
-                    else:
-                        # ریدایرکت تمام شد
-                        return str(response.url)
+                status, redirect_url, response_url = await self._request_hop(current_url)
+                if status not in REDIRECT_STATUSES:
+                    # ریدایرکت تمام شد
+                    return response_url
+                
+                if not redirect_url:
+                    logger.warning(f"⚠️ Redirect status but no Location header: {current_url}")
+                    return current_url
+                
+                # تبدیل به absolute URL اگر relative باشد
+                if not redirect_url.startswith(('http://', 'https://')):
+                    redirect_url = urljoin(current_url, redirect_url)
+                
+                # مقصد ریدایرکت ممکن است خودش یک لینک پوششی قابل رمزگشایی باشد
+                current_url = self.decoder.decode(redirect_url) or redirect_url
+                redirect_count += 1
+                
+                # رسیدن به لینک تلگرام کافی است؛ درخواست به خود t.me لازم نیست
+                telegram_link = self.extract_telegram_link(current_url)
+                if telegram_link and telegram_link.startswith(('http://', 'https://')):
+                    return telegram_link
             
             logger.warning(f"⚠️ Max redirects reached for: {url}")
             return current_url
@@ -153,15 +289,12 @@ class URLResolver:
             logger.error("❌ Session not initialized. Use async context manager.")
             return {}
         
-        tasks = []
-        for url in urls:
-            task = self.resolve_url(url)
-            tasks.append(task)
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # لینک‌های تکراری یک بار حل می‌شوند؛ همزمانی واقعی توسط محدودیت‌های کلی و هر host کنترل می‌شود
+        unique_urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(self.resolve_url(url) for url in unique_urls), return_exceptions=True)
         
         resolved_urls = {}
-        for url, result in zip(urls, results):
+        for url, result in zip(unique_urls, results):
             if isinstance(result, Exception):
                 logger.error(f"❌ Error resolving {url}: {result}")
                 resolved_urls[url] = None
@@ -180,5 +313,8 @@ class URLResolver:
             'total_resolved': len(self.redirect_cache),
             'telegram_redirects': telegram_redirects,
             'non_telegram_redirects': non_telegram_redirects,
-            'failed_redirects': failed_redirects
+            'failed_redirects': failed_redirects,
+            'offline_decodes': self.offline_decodes,
+            'cache_hits': self.cache_hits,
+            'http_requests': self.http_requests
         } 
\ No newline at end of file
@@ -2,21 +2,69 @@ import json
 import os
 import asyncio
 import re
+import uuid
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple
 from pyrogram import Client
 from pyrogram.errors import FloodWait, RPCError
 from config.settings import TELEGRAM_CONFIG
+from services.storage import StorageManager
+from services.file_cache import LocalFileCache
+from services.user_json_merger import StreamingUserMerger
 from utils.logger import logger
 
+# الگوهای نام فایل (یک بار کامپایل می‌شوند)
+USER_ID_PATTERNS = [re.compile(pattern) for pattern in (
+    # فایل نهایی: final_user_id_timestamp_uuid.json
+    r'^final_(\d+)_.*\.json$',
+    # الگوی اصلی: temp_user_id_group_id_timestamp_uuid.json
+    r'^temp_(\d+)_[^_]+_\d{8}_\d{6}_[a-f0-9]{8}\.json$',
+    # الگوی با group_id منفی: temp_user_id_-group_id_timestamp_uuid.json
+    r'^temp_(\d+)_-?\d+_\d{8}_\d{6}_[a-f0-9]{8}\.json$',
+    # الگوی بدون temp_: user_id_group_id_timestamp_uuid.json
+    r'^(\d+)_[^_]+_\d{8}_\d{6}_[a-f0-9]{8}\.json$',
+    # الگوی بدون temp_ و group_id منفی: user_id_-group_id_timestamp_uuid.json
+    r'^(\d+)_-?\d+_\d{8}_\d{6}_[a-f0-9]{8}\.json$',
+    # الگوی عمومی‌تر: هر فایلی که با temp_ شروع شود و user_id داشته باشد
+    r'^temp_(\d+)_[^_]*\.json$',
+    # الگوی عمومی‌تر: هر فایلی که user_id داشته باشد
+    r'^(\d+)_[^_]*\.json$',
+    # الگوی خیلی ساده: هر فایلی که با temp_ شروع شود و عدد داشته باشد
+    r'^temp_(\d+)_.*\.json$',
+    # الگوی خیلی ساده: هر فایلی که با عدد شروع شود
+    r'^(\d+)_.*\.json$'
+)]
+
+TIMESTAMP_PATTERNS = [re.compile(pattern) for pattern in (
+    # الگوی اصلی: temp_user_id_group_id_YYYYMMDD_HHMMSS_uuid.json
+    r'^temp_\d+_[^_]+_(\d{8}_\d{6})_[a-f0-9]{8}\.json$',
+    # الگوی با group_id منفی: temp_user_id_-group_id_YYYYMMDD_HHMMSS_uuid.json
+    r'^temp_\d+_-?\d+_(\d{8}_\d{6})_[a-f0-9]{8}\.json$',
+    # الگوی بدون temp_: user_id_group_id_YYYYMMDD_HHMMSS_uuid.json
+    r'^\d+_[^_]+_(\d{8}_\d{6})_[a-f0-9]{8}\.json$',
+    # الگوی بدون temp_ و group_id منفی: user_id_-group_id_YYYYMMDD_HHMMSS_uuid.json
+    r'^\d+_-?\d+_(\d{8}_\d{6})_[a-f0-9]{8}\.json$',
+    # الگوی عمومی‌تر: هر فایلی که timestamp داشته باشد
+    r'.*_(\d{8}_\d{6})_[a-f0-9]{8}\.json$'
+)]
+
+# تعداد ورودی‌های ایندکس که در هر bulk_write نوشته می‌شوند
+INDEX_BATCH_SIZE = 500
+# تعداد تلاش همگام‌سازی ایندکس پس از FloodWait
+INDEX_SYNC_ATTEMPTS = 3
+
 class UserJSONManager:
     """مدیریت فایل‌های JSON کاربران از Saved Messages"""
     
-    def __init__(self):
+    def __init__(self, download_concurrency: int = 4):
         self.api_id = TELEGRAM_CONFIG.api_id
         self.api_hash = TELEGRAM_CONFIG.api_hash
         self.session_string = TELEGRAM_CONFIG.session_string
         self.client = None
+        self.target_chat_id = None
+        self._index_synced = False
+        self._download_semaphore = asyncio.Semaphore(download_concurrency)
+        self.file_cache = LocalFileCache.from_settings()
         
     async def __aenter__(self):
         """شروع کلاینت تلگرام"""
@@ -48,34 +96,12 @@ class UserJSONManager:
     def extract_user_id_from_filename(self, filename: str) -> Optional[int]:
         """استخراج user_id از نام فایل"""
         try:
-            # الگوی ساده‌تر برای فایل‌های مختلف
-            patterns = [
-                # الگوی اصلی: temp_user_id_group_id_timestamp_uuid.json
-                r'^temp_(\d+)_[^_]+_\d{8}_\d{6}_[a-f0-9]{8}\.json$',
-                # الگوی با group_id منفی: temp_user_id_-group_id_timestamp_uuid.json
-                r'^temp_(\d+)_-?\d+_\d{8}_\d{6}_[a-f0-9]{8}\.json$',
-                # الگوی بدون temp_: user_id_group_id_timestamp_uuid.json
-                r'^(\d+)_[^_]+_\d{8}_\d{6}_[a-f0-9]{8}\.json$',
-                # الگوی بدون temp_ و group_id منفی: user_id_-group_id_timestamp_uuid.json
-                r'^(\d+)_-?\d+_\d{8}_\d{6}_[a-f0-9]{8}\.json$',
-                # الگوی عمومی‌تر: هر فایلی که با temp_ شروع شود و user_id داشته باشد
-                r'^temp_(\d+)_[^_]*\.json$',
-                # الگوی عمومی‌تر: هر فایلی که user_id داشته باشد
-                r'^(\d+)_[^_]*\.json$',
-                # الگوی خیلی ساده: هر فایلی که با temp_ شروع شود و عدد داشته باشد
-                r'^temp_(\d+)_.*\.json$',
-                # الگوی خیلی ساده: هر فایلی که با عدد شروع شود
-                r'^(\d+)_.*\.json$'
-            ]
-            
-            for pattern in patterns:
-                match = re.match(pattern, filename)
+            for pattern in USER_ID_PATTERNS:
+                match = pattern.match(filename)
                 if match:
-                    user_id = int(match.group(1))
-                    logger.info(f"✅ Extracted user_id {user_id} from {filename} using pattern: {pattern}")
-                    return user_id
+                    return int(match.group(1))
             
-            logger.info(f"❌ No pattern matched for filename: {filename}")
+            logger.debug(f"❌ No pattern matched for filename: {filename}")
             return None
         except Exception as e:
             logger.error(f"❌ Error extracting user_id from filename {filename}: {e}")
@@ -84,22 +110,8 @@ class UserJSONManager:
     def extract_timestamp_from_filename(self, filename: str) -> Optional[datetime]:
         """استخراج timestamp از نام فایل"""
         try:
-            # الگوی ساده‌تر برای timestamp
-            patterns = [
-                # الگوی اصلی: temp_user_id_group_id_YYYYMMDD_HHMMSS_uuid.json
-                r'^temp_\d+_[^_]+_(\d{8}_\d{6})_[a-f0-9]{8}\.json$',
-                # الگوی با group_id منفی: temp_user_id_-group_id_YYYYMMDD_HHMMSS_uuid.json
-                r'^temp_\d+_-?\d+_(\d{8}_\d{6})_[a-f0-9]{8}\.json$',
-                # الگوی بدون temp_: user_id_group_id_YYYYMMDD_HHMMSS_uuid.json
-                r'^\d+_[^_]+_(\d{8}_\d{6})_[a-f0-9]{8}\.json$',
-                # الگوی بدون temp_ و group_id منفی: user_id_-group_id_YYYYMMDD_HHMMSS_uuid.json
-                r'^\d+_-?\d+_(\d{8}_\d{6})_[a-f0-9]{8}\.json$',
-                # الگوی عمومی‌تر: هر فایلی که timestamp داشته باشد
-                r'.*_(\d{8}_\d{6})_[a-f0-9]{8}\.json$'
-            ]
-            
-            for pattern in patterns:
-                match = re.match(pattern, filename)
+            for pattern in TIMESTAMP_PATTERNS:
+                match = pattern.match(filename)
                 if match:
                     timestamp_str = match.group(1)
                     try:
@@ -114,51 +126,120 @@ class UserJSONManager:
             logger.error(f"❌ Error extracting timestamp from filename {filename}: {e}")
             return None
     
-    async def get_user_json_files(self, user_id: int) -> List[Dict[str, Any]]:
-        """دریافت تمام فایل‌های JSON مربوط به یک کاربر"""
+    def _index_name(self) -> str:
+        """نام وضعیت ایندکس برای چت ذخیره‌سازی فعلی"""
+        return f"user_files:{self.target_chat_id}"
+    
+    def _build_file_entry(self, message) -> Optional[Dict[str, Any]]:
+        """ساخت ورودی ایندکس از یک پیام حاوی فایل JSON"""
+        document = getattr(message, 'document', None)
+        if not document or not document.file_name or not document.file_name.endswith('.json'):
+            return None
+        
+        filename = document.file_name
+        user_id = self.extract_user_id_from_filename(filename)
+        if user_id is None:
+            return None
+        
+        return {
+            'chat_id': self.target_chat_id,
+            'message_id': message.id,
+            'user_id': user_id,
+            'filename': filename,
+            'file_id': document.file_id,
+            'file_unique_id': document.file_unique_id,
+            'file_size': document.file_size,
+            'timestamp': self.extract_timestamp_from_filename(filename),
+            'date': message.date,
+            'is_final': filename.startswith('final_')
+        }
+    
+    async def sync_file_index(self) -> int:
+        """به‌روزرسانی افزایشی ایندکس فایل‌ها از بالاترین message_id ایندکس شده (با تعداد محدود تلاش پس از FloodWait)"""
+        for attempt in range(INDEX_SYNC_ATTEMPTS):
+            try:
+                return await self._sync_file_index_once()
+            except FloodWait as e:
+                logger.warning(f"⚠️ Flood wait while syncing file index: {e.value} seconds")
+                if attempt + 1 == INDEX_SYNC_ATTEMPTS:
+                    logger.error(f"❌ File index sync gave up after {INDEX_SYNC_ATTEMPTS} attempts")
+                    return 0
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                logger.error(f"❌ Error syncing file index: {e}")
+                return 0
+        return 0
+    
+    async def _sync_file_index_once(self) -> int:
+        """یک پیمایش همگام‌سازی ایندکس (FloodWait به فراخواننده برمی‌گردد)"""
+        async with StorageManager() as storage:
+            last_indexed_id = await storage.get_index_position(self._index_name())
+            newest_message_id = last_indexed_id
+            pending = []
+            indexed_count = 0
+            complete = True
+            
+            async def save_pending():
+                nonlocal indexed_count, complete
+                saved = await storage.save_user_file_entries(pending)
+                indexed_count += saved
+                if saved != len(pending):
+                    complete = False
+            
+            # تاریخچه از جدیدترین به قدیمی‌ترین برمی‌گردد؛ با رسیدن به پیام‌های ایندکس شده متوقف می‌شویم
+            async for message in self.client.get_chat_history(self.target_chat_id):
+                if message.id <= last_indexed_id:
+                    break
+                
+                newest_message_id = max(newest_message_id, message.id)
+                entry = self._build_file_entry(message)
+                if entry:
+                    pending.append(entry)
+                
+                if len(pending) >= INDEX_BATCH_SIZE:
+                    await save_pending()
+                    pending = []
+            
+            if pending:
+                await save_pending()
+            
+            # موقعیت فقط پس از پیمایش کامل و ذخیره همه دسته‌ها جلو می‌رود تا قطع شدن یا خطای ذخیره باعث جا افتادن فایل‌ها نشود
+            if not complete:
+                logger.warning(f"⚠️ Some file index entries were not saved, keeping index position at {last_indexed_id}")
+            elif newest_message_id > last_indexed_id:
+                await storage.set_index_position(self._index_name(), newest_message_id)
+            
+            self._index_synced = True
+            logger.info(f"✅ File index synced: {indexed_count} new files (up to message {newest_message_id})")
+            return indexed_count
+    
+    async def get_user_json_files(self, user_id: int, refresh: bool = None) -> List[Dict[str, Any]]:
+        """دریافت تمام فایل‌های JSON مربوط به یک کاربر از ایندکس"""
         try:
+            # به صورت پیش‌فرض فقط یک بار در هر نشست همگام‌سازی می‌شود
+            if refresh or (refresh is None and not self._index_synced):
+                await self.sync_file_index()
+            
+            async with StorageManager() as storage:
+                entries = await storage.get_user_file_entries(user_id, self.target_chat_id)
+            
             user_files = []
-            all_files = []
-            
-            # دریافت تمام پیام‌های Saved Messages
-            async for message in self.client.get_chat_history(self.target_chat_id, limit=1000):
-                try:
-                    # بررسی اینکه آیا پیام شامل فایل است
-                    if message.document and message.document.file_name:
-                        filename = message.document.file_name
-                        all_files.append(filename)
-                        
-                        # بررسی اینکه آیا فایل مربوط به کاربر مورد نظر است
-                        file_user_id = self.extract_user_id_from_filename(filename)
-                        if file_user_id == user_id:
-                            file_info = {
-                                'message_id': message.id,
-                                'filename': filename,
-                                'file_id': message.document.file_id,
-                                'file_size': message.document.file_size,
-                                'timestamp': self.extract_timestamp_from_filename(filename),
-                                'date': message.date,
-                                'caption': None  # حذف caption برای جلوگیری از خطا
-                            }
-                            user_files.append(file_info)
-                except Exception as e:
-                    logger.warning(f"⚠️ Error processing message: {e}")
-                    continue
-            
-            # مرتب کردن بر اساس timestamp
+            for entry in entries:
+                user_files.append({
+                    'message_id': entry['message_id'],
+                    'filename': entry['filename'],
+                    'file_id': entry['file_id'],
+                    'file_unique_id': entry.get('file_unique_id'),
+                    'file_size': entry.get('file_size'),
+                    'timestamp': entry.get('timestamp'),
+                    'date': entry.get('date'),
+                    'caption': None  # حذف caption برای جلوگیری از خطا
+                })
+            
+            # فایل‌های بدون timestamp در ابتدا قرار می‌گیرند
             user_files.sort(key=lambda x: x['timestamp'] if x['timestamp'] else datetime.min)
             
             logger.info(f"✅ Found {len(user_files)} JSON files for user {user_id}")
-            
-            # نمایش فایل‌های JSON موجود برای debug
-            json_files = [f for f in all_files if f.endswith('.json')]
-            logger.info(f"📁 Total JSON files found: {len(json_files)}")
-            if json_files:
-                logger.info("📋 Sample JSON files:")
-                for filename in json_files[:5]:  # نمایش 5 فایل اول
-                    extracted_id = self.extract_user_id_from_filename(filename)
-                    logger.info(f"   - {filename} (extracted user_id: {extracted_id})")
-            
             return user_files
             
         except Exception as e:
@@ -167,242 +248,297 @@ class UserJSONManager:
             logger.error(f"❌ Traceback: {traceback.format_exc()}")
             return []
     
-    async def download_and_parse_json(self, file_id: str) -> Optional[Dict[str, Any]]:
-        """دانلود و پارس کردن فایل JSON"""
+    async def download_to_path(self, file_id: str, file_unique_id: str = None,
+                               pin: bool = False) -> Tuple[Optional[str], bool]:
+        """دانلود فایل (یا برداشتن از کش محلی)؛ خروجی: (مسیر، موقت بودن)
+        
+        pin: فایل کش تا file_cache.unpin(file_unique_id) حذف نمی‌شود
+        """
         try:
+            if file_unique_id:
+                cached_path = self.file_cache.get_path(file_unique_id, pin=pin)
+                if cached_path:
+                    logger.debug(f"📦 Cache hit: {file_unique_id}")
+                    return cached_path, False
+                
+                # دانلود مستقیم در پوشه کش
+                temp_path = self.file_cache.temp_path_for(file_unique_id)
+                downloaded = await self.client.download_media(file_id, file_name=str(temp_path))
+                
+                if not downloaded or not os.path.exists(downloaded):
+                    logger.error(f"❌ Failed to download file: {file_id}")
+                    return None, False
+                
+                cached_path = self.file_cache.put_file(file_unique_id, downloaded, pin=pin)
+                if cached_path:
+                    return cached_path, False
+                return downloaded, True
+            
             # دانلود فایل
             temp_file = await self.client.download_media(file_id)
             
             if not temp_file or not os.path.exists(temp_file):
                 logger.error(f"❌ Failed to download file: {file_id}")
+                return None, False
+            
+            return temp_file, True
+            
+        except Exception as e:
+            logger.error(f"❌ Error downloading file {file_id}: {e}")
+            return None, False
+    
+    async def download_and_parse_json(self, file_id: str, file_unique_id: str = None) -> Optional[Dict[str, Any]]:
+        """دانلود و پارس کردن فایل JSON (با استفاده از کش محلی)"""
+        try:
+            if file_unique_id:
+                cached_data = self.file_cache.get_parsed(file_unique_id)
+                if cached_data is not None:
+                    return cached_data
+            
+            path, is_temp = await self.download_to_path(file_id, file_unique_id)
+            if not path:
                 return None
             
             # خواندن و پارس کردن JSON
-            with open(temp_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # حذف فایل موقت
-            os.remove(temp_file)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            finally:
+                # حذف فایل موقت
+                if is_temp and os.path.exists(path):
+                    os.remove(path)
             
+            if file_unique_id:
+                self.file_cache.put_parsed(file_unique_id, data)
             return data
             
         except Exception as e:
             logger.error(f"❌ Error downloading/parsing JSON file: {e}")
             return None
     
-    async def merge_user_json_files(self, user_id: int) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
-        """ترکیب تمام فایل‌های JSON یک کاربر"""
+    async def _download_files(self, file_infos: List[Dict[str, Any]]) -> List[Tuple[Optional[str], bool]]:
+        """دانلود همزمان چند فایل با محدودیت همزمانی (ترتیب حفظ می‌شود)
+        
+        فایل‌های کش pin می‌شوند تا دانلودهای بعدی آنها را حذف نکنند؛ فراخواننده باید _release_files را صدا بزند.
+        """
+        async def download(file_info):
+            async with self._download_semaphore:
+                return await self.download_to_path(file_info['file_id'], file_info.get('file_unique_id'), pin=True)
+        
+        return await asyncio.gather(*(download(file_info) for file_info in file_infos))
+    
+    def _release_files(self, file_infos: List[Dict[str, Any]], downloaded: List[Tuple[Optional[str], bool]]):
+        """آزاد کردن فایل‌های کش pin شده و حذف فایل‌های موقت یک ادغام"""
+        for file_info, (path, is_temp) in zip(file_infos, downloaded):
+            if not path:
+                continue
+            if is_temp:
+                if os.path.exists(path):
+                    os.remove(path)
+            elif file_info.get('file_unique_id'):
+                self.file_cache.unpin(file_info['file_unique_id'])
+    
+    async def get_all_user_json_files(self) -> Dict[int, List[Dict[str, Any]]]:
+        """دریافت فایل‌های همه کاربران با یک پیمایش مرتب روی ایندکس"""
         try:
-            # دریافت تمام فایل‌های کاربر
-            user_files = await self.get_user_json_files(user_id)
+            if not self._index_synced:
+                await self.sync_file_index()
+            
+            async with StorageManager() as storage:
+                entries = await storage.get_all_user_file_entries(self.target_chat_id)
             
-            if not user_files:
-                logger.warning(f"⚠️ No JSON files found for user {user_id}")
-                return False, None, None
+            files_by_user: Dict[int, List[Dict[str, Any]]] = {}
+            for entry in entries:
+                files_by_user.setdefault(entry['user_id'], []).append({
+                    'message_id': entry['message_id'],
+                    'filename': entry['filename'],
+                    'file_id': entry['file_id'],
+                    'file_unique_id': entry.get('file_unique_id'),
+                    'file_size': entry.get('file_size'),
+                    'timestamp': entry.get('timestamp'),
+                    'date': entry.get('date'),
+                    'caption': None
+                })
             
-            # بررسی اینکه آیا فایل نهایی قبلاً وجود دارد
-            final_filename = None
-            final_file_data = None
+            for user_files in files_by_user.values():
+                user_files.sort(key=lambda x: x['timestamp'] if x['timestamp'] else datetime.min)
             
-            # جستجوی فایل نهایی (با پیشوند final_)
-            for file_info in user_files:
+            logger.info(f"✅ Found {len(entries)} JSON files for {len(files_by_user)} users")
+            return files_by_user
+            
+        except Exception as e:
+            logger.error(f"❌ Error getting all user JSON files: {e}")
+            return {}
+    
+    async def merge_user_json_files(self, user_id: int) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
+        """ترکیب تمام فایل‌های JSON یک کاربر"""
+        # دریافت تمام فایل‌های کاربر
+        user_files = await self.get_user_json_files(user_id)
+        
+        if not user_files:
+            logger.warning(f"⚠️ No JSON files found for user {user_id}")
+            return False, None, None
+        
+        return await self._merge_files(user_id, user_files)
+    
+    async def _merge_files(self, user_id: int, user_files: List[Dict[str, Any]]) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
+        """ترکیب جریانی لیست فایل‌های یک کاربر؛ خروجی خلاصه‌ای با مسیر فایل نهایی است"""
+        sources: List[Dict[str, Any]] = []
+        downloaded = []
+        try:
+            # جستجوی جدیدترین فایل نهایی (با پیشوند final_)
+            final_file = None
+            for file_info in reversed(user_files):
                 if file_info['filename'].startswith(f'final_{user_id}_'):
-                    final_filename = file_info['filename']
-                    final_file_data = await self.download_and_parse_json(file_info['file_id'])
+                    final_file = file_info
                     break
             
-            # اگر فایل نهایی وجود دارد، بررسی فایل‌های جدید
-            if final_file_data:
-                final_timestamp = self.extract_timestamp_from_filename(final_filename)
-                new_files = []
-                
-                for file_info in user_files:
-                    if not file_info['filename'].startswith('final_'):
-                        file_timestamp = file_info['timestamp']
-                        if file_timestamp and file_timestamp > final_timestamp:
-                            new_files.append(file_info)
+            # فقط فایل‌های جدیدتر از فایل نهایی ترکیب می‌شوند
+            if final_file:
+                final_timestamp = self.extract_timestamp_from_filename(final_file['filename'])
+                new_files = [
+                    file_info for file_info in user_files
+                    if not file_info['filename'].startswith('final_')
+                    and file_info['timestamp'] and final_timestamp
+                    and file_info['timestamp'] > final_timestamp
+                ]
                 
                 if not new_files:
                     logger.info(f"✅ No new files found for user {user_id}, returning existing final file")
-                    return True, final_file_data, final_filename
-                
-                # ترکیب فایل نهایی با فایل‌های جدید
-                merged_data = final_file_data.copy()
-                merged_messages = merged_data.get('messages', [])
-                
-                for file_info in new_files:
-                    file_data = await self.download_and_parse_json(file_info['file_id'])
-                    if file_data:
-                        new_messages = file_data.get('messages', [])
-                        merged_messages.extend(new_messages)
-                
-                merged_data['messages'] = merged_messages
-                merged_data['total_files_merged'] = len(new_files) + 1
-                merged_data['last_merge_date'] = datetime.now().isoformat()
+                    return True, {'user_id': user_id, 'output_path': None, 'total_messages': None}, final_file['filename']
                 
+                sources = [final_file] + new_files
             else:
-                # ترکیب تمام فایل‌ها
-                merged_data = {
-                    'user_id': user_id,
-                    'merge_date': datetime.now().isoformat(),
-                    'total_files_merged': len(user_files),
-                    'messages': [],
-                    'user_info': {},
-                    'groups_info': []
-                }
-                
-                # برای جلوگیری از تکرار پیام‌ها
-                seen_message_ids = set()
-                user_info_found = False
-                groups_info = {}
-                
-                # برای ترکیب تاریخچه username و name
-                username_history = {}
-                name_history = {}
-                
-                processed_files = 0
-                for file_info in user_files:
-                    # پردازش تمام فایل‌ها (نه فقط فایل‌های final_)
-                    file_data = await self.download_and_parse_json(file_info['file_id'])
-                    if file_data:
-                        # استخراج اطلاعات کاربر
-                        if not user_info_found and 'current_username' in file_data:
-                            merged_data['user_info'] = {
-                                'current_username': file_data.get('current_username'),
-                                'current_name': file_data.get('current_name'),
-                                'username_history': file_data.get('username_history', []),
-                                'name_history': file_data.get('name_history', []),
-                                'is_bot': file_data.get('is_bot', False),
-                                'is_deleted': file_data.get('is_deleted', False),
-                                'is_verified': file_data.get('is_verified', False),
-                                'is_premium': file_data.get('is_premium', False),
-                                'is_scam': file_data.get('is_scam', False),
-                                'is_fake': file_data.get('is_fake', False),
-                                'phone_number': file_data.get('phone_number'),
-                                'language_code': file_data.get('language_code'),
-                                'dc_id': file_data.get('dc_id'),
-                                'first_seen': file_data.get('first_seen'),
-                                'last_seen': file_data.get('last_seen')
-                            }
-                            user_info_found = True
-                            logger.info(f"📋 Found user info: {file_data.get('current_username', 'unknown')}")
-                        
-                        # ترکیب تاریخچه username
-                        if 'username_history' in file_data:
-                            for username_entry in file_data['username_history']:
-                                username = username_entry.get('username')
-                                changed_at = username_entry.get('changed_at')
-                                if username and changed_at:
-                                    if username not in username_history or changed_at > username_history[username]:
-                                        username_history[username] = changed_at
-                        
-                        # ترکیب تاریخچه name
-                        if 'name_history' in file_data:
-                            for name_entry in file_data['name_history']:
-                                name = name_entry.get('name')
-                                changed_at = name_entry.get('changed_at')
-                                if name and changed_at:
-                                    if name not in name_history or changed_at > name_history[name]:
-                                        name_history[name] = changed_at
-                        
-                        # استخراج اطلاعات گروه
-                        if 'group_info' in file_data:
-                            group_info = file_data['group_info']
-                            group_id = group_info.get('group_id')
-                            if group_id and group_id not in groups_info:
-                                groups_info[group_id] = group_info
-                                logger.info(f"📁 Found group info: {group_info.get('group_title', 'unknown')}")
-                        
-                        # پردازش پیام‌ها بدون تکرار
-                        messages_to_add = []
-                        if 'messages' in file_data:
-                            messages = file_data.get('messages', [])
-                        elif 'messages_in_this_group' in file_data:
-                            messages = file_data.get('messages_in_this_group', [])
-                        else:
-                            messages = []
-                        
-                        for message in messages:
-                            message_id = message.get('message_id')
-                            if message_id and message_id not in seen_message_ids:
-                                seen_message_ids.add(message_id)
-                                messages_to_add.append(message)
-                        
-                        merged_data['messages'].extend(messages_to_add)
-                        logger.info(f"📄 Added {len(messages_to_add)} unique messages from {file_info['filename']}")
-                        processed_files += 1
+                sources = [file_info for file_info in user_files if not file_info['filename'].startswith('final_')]
+            
+            # دانلود همزمان (فقط مسیرها در حافظه نگه داشته می‌شوند)
+            downloaded = await self._download_files(sources)
+            
+            with StreamingUserMerger(user_id, work_dir=self.file_cache.cache_dir) as merger:
+                for file_info, (path, _) in zip(sources, downloaded):
+                    # فایل نهایی ناقص آپلود نمی‌شود؛ با خطای هر منبع ادغام این کاربر لغو می‌شود
+                    if not path or not merger.add_source_file(path):
+                        logger.warning(f"⚠️ Could not read {file_info['filename']}, skipping merge for user {user_id}")
+                        return False, None, None
+                    logger.debug(f"📄 Added {file_info['filename']} to merge")
                 
-                # تبدیل groups_info به لیست
-                merged_data['groups_info'] = list(groups_info.values())
+                if not merger.sources:
+                    logger.warning(f"⚠️ No readable JSON files for user {user_id}")
+                    return False, None, None
                 
-                # به‌روزرسانی تاریخچه‌ها در user_info
-                if merged_data['user_info']:
-                    # تبدیل username_history به لیست
-                    username_history_list = []
-                    for username, changed_at in username_history.items():
-                        username_history_list.append({
-                            'username': username,
-                            'changed_at': changed_at
-                        })
-                    # مرتب کردن بر اساس تاریخ
-                    username_history_list.sort(key=lambda x: x['changed_at'])
-                    merged_data['user_info']['username_history'] = username_history_list
-                    
-                    # تبدیل name_history به لیست
-                    name_history_list = []
-                    for name, changed_at in name_history.items():
-                        name_history_list.append({
-                            'name': name,
-                            'changed_at': changed_at
-                        })
-                    # مرتب کردن بر اساس تاریخ
-                    name_history_list.sort(key=lambda x: x['changed_at'])
-                    merged_data['user_info']['name_history'] = name_history_list
-                    
-                    logger.info(f"📋 Combined username history: {len(username_history_list)} entries")
-                    logger.info(f"📋 Combined name history: {len(name_history_list)} entries")
+                # ایجاد نام فایل نهایی
+                current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+                unique_id = str(uuid.uuid4())[:8]
+                final_filename = f"final_{user_id}_{current_time}_{unique_id}.json"
                 
-                logger.info(f"📊 Processed {processed_files} files for user {user_id}")
-                logger.info(f"📊 Total unique messages: {len(merged_data['messages'])}")
-                logger.info(f"📊 Total groups found: {len(merged_data['groups_info'])}")
-                merged_data['total_files_merged'] = processed_files
-            
-            # ایجاد نام فایل نهایی
-            current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-            import uuid
-            unique_id = str(uuid.uuid4())[:8]
-            final_filename = f"final_{user_id}_{current_time}_{unique_id}.json"
+                # خروجی در پوشه کش نوشته می‌شود تا پس از آپلود با os.replace (بدون عبور از فایل‌سیستم) وارد کش شود
+                output_path = str(self.file_cache.temp_path_for(final_filename))
+                summary = merger.write(output_path)
             
-            logger.info(f"✅ Merged {len(merged_data.get('messages', []))} messages for user {user_id}")
-            return True, merged_data, final_filename
+            logger.info(f"✅ Merged {summary['total_messages']} messages for user {user_id}")
+            return True, summary, final_filename
             
         except Exception as e:
             logger.error(f"❌ Error merging user JSON files: {e}")
             return False, None, None
+        finally:
+            self._release_files(sources, downloaded)
     
-    async def send_final_json(self, data: Dict[str, Any], filename: str) -> bool:
-        """ارسال فایل JSON نهایی به Saved Messages"""
-        try:
-            # ایجاد فایل JSON موقت
-            temp_file_path = f"temp_{filename}"
+    async def merge_users(self, user_ids: List[int], files_by_user: Dict[int, List[Dict[str, Any]]],
+                          user_concurrency: int = 4) -> List[Tuple[int, Dict[str, Any], str, bool]]:
+        """ترکیب همزمان چند کاربر؛ خروجی: (user_id, data, filename, needs_upload)"""
+        user_semaphore = asyncio.Semaphore(user_concurrency)
+        
+        async def merge_one(user_id):
+            async with user_semaphore:
+                user_files = files_by_user.get(user_id, [])
+                success, merged_data, final_filename = await self._merge_files(user_id, user_files)
+                if not success or not merged_data:
+                    return None
+                # اگر فایل نهایی موجود بدون تغییر برگشته باشد، نیازی به آپلود دوباره نیست
+                existing_names = {file_info['filename'] for file_info in user_files}
+                return user_id, merged_data, final_filename, final_filename not in existing_names
+        
+        results = await asyncio.gather(*(merge_one(user_id) for user_id in user_ids), return_exceptions=True)
+        
+        merged = []
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Error merging user {user_id}: {result}")
+            elif result:
+                merged.append(result)
+        return merged
+    
+    async def send_final_jsons(self, items: List[Tuple[Dict[str, Any], str]]) -> List[str]:
+        """ارسال دسته‌ای فایل‌های نهایی و ثبت یکجای آن‌ها در ایندکس"""
+        sent_filenames = []
+        entries = []
+        
+        for data, filename in items:
+            sent_message = await self._upload_final_json(data, filename)
+            if not sent_message:
+                continue
             
-            with open(temp_file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+            sent_filenames.append(filename)
+            entry = self._build_file_entry(sent_message)
+            if entry:
+                entries.append(entry)
+        
+        if entries:
+            async with StorageManager() as storage:
+                await storage.save_user_file_entries(entries)
+        
+        logger.info(f"✅ Sent {len(sent_filenames)}/{len(items)} final JSON files")
+        return sent_filenames
+    
+    async def _upload_final_json(self, data: Dict[str, Any], filename: str):
+        """آپلود یک فایل نهایی و برگرداندن پیام ارسال شده"""
+        # خروجی ادغام جریانی از قبل روی دیسک است؛ در غیر این صورت فایل موقت ساخته می‌شود
+        temp_file_path = data.get('output_path') or str(self.file_cache.temp_path_for(filename))
+        
+        try:
+            if not data.get('output_path'):
+                with open(temp_file_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2, default=str)
             
             # ارسال فایل به Saved Messages
-            await self.client.send_document(
-                chat_id=self.target_chat_id,
-                document=temp_file_path,
-                caption=f"📁 Final JSON for user {data.get('user_id', 'unknown')}\n📅 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            )
+            try:
+                sent_message = await self.client.send_document(
+                    chat_id=self.target_chat_id,
+                    document=temp_file_path,
+                    file_name=filename,
+                    caption=f"📁 Final JSON for user {data.get('user_id', 'unknown')}\n📅 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                )
+            except FloodWait as e:
+                logger.warning(f"⚠️ Flood wait: {e.value} seconds")
+                await asyncio.sleep(e.value)
+                sent_message = await self.client.send_document(
+                    chat_id=self.target_chat_id,
+                    document=temp_file_path,
+                    file_name=filename,
+                    caption=f"📁 Final JSON for user {data.get('user_id', 'unknown')}\n📅 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                )
             
-            # حذف فایل موقت
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+            # فایل آپلود شده مستقیماً وارد کش می‌شود تا ادغام بعدی آن را دوباره دانلود نکند
+            document = getattr(sent_message, 'document', None)
+            if document and document.file_unique_id:
+                self.file_cache.put_file(document.file_unique_id, temp_file_path)
             
-            logger.info(f"✅ Final JSON sent: {filename}")
-            return True
+            return sent_message
             
         except Exception as e:
-            logger.error(f"❌ Error sending final JSON: {e}")
-            return False 
\ No newline at end of file
+            logger.error(f"❌ Error sending final JSON {filename}: {e}")
+            return None
+        finally:
+            # حذف فایل موقت
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+    
+    async def send_final_json(self, data: Dict[str, Any], filename: str) -> bool:
+        """ارسال فایل JSON نهایی (خلاصه ادغام با output_path یا داده کامل) به Saved Messages"""
+        sent_filenames = await self.send_final_jsons([(data, filename)])
+        if not sent_filenames:
+            return False
+        
+        logger.info(f"✅ Final JSON sent: {filename}")
+        return True
@@ -0,0 +1,230 @@
+import heapq
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from utils.logger import logger
+
+# پیشوند پوشه کاری هر ادغام (LocalFileCache باقی‌مانده‌های آن را پاک می‌کند)
+MERGE_DIR_PREFIX = 'merge_'
+
+# خط اول و آخر فایل نهایی جریانی (یک پیام در هر خط)
+MESSAGES_OPEN = '"messages": ['
+MESSAGES_CLOSE = ']'
+
+def message_sort_key(message: Dict[str, Any]) -> Tuple[str, str, int]:
+    """کلید مرتب‌سازی پیام: (group_id, timestamp, message_id)"""
+    return (
+        str(message.get('group_id') or ''),
+        str(message.get('timestamp') or ''),
+        int(message.get('message_id') or 0)
+    )
+
+def _source_messages(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """پیام‌های یک فایل منبع (فایل نهایی یا فایل اسکن)"""
+    if 'messages' in data:
+        return data.get('messages') or []
+    return data.get('messages_in_this_group') or []
+
+def read_streaming_header(path: str) -> Optional[Dict[str, Any]]:
+    """خواندن هدر فایل نهایی جریانی بدون بارگذاری پیام‌ها"""
+    with open(path, 'r', encoding='utf-8') as f:
+        first_line = f.readline().rstrip('\n')
+
+    if not first_line.endswith(MESSAGES_OPEN):
+        return None
+
+    header_text = first_line[:-len(MESSAGES_OPEN)].rstrip().rstrip(',') + '}'
+    try:
+        return json.loads(header_text)
+    except ValueError:
+        return None
+
+def iter_streaming_messages(path: str) -> Iterator[Dict[str, Any]]:
+    """پیمایش پیام‌های فایل نهایی جریانی، یک پیام در هر خط"""
+    with open(path, 'r', encoding='utf-8') as f:
+        f.readline()  # هدر
+        for line in f:
+            line = line.rstrip('\n')
+            if line.startswith(MESSAGES_CLOSE):
+                break
+            line = line.rstrip(',')
+            if line:
+                yield json.loads(line)
+
+def _iter_run(path: str) -> Iterator[Tuple[Tuple[str, str, int], Dict[str, Any]]]:
+    """پیمایش یک run مرتب روی دیسک"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            message = json.loads(line)
+            yield message_sort_key(message), message
+
+class StreamingUserMerger:
+    """ترکیب جریانی فایل‌های یک کاربر با k-way merge؛ حافظه به تعداد فایل‌ها وابسته است نه تعداد پیام‌ها"""
+
+    def __init__(self, user_id: int, work_dir: str = None):
+        self.user_id = user_id
+        self.work_dir = tempfile.mkdtemp(prefix=f"{MERGE_DIR_PREFIX}{user_id}_", dir=work_dir)
+        self.runs: List[str] = []
+        self.sources = 0
+
+        self.user_info: Dict[str, Any] = {}
+        self.groups_info: Dict[str, Dict[str, Any]] = {}
+        self.username_history: Dict[str, str] = {}
+        self.name_history: Dict[str, str] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.cleanup()
+
+    def cleanup(self):
+        """حذف فایل‌های موقت run"""
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def add_source_file(self, path: str) -> bool:
+        """افزودن یک فایل منبع از دیسک"""
+        try:
+            header = read_streaming_header(path)
+            if header is not None:
+                # فایل نهایی جریانی از قبل مرتب است و بدون بارگذاری کامل استفاده می‌شود
+                self._merge_header(header)
+                self.runs.append(path)
+                self.sources += 1
+                return True
+
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return self.add_source_data(data)
+
+        except Exception as e:
+            logger.error(f"❌ Error adding merge source {path}: {e}")
+            return False
+
+    def add_source_data(self, data: Dict[str, Any]) -> bool:
+        """افزودن یک فایل منبع پارس شده؛ پیام‌ها مرتب و در یک run روی دیسک نوشته می‌شوند"""
+        self._merge_header(data)
+
+        messages = [m for m in _source_messages(data) if m.get('message_id')]
+        messages.sort(key=message_sort_key)
+
+        run_path = os.path.join(self.work_dir, f"run_{len(self.runs):05d}.jsonl")
+        with open(run_path, 'w', encoding='utf-8') as f:
+            for message in messages:
+                f.write(json.dumps(message, ensure_ascii=False, default=str))
+                f.write('\n')
+
+        self.runs.append(run_path)
+        self.sources += 1
+        return True
+
+    def _merge_header(self, data: Dict[str, Any]):
+        """ترکیب اطلاعات کاربر، تاریخچه‌ها و گروه‌ها"""
+        user_info = data.get('user_info')
+        if not isinstance(user_info, dict) or not user_info:
+            user_info = None
+            if 'current_username' in data:
+                user_info = {
+                    'current_username': data.get('current_username'),
+                    'current_name': data.get('current_name'),
+                    'username_history': data.get('username_history', []),
+                    'name_history': data.get('name_history', []),
+                    'is_bot': data.get('is_bot', False),
+                    'is_deleted': data.get('is_deleted', False),
+                    'is_verified': data.get('is_verified', False),
+                    'is_premium': data.get('is_premium', False),
+                    'is_scam': data.get('is_scam', False),
+                    'is_fake': data.get('is_fake', False),
+                    'phone_number': data.get('phone_number'),
+                    'language_code': data.get('language_code'),
+                    'dc_id': data.get('dc_id'),
+                    'first_seen': data.get('first_seen'),
+                    'last_seen': data.get('last_seen')
+                }
+
+        if user_info:
+            if not self.user_info:
+                self.user_info = dict(user_info)
+
+            # ترکیب تاریخچه username و name
+            for entry in user_info.get('username_history') or []:
+                username, changed_at = entry.get('username'), entry.get('changed_at')
+                if username and changed_at and changed_at > self.username_history.get(username, ''):
+                    self.username_history[username] = changed_at
+            for entry in user_info.get('name_history') or []:
+                name, changed_at = entry.get('name'), entry.get('changed_at')
+                if name and changed_at and changed_at > self.name_history.get(name, ''):
+                    self.name_history[name] = changed_at
+
+        groups = list(data.get('groups_info') or [])
+        if data.get('group_info'):
+            groups.append(data['group_info'])
+        for group_info in groups:
+            group_id = group_info.get('group_id')
+            if group_id and str(group_id) not in self.groups_info:
+                self.groups_info[str(group_id)] = group_info
+
+    def _merged_messages(self) -> Iterator[Dict[str, Any]]:
+        """k-way merge روی runها با حذف تکرار؛ در تکرارها نسخه جدیدترین منبع حفظ می‌شود"""
+        streams = []
+        for run_path in self.runs:
+            if run_path.endswith('.jsonl'):
+                streams.append(_iter_run(run_path))
+            else:
+                streams.append(((message_sort_key(m), m) for m in iter_streaming_messages(run_path)))
+
+        previous_key, previous_message = None, None
+        # heapq.merge برای کلیدهای برابر ترتیب منابع را حفظ می‌کند (قدیمی به جدید)
+        for key, message in heapq.merge(*streams, key=lambda item: item[0]):
+            if key == previous_key:
+                previous_message = message
+                continue
+            if previous_message is not None:
+                yield previous_message
+            previous_key, previous_message = key, message
+
+        if previous_message is not None:
+            yield previous_message
+
+    def write(self, output_path: str) -> Dict[str, Any]:
+        """نوشتن تدریجی فایل نهایی و برگرداندن خلاصه"""
+        if self.user_info:
+            self.user_info['username_history'] = sorted(
+                ({'username': u, 'changed_at': t} for u, t in self.username_history.items()),
+                key=lambda x: x['changed_at']
+            )
+            self.user_info['name_history'] = sorted(
+                ({'name': n, 'changed_at': t} for n, t in self.name_history.items()),
+                key=lambda x: x['changed_at']
+            )
+
+        header = {
+            'user_id': self.user_id,
+            'merge_date': datetime.now().isoformat(),
+            'total_files_merged': self.sources,
+            'user_info': self.user_info,
+            'groups_info': list(self.groups_info.values())
+        }
+        header_text = json.dumps(header, ensure_ascii=False, default=str)
+
+        total_messages = 0
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(header_text[:-1] + ', ' + MESSAGES_OPEN)
+            for message in self._merged_messages():
+                f.write(',\n' if total_messages else '\n')
+                f.write(json.dumps(message, ensure_ascii=False, default=str))
+                total_messages += 1
+            f.write(f'\n{MESSAGES_CLOSE}, "total_messages": {total_messages}}}\n')
+
+        logger.info(f"📊 Merged {self.sources} files for user {self.user_id}: {total_messages} unique messages, {len(self.groups_info)} groups")
+        return {
+            'user_id': self.user_id,
+            'total_messages': total_messages,
+            'total_files_merged': self.sources,
+            'total_groups': len(self.groups_info),
+            'output_path': output_path
+        }
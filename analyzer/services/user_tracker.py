@@ -1,9 +1,9 @@
 import json
 import os
+import time
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Dict, Any, List, Optional
-from bson import ObjectId
 from config.settings import FILE_SETTINGS
 from utils.logger import logger
 from .telegram_storage import TelegramStorage
@@ -16,6 +16,10 @@ class UserTracker:
         self.user_chats: Dict[int, List[str]] = {}
         self.group_info: Dict[str, Dict[str, Any]] = {}  # اطلاعات گروه‌ها
         
+        # تغییرات این اسکن که با flush_to_database به صورت دسته‌ای ذخیره می‌شوند
+        self._dirty_users: set = set()
+        self._pending_messages: List[Dict[str, Any]] = []
+        
         # ایجاد پوشه users
         self.users_dir = Path(FILE_SETTINGS.users_dir)
         self.users_dir.mkdir(exist_ok=True)
@@ -38,8 +42,8 @@ class UserTracker:
             return ""
     
     def _generate_object_id(self) -> str:
-        """تولید ObjectId برای MongoDB"""
-        return str(ObjectId())
+        """تولید شناسه هم‌قالب ObjectId (۴ بایت زمان + ۸ بایت تصادفی) بدون وابستگی به bson/pymongo"""
+        return f"{int(time.time()):08x}{os.urandom(8).hex()}"
     
     def _get_iso_date(self, date_input=None) -> str:
         """تبدیل تاریخ به فرمت ISO"""
@@ -489,41 +493,79 @@ class UserTracker:
             else:
                 user_data['joined_groups'].append(group_entry)
             
-            # ذخیره user_id در دیتابیس
-            self._save_user_to_database(user_id)
+            # ذخیره در flush بعدی
+            self._mark_user_dirty(user_id)
                 
         except Exception as e:
             logger.error(f"❌ Error adding user to group: {e}")
     
-    def _save_user_to_database(self, user_id: int):
-        """ذخیره user_id در دیتابیس"""
+    def _mark_user_dirty(self, user_id: int):
+        """علامت‌گذاری کاربر برای ذخیره در flush بعدی"""
+        self._dirty_users.add(user_id)
+    
+    def _message_document(self, user_id: int, message_entry: Dict[str, Any]) -> Dict[str, Any]:
+        """تبدیل پیام به سند کالکشن messages"""
+        document = dict(message_entry)
+        document['user_id'] = user_id
+        
+        # group_id عددی مانند chat_id در کالکشن groups
         try:
-            # استفاده از asyncio برای اجرای async function در sync context
-            import asyncio
-            from services.mongo_service import MongoServiceManager
+            document['group_id'] = int(message_entry['group_id'])
+        except (TypeError, ValueError):
+            pass
+        
+        # زمان پیام به صورت datetime برای کوئری‌های بازه‌ای
+        try:
+            date = datetime.fromisoformat(message_entry['timestamp'])
+            if date.tzinfo is not None:
+                date = date.astimezone(timezone.utc).replace(tzinfo=None)
+            document['date'] = date
+        except (KeyError, TypeError, ValueError):
+            pass
+        
+        return document
+    
+    async def flush_to_database(self) -> Dict[str, int]:
+        """ذخیره دسته‌ای پروفایل‌ها و پیام‌های این اسکن در دیتابیس (در صورت خطا برای flush بعدی نگه داشته می‌شوند)"""
+        result = {'users': 0, 'messages': 0}
+        if not self._dirty_users and not self._pending_messages:
+            return result
+        
+        # بافرها جدا می‌شوند تا تغییرات جدید در حین ذخیره از دست نروند
+        dirty_users, self._dirty_users = self._dirty_users, set()
+        messages, self._pending_messages = self._pending_messages, []
+        users_saved = messages_saved = False
+        try:
+            from services.storage import StorageManager
             
-            async def save_user_async():
-                try:
-                    async with MongoServiceManager() as mongo_service:
-                        await mongo_service.save_user_id(user_id)
-                except Exception as e:
-                    logger.warning(f"⚠️ Failed to save user {user_id} to database: {e}")
+            profiles = [self.users[user_id] for user_id in dirty_users if user_id in self.users]
+            
+            async with StorageManager() as storage:
+                user_counts = await storage.bulk_upsert_user_profiles(profiles)
+                message_counts = await storage.save_messages(messages)
+            
+            result['users'] = user_counts['inserted'] + user_counts['updated']
+            result['messages'] = message_counts['inserted'] + message_counts['updated']
+            
+            # backendها خطا را لاگ می‌کنند و تعداد ناقص برمی‌گردانند
+            users_saved = result['users'] == len(profiles)
+            messages_saved = result['messages'] == len(messages)
+            
+            if users_saved and messages_saved:
+                logger.info(f"💾 Flushed {result['users']} users and {result['messages']} messages to database")
+            else:
+                logger.warning(f"⚠️ Partial flush ({result['users']}/{len(profiles)} users, "
+                               f"{result['messages']}/{len(messages)} messages), keeping the rest for the next flush")
+            return result
             
-            # اجرای async function در event loop موجود یا ایجاد جدید
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # اگر loop در حال اجرا است، از create_task استفاده کن
-                    loop.create_task(save_user_async())
-                else:
-                    # اگر loop در حال اجرا نیست، اجرا کن
-                    loop.run_until_complete(save_user_async())
-            except RuntimeError:
-                # اگر event loop وجود ندارد، ایجاد کن
-                asyncio.run(save_user_async())
-                
         except Exception as e:
-            logger.warning(f"⚠️ Failed to save user {user_id} to database: {e}")
+            logger.warning(f"⚠️ Failed to flush users to database: {e}")
+            return result
+        finally:
+            if not users_saved:
+                self._dirty_users |= dirty_users
+            if not messages_saved:
+                self._pending_messages = messages + self._pending_messages
     
     def _add_user_message(self, user, chat_info, message):
         """اضافه کردن پیام کاربر"""
@@ -640,6 +682,7 @@ class UserTracker:
             message_entry = {k: v for k, v in message_entry.items() if v is not None}
             
             user_data['messages'].append(message_entry)
+            self._pending_messages.append(self._message_document(user_id, message_entry))
             
             # اطمینان از وجود در گروه
             group_exists = any(g['group_id'] == chat_id for g in user_data['joined_groups'])
@@ -654,8 +697,8 @@ class UserTracker:
                 }
                 user_data['joined_groups'].append(group_entry)
             
-            # ذخیره user_id در دیتابیس
-            self._save_user_to_database(user_id)
+            # ذخیره در flush بعدی
+            self._mark_user_dirty(user_id)
                 
         except Exception as e:
             logger.error(f"❌ Error adding user message: {e}")
@@ -708,8 +751,8 @@ class UserTracker:
             
             self.users[user_id] = user_data
             
-            # ذخیره user_id در دیتابیس
-            self._save_user_to_database(user_id)
+            # ذخیره در flush بعدی
+            self._mark_user_dirty(user_id)
             
         except Exception as e:
             logger.error(f"❌ Error creating user structure: {e}")
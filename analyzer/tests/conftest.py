@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# ماژول‌ها مثل main.py از ریشه analyzer import می‌شوند
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# config.settings بدون این دو مقدار بارگذاری نمی‌شود؛ تست‌ها به تلگرام وصل نمی‌شوند
+os.environ.setdefault('API_ID', '1')
+os.environ.setdefault('API_HASH', 'test')
@@ -0,0 +1,61 @@
+import pytest
+
+from utils.bloom_filter import HEADER_SIZE, BloomFilter
+
+def test_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(capacity=2000, error_rate=0.01)
+    members = [f"@chat_{i}" for i in range(2000)]
+    assert bloom.update(members) == len(bloom)
+
+    assert all(member in bloom for member in members)
+    false_positives = sum(f"@other_{i}" in bloom for i in range(10000))
+    # نرخ اسمی 1٪ با حاشیه برای نوسان آماری
+    assert false_positives < 300
+
+def test_add_reports_new_members_and_accepts_ints():
+    bloom = BloomFilter(capacity=100)
+    assert bloom.add(12345)
+    assert not bloom.add(12345)
+    assert 12345 in bloom and "12345" in bloom
+    assert len(bloom) == 1
+
+@pytest.mark.parametrize("capacity, error_rate", [(0, 0.01), (10, 0), (10, 1)])
+def test_invalid_parameters(capacity, error_rate):
+    with pytest.raises(ValueError):
+        BloomFilter(capacity, error_rate)
+
+def test_save_and_load_round_trip(tmp_path):
+    bloom = BloomFilter(capacity=500, error_rate=0.001)
+    bloom.update(["+hash", "@name", "c:123"])
+    path = tmp_path / "seen" / "links.bloom"
+    bloom.save(path)
+
+    loaded = BloomFilter.load(path)
+    assert (loaded.num_bits, loaded.num_hashes, len(loaded)) == (bloom.num_bits, bloom.num_hashes, 3)
+    assert all(key in loaded for key in ("+hash", "@name", "c:123"))
+
+def test_open_persists_through_mmap(tmp_path):
+    path = tmp_path / "frontier.bloom"
+    with BloomFilter.open(path, capacity=1000, error_rate=0.01) as bloom:
+        assert len(bloom) == 0
+        bloom.update(["@a", "@b"])
+    assert path.stat().st_size == HEADER_SIZE + (bloom.num_bits + 7) // 8
+
+    # فایل موجود با پارامترهای خودش باز می‌شود، نه پارامترهای جدید
+    with BloomFilter.open(path, capacity=5, error_rate=0.5) as reopened:
+        assert reopened.capacity == 1000
+        assert len(reopened) == 2
+        assert "@a" in reopened and "@b" in reopened
+        reopened.add("@c")
+
+    assert "@c" in BloomFilter.load(path)
+
+def test_truncated_file_is_rejected(tmp_path):
+    path = tmp_path / "broken.bloom"
+    BloomFilter(capacity=100).save(path)
+    path.write_bytes(path.read_bytes()[:-1])
+
+    with pytest.raises(ValueError):
+        BloomFilter.load(path)
+    with pytest.raises(ValueError):
+        BloomFilter.open(path, capacity=100)
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from services import user_json_manager
+from services.file_cache import LocalFileCache
+from services.user_json_manager import UserJSONManager
+from services.user_json_merger import StreamingUserMerger
+
+def put(cache: LocalFileCache, tmp_path, key: str, size: int, pin: bool = False) -> str:
+    source = tmp_path / f"{key}.download"
+    source.write_bytes(b"x" * size)
+    return cache.put_file(key, str(source), pin=pin)
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = LocalFileCache(str(tmp_path / "cache"), max_bytes=250)
+    put(cache, tmp_path, "a", 100)
+    put(cache, tmp_path, "b", 100)
+    assert cache.get_path("a")
+    put(cache, tmp_path, "c", 100)
+
+    assert cache.get_path("b") is None
+    assert cache.get_path("a") and cache.get_path("c")
+    assert cache.get_stats()['total_bytes'] == 200
+
+def test_pinned_files_survive_eviction_until_unpinned(tmp_path):
+    cache = LocalFileCache(str(tmp_path / "cache"), max_bytes=150)
+    held = [put(cache, tmp_path, key, 100, pin=True) for key in ("a", "b", "c")]
+
+    # بیش از محدودیت، ولی هیچ فایلی که در دست استفاده است حذف نمی‌شود
+    assert all(os.path.exists(path) for path in held)
+    assert cache.get_stats()['pinned'] == 3
+
+    cache.unpin("a")
+    cache.unpin("b")
+    assert not os.path.exists(held[0]) and not os.path.exists(held[1])
+    assert os.path.exists(held[2])
+
+    cache.unpin("c")
+    assert os.path.exists(held[2])
+    assert cache.get_stats() == {
+        'files': 1, 'total_bytes': 100, 'max_bytes': 150, 'parsed_items': 0, 'pinned': 0
+    }
+
+def test_pins_are_counted(tmp_path):
+    cache = LocalFileCache(str(tmp_path / "cache"), max_bytes=50)
+    path = put(cache, tmp_path, "a", 100, pin=True)
+    assert cache.get_path("a", pin=True) == path
+
+    cache.unpin("a")
+    put(cache, tmp_path, "b", 10)
+    assert os.path.exists(path)
+
+    cache.unpin("a")
+    assert not os.path.exists(path)
+
+def test_leftovers_of_a_killed_run_are_removed_on_load(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = LocalFileCache(str(cache_dir), max_bytes=1000)
+    kept = put(cache, tmp_path, "a", 100)
+
+    # فایل نیمه‌کاره و پوشه کاری ادغامی که پاک نشده‌اند
+    (cache_dir / "b.part").write_bytes(b"x" * 10)
+    merger = StreamingUserMerger(7, work_dir=str(cache_dir))
+    (Path(merger.work_dir) / "run_00000.jsonl").write_text("{}\n", encoding='utf-8')
+    other_dir = cache_dir / "unrelated"
+    other_dir.mkdir()
+
+    reloaded = LocalFileCache(str(cache_dir), max_bytes=1000)
+
+    assert sorted(os.listdir(cache_dir)) == ["a", "unrelated"]
+    assert reloaded.get_path("a") == kept
+    assert reloaded.get_stats()['total_bytes'] == 100
+
+class FakeDownloadClient:
+    """کلاینت آزمایشی که فایل‌های منبع را با تأخیر در مسیر خواسته شده می‌نویسد"""
+
+    def __init__(self, files):
+        self.files = files
+
+    async def download_media(self, file_id, file_name=None):
+        await asyncio.sleep(0)
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(self.files[file_id], f)
+        return file_name
+
+def source_file(user_id, group_id, message_ids, padding=0):
+    return {
+        'user_id': user_id,
+        'group_info': {'group_id': group_id},
+        'messages_in_this_group': [
+            {'message_id': message_id, 'group_id': group_id, 'timestamp': f'2024-01-01T00:00:{message_id:02d}',
+             'text': 'x' * padding}
+            for message_id in message_ids
+        ]
+    }
+
+def test_merge_keeps_files_while_cache_is_over_limit(tmp_path, monkeypatch):
+    cache = LocalFileCache(str(tmp_path / "cache"), max_bytes=1)
+    monkeypatch.setattr(user_json_manager.LocalFileCache, 'from_settings', classmethod(lambda cls: cache))
+
+    files, user_files = {}, {}
+    for user_id in (1, 2):
+        user_files[user_id] = []
+        for index, group_id in enumerate((-100, -200)):
+            file_id = f"file_{user_id}_{index}"
+            files[file_id] = source_file(user_id, group_id, [index + 1, index + 2], padding=500)
+            user_files[user_id].append({
+                'file_id': file_id, 'file_unique_id': f"unique_{user_id}_{index}",
+                'filename': f"temp_{user_id}_{group_id}_20240101_00000{index}_abcdef0{index}.json",
+                'timestamp': None
+            })
+
+    async def scenario():
+        manager = UserJSONManager(download_concurrency=4)
+        manager.client = FakeDownloadClient(files)
+        return await manager.merge_users([1, 2], user_files)
+
+    merged = asyncio.run(scenario())
+
+    assert sorted(user_id for user_id, *_ in merged) == [1, 2]
+    for _, summary, _, needs_upload in merged:
+        assert needs_upload
+        assert summary['total_files_merged'] == 2
+        assert summary['total_messages'] == 4
+        os.remove(summary['output_path'])
+
+    # بعد از آزاد شدن، کش دوباره به محدودیت حجم برمی‌گردد
+    assert cache.get_stats()['pinned'] == 0
+    assert cache.get_stats()['files'] == 0
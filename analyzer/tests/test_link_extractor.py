@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import pytest
+
+from models.data_models import LinkKind
+from services.link_extractor import canonical_link_key, classify_link, extract_links
+
+@pytest.mark.parametrize("raw, kind, url", [
+    ("https://t.me/Example_Chat", LinkKind.TELEGRAM_PUBLIC, "https://t.me/example_chat"),
+    ("t.me/example_chat/123", LinkKind.TELEGRAM_PUBLIC, "https://t.me/example_chat"),
+    ("https://t.me/s/example_chat", LinkKind.TELEGRAM_PUBLIC, "https://t.me/example_chat"),
+    ("https://t.me/joinchat/AbCdEf", LinkKind.TELEGRAM_INVITE, "https://t.me/+AbCdEf"),
+    ("https://t.me/+AbCdEf", LinkKind.TELEGRAM_INVITE, "https://t.me/+AbCdEf"),
+    ("https://t.me/c/1234567/89", LinkKind.TELEGRAM_PRIVATE, "https://t.me/c/1234567"),
+    ("@Example_Chat", LinkKind.MENTION, "https://t.me/example_chat"),
+    ("https://Example.com/Path?q=1#frag", LinkKind.WEB, "https://example.com/Path?q=1"),
+    ("www.example.com).", LinkKind.WEB, "https://www.example.com/"),
+])
+def test_classify_link(raw, kind, url):
+    link = classify_link(raw)
+    assert (link.kind, link.url) == (kind, url)
+
+@pytest.mark.parametrize("raw", ["https://t.me/share/url?url=x", "https://t.me/", "https://t.me/ab", ""])
+def test_service_paths_are_not_chats(raw):
+    link = classify_link(raw)
+    assert link is None or link.kind == LinkKind.WEB
+
+def test_canonical_key_is_shared_by_every_form_of_a_link():
+    forms = ["https://t.me/Example_Chat", "t.me/example_chat/42", "telegram.me/EXAMPLE_CHAT",
+             "@example_chat", "https://t.me/example_chat?start=abc", " https://t.me/s/example_chat "]
+    assert {canonical_link_key(form) for form in forms} == {"@example_chat"}
+
+    assert canonical_link_key("https://t.me/joinchat/AbC") == canonical_link_key("t.me/+AbC") == "+AbC"
+    assert canonical_link_key("https://t.me/c/123/4") == "c:123"
+    assert canonical_link_key("https://example.com/") is None
+    assert canonical_link_key(None) is None
+
+def test_extract_links_dedupes_text_and_entities():
+    text = "Join t.me/Example_Chat or @example_chat, see https://example.com/a."
+    entities = [
+        SimpleNamespace(type="MessageEntityType.TEXT_LINK", url="https://t.me/+Hidden"),
+        SimpleNamespace(type="MessageEntityType.URL", offset=text.index("https"), length=len("https://example.com/a")),
+    ]
+
+    links = extract_links(text, entities)
+
+    assert [link.url for link in links] == [
+        "https://t.me/example_chat", "https://example.com/a", "https://t.me/+Hidden"
+    ]
+    assert links[-1].source == "entity"
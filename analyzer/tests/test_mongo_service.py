@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from services import mongo_service
+from services.mongo_service import MongoService
+
+class FakeCollection:
+    """کالکشن آزمایشی که فراخوانی‌های update_one را ثبت می‌کند"""
+
+    def __init__(self, upserted_ids=()):
+        self.upserted_ids = list(upserted_ids)
+        self.updates = []
+
+    def update_one(self, query, update, upsert=False):
+        self.updates.append((query, update))
+        upserted_id = self.upserted_ids.pop(0) if self.upserted_ids else None
+        return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=upserted_id)
+
+def test_final_json_upserts_count_new_users(monkeypatch):
+    monkeypatch.setattr(mongo_service.MONGO_CONFIG, 'materialized_stats', True)
+    service = MongoService()
+    service.users_collection = FakeCollection(upserted_ids=['new', None, 'new'])
+    service.stats_collection = FakeCollection()
+
+    async def scenario():
+        assert await service.save_user_final_json_filename(1, 'final_1.json')
+        assert await service.update_user_final_json_info(2, 'final_2.json', 10)
+        assert await service.update_user_final_json_info(3, 'final_3.json', 10)
+
+    asyncio.run(scenario())
+
+    total_increments = [update["$inc"]["total"] for query, update in service.stats_collection.updates
+                        if query == {"_id": "users"}]
+    assert total_increments == [1, 1]
+    # کاربر جدید مثل بقیه مسیرها first_seen دارد تا در آمار روزانه شمرده شود
+    assert all("first_seen" in update["$setOnInsert"] for _, update in service.users_collection.updates)
+
+def test_materialized_stats_are_recounted_periodically(monkeypatch):
+    monkeypatch.setattr(mongo_service.MONGO_CONFIG, 'stats_recount_hours', 24)
+    now = datetime.utcnow()
+
+    assert MongoService._stats_due_for_recount({"total": 5})
+    assert MongoService._stats_due_for_recount({"recounted_at": now - timedelta(hours=25)})
+    assert not MongoService._stats_due_for_recount({"recounted_at": now - timedelta(hours=1)})
+
+    monkeypatch.setattr(mongo_service.MONGO_CONFIG, 'stats_recount_hours', 0)
+    assert not MongoService._stats_due_for_recount({"total": 5})
+
+class FakeIndexCollection:
+    """کالکشن آزمایشی برای ساخت ایندکس؛ failing_field ساخت ایندکس آن فیلد را با خطا مواجه می‌کند"""
+
+    name = "fake"
+
+    def __init__(self, failing_field=None):
+        self.failing_field = failing_field
+        self.created = []
+
+    def list_indexes(self):
+        return []
+
+    def create_index(self, keys, **options):
+        if keys == self.failing_field:
+            raise RuntimeError(f"cannot index {keys}")
+        self.created.append(keys)
+
+    def update_many(self, query, update):
+        return SimpleNamespace(modified_count=0)
+
+def index_service(collection) -> MongoService:
+    service = MongoService()
+    for attribute in ('collection', 'users_collection', 'user_files_collection', 'messages_collection',
+                      'redirect_cache_collection', 'scan_journal_collection', 'link_registry_collection',
+                      'invite_cache_collection'):
+        setattr(service, attribute, collection)
+    return service
+
+def test_create_indexes_reports_failures():
+    assert asyncio.run(index_service(FakeIndexCollection())._create_indexes())
+    # خطای یک ایندکس معمولی یا سیاست انقضا
+    assert not asyncio.run(index_service(FakeIndexCollection(failing_field="username"))._create_indexes())
+    assert not asyncio.run(index_service(FakeIndexCollection(failing_field="scanned_at"))._create_indexes())
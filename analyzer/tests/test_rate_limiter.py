@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from utils.rate_limiter import RateLimiter, get_rate_limiter
+
+def elapsed(coro_factory) -> float:
+    async def scenario():
+        start = time.monotonic()
+        await coro_factory()
+        return time.monotonic() - start
+    return asyncio.run(scenario())
+
+def test_requests_are_spaced_by_rate_after_burst():
+    limiter = RateLimiter(rate=50, burst=2)
+
+    async def acquire_all():
+        for _ in range(7):
+            await limiter.acquire()
+
+    # دو درخواست اول از burst، پنج درخواست بعدی هر کدام 20ms
+    assert 0.09 <= elapsed(acquire_all) < 1.0
+
+def test_concurrent_acquires_share_the_bucket():
+    limiter = RateLimiter(rate=50)
+
+    async def acquire_concurrently():
+        await asyncio.gather(*(limiter.acquire() for _ in range(6)))
+
+    assert 0.09 <= elapsed(acquire_concurrently) < 1.0
+
+def test_zero_rate_is_unlimited_but_pause_still_applies():
+    limiter = RateLimiter(rate=0)
+
+    async def acquire_many():
+        for _ in range(1000):
+            await limiter.acquire()
+
+    assert elapsed(acquire_many) < 0.5
+
+    async def acquire_after_pause():
+        limiter.pause(0.1)
+        async with limiter:
+            pass
+
+    assert elapsed(acquire_after_pause) >= 0.09
+
+def test_pause_drains_tokens_and_keeps_the_longest_pause():
+    limiter = RateLimiter(rate=1000, burst=10)
+
+    async def acquire_after_pauses():
+        limiter.pause(0.15)
+        limiter.pause(0.01)
+        await limiter.acquire()
+
+    assert elapsed(acquire_after_pauses) >= 0.14
+
+def test_named_limiters_are_shared():
+    first = get_rate_limiter("test_shared", 5)
+    assert get_rate_limiter("test_shared", 100) is first
+    assert first.rate == 5
+    assert get_rate_limiter("test_other", 5) is not first
@@ -0,0 +1,67 @@
+from urllib.parse import quote
+
+import pytest
+
+from services.redirect_rules import RedirectDecoder, RedirectRule, decode_redirect
+
+def test_query_param_rules():
+    target = "https://t.me/example"
+    assert decode_redirect(f"https://l.facebook.com/l.php?u={quote(target, safe='')}") == target
+    assert decode_redirect(f"https://www.google.com/url?q={quote(target, safe='')}&sa=D") == target
+    assert decode_redirect(f"https://vk.com/away.php?to={quote(target, safe='')}") == target
+
+def test_nested_wrappers_are_unwrapped():
+    inner = "https://l.facebook.com/l.php?u=" + quote("https://t.me/+AbCdEf", safe='')
+    outer = "https://www.google.com/url?q=" + quote(inner, safe='')
+    assert decode_redirect(outer) == "https://t.me/+AbCdEf"
+
+def test_host_encoding_rules():
+    assert decode_redirect("https://t-me.translate.goog/example?_x_tr_sl=auto&_x_tr_tl=en") == "https://t.me/example"
+    assert decode_redirect("https://my--site-com.translate.goog/page") == "https://my-site.com/page"
+    assert decode_redirect("https://cdn.ampproject.org/c/s/example.com/post?id=1") == "https://example.com/post?id=1"
+
+def test_embedded_and_generic_rules():
+    assert decode_redirect("https://tracker.example/click/" + quote("https://t.me/example", safe='')) == "https://t.me/example"
+    assert decode_redirect("https://href.li/?https://example.com/") == "https://example.com/"
+    assert decode_redirect("https://short.example/go?goto=https%3A%2F%2Fexample.com%2Fx") == "https://example.com/x"
+
+def test_plain_links_are_not_decoded():
+    assert decode_redirect("https://t.me/example") is None
+    assert decode_redirect("https://example.com/page?id=3") is None
+    assert decode_redirect("not a url") is None
+
+class LoopRule(RedirectRule):
+    name = "loop"
+
+    def decode(self, url, parsed):
+        return "https://b.example/" if "a.example" in url else "https://a.example/"
+
+def test_decoder_stops_on_cycles_and_depth():
+    decoder = RedirectDecoder(rules=[LoopRule()])
+    assert decoder.decode("https://a.example/") == "https://b.example/"
+
+    class CountingRule(RedirectRule):
+        name = "counting"
+
+        def decode(self, url, parsed):
+            return url + "x"
+
+    assert RedirectDecoder(rules=[CountingRule()], max_depth=3).decode("https://c.example/") == "https://c.example/xxx"
+
+def test_failing_rule_is_skipped_and_custom_rules_take_priority():
+    class BrokenRule(RedirectRule):
+        name = "broken"
+
+        def decode(self, url, parsed):
+            raise ValueError("broken")
+
+    decoder = RedirectDecoder()
+    decoder.register(BrokenRule())
+    assert decoder.decode_once("https://l.facebook.com/l.php?u=https%3A%2F%2Ft.me%2Fx") == ("facebook", "https://t.me/x")
+
+def test_rule_must_implement_decode():
+    class IncompleteRule(RedirectRule):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteRule()
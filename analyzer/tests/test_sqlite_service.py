@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from models.data_models import GroupInfo
+from services.sqlite_service import SQLiteService
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def connected(tmp_path) -> SQLiteService:
+    service = SQLiteService(str(tmp_path / "test.db"))
+    assert await service.connect()
+    return service
+
+def test_user_file_entries_round_trip_datetimes(tmp_path):
+    async def scenario():
+        service = await connected(tmp_path)
+        try:
+            timestamp = datetime(2024, 5, 1, 12, 30, 15)
+            date = datetime(2024, 5, 1, 12, 31)
+            entry = {
+                'chat_id': -100, 'message_id': 7, 'user_id': 42,
+                'filename': 'user_42_20240501_123015.json', 'timestamp': timestamp, 'date': date
+            }
+            assert await service.save_user_file_entries([entry]) == 1
+
+            for entries in (await service.get_user_file_entries(42, -100),
+                            await service.get_all_user_file_entries(-100)):
+                assert len(entries) == 1
+                assert entries[0]['timestamp'] == timestamp
+                assert entries[0]['date'] == date
+                # همان مقایسه‌ای که مرتب‌سازی و ادغام فایل‌ها انجام می‌دهند
+                assert entries[0]['timestamp'] > datetime.min
+        finally:
+            await service.disconnect()
+
+    run(scenario())
+
+def test_user_file_entries_ordered_by_timestamp(tmp_path):
+    async def scenario():
+        service = await connected(tmp_path)
+        try:
+            entries = [
+                {'chat_id': -100, 'message_id': message_id, 'user_id': 42, 'timestamp': datetime(2024, 5, day)}
+                for message_id, day in ((1, 3), (2, 1), (3, 2))
+            ]
+            await service.save_user_file_entries(entries)
+            stored = await service.get_user_file_entries(42, -100)
+            assert [entry['message_id'] for entry in stored] == [2, 3, 1]
+        finally:
+            await service.disconnect()
+
+    run(scenario())
+
+def test_placeholder_group_is_merged_and_aliases_are_kept(tmp_path):
+    async def scenario():
+        service = await connected(tmp_path)
+        try:
+            assert await service.save_group_info(GroupInfo(chat_id=None, link="https://t.me/example", link_key="@example"))
+            assert (await service.get_group_by_link_key("@example")).chat_id is None
+
+            group = GroupInfo(chat_id=-1001, username="Example", link="https://t.me/example", link_key="@example")
+            assert await service.save_group_info(group)
+            assert await service.add_group_aliases(-1001, ["+invite", "@old_name"])
+
+            # ذخیره دوباره بدون aliases آنها را پاک نمی‌کند
+            group.scan_count = 3
+            assert await service.save_group_info(group)
+
+            stored = await service.get_group_by_link_key("@example")
+            assert stored.chat_id == -1001 and stored.scan_count == 3
+            assert stored.aliases == ["+invite", "@old_name"]
+            assert (await service.get_group_by_username("@example")).chat_id == -1001
+            assert len(await service.get_all_groups()) == 1
+        finally:
+            await service.disconnect()
+
+    run(scenario())
+
+def test_user_profiles_and_messages_upsert(tmp_path):
+    async def scenario():
+        service = await connected(tmp_path)
+        try:
+            first = {'user_id': 1, 'current_username': 'a', 'username_history': [{'username': 'a'}],
+                     'joined_groups': [{'group_id': -100}]}
+            second = {'user_id': 1, 'current_username': 'b', 'username_history': [{'username': 'b'}],
+                      'joined_groups': [{'group_id': -200}]}
+            assert await service.bulk_upsert_user_profiles([first]) == {'inserted': 1, 'updated': 0}
+            assert await service.bulk_upsert_user_profiles([second, {'user_id': 2}]) == {'inserted': 1, 'updated': 1}
+
+            user = await service.get_user_document(1)
+            assert user['current_username'] == 'b'
+            assert user['usernames'] == ['a', 'b'] and user['group_ids'] == [-100, -200]
+            assert await service.get_user_count() == 2
+
+            message = {'group_id': -100, 'message_id': 5, 'user_id': 1, 'date': datetime(2024, 1, 2), 'text': 'x'}
+            assert await service.save_messages([message]) == {'inserted': 1, 'updated': 0}
+            earlier = dict(message, message_id=4, date=datetime(2024, 1, 1))
+            assert await service.save_messages([dict(message, text='y'), earlier]) == {'inserted': 1, 'updated': 1}
+
+            messages = await service.get_user_messages(1)
+            assert [(m['message_id'], m['text']) for m in messages] == [(4, 'x'), (5, 'y')]
+            assert messages[0]['date'] == datetime(2024, 1, 1)
+        finally:
+            await service.disconnect()
+
+    run(scenario())
+
+def test_index_position_and_redirect_cache(tmp_path):
+    async def scenario():
+        service = await connected(tmp_path)
+        try:
+            assert await service.get_index_position("user_files:me") == 0
+            await service.set_index_position("user_files:me", 20)
+            # موقعیت فقط رو به جلو می‌رود
+            await service.set_index_position("user_files:me", 10)
+            assert await service.get_index_position("user_files:me") == 20
+
+            await service.save_redirect("https://short.example/a", "telegram", "https://t.me/x", ttl_seconds=3600)
+            await service.save_redirect("https://short.example/b", "failed", None, ttl_seconds=0)
+            cached = await service.get_redirect("https://short.example/a")
+            assert cached['target'] == "https://t.me/x"
+            assert cached['expires_at'] - cached['resolved_at'] == timedelta(hours=1)
+            assert await service.get_redirect("https://short.example/b") is None
+        finally:
+            await service.disconnect()
+
+    run(scenario())
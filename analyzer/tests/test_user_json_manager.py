@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+from services import user_json_manager
+from services.file_cache import LocalFileCache
+from services.user_json_manager import UserJSONManager
+
+class FakeDownloadClient:
+    """کلاینت آزمایشی؛ فایل‌های None دانلود نمی‌شوند و رشته‌ها همان‌طور نوشته می‌شوند"""
+
+    def __init__(self, files):
+        self.files = files
+
+    async def download_media(self, file_id, file_name=None):
+        content = self.files[file_id]
+        if content is None:
+            return None
+        with open(file_name, 'w', encoding='utf-8') as f:
+            f.write(content if isinstance(content, str) else json.dumps(content))
+        return file_name
+
+def make_manager(tmp_path, monkeypatch, files) -> UserJSONManager:
+    cache = LocalFileCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    monkeypatch.setattr(user_json_manager.LocalFileCache, 'from_settings', classmethod(lambda cls: cache))
+    manager = UserJSONManager()
+    manager.client = FakeDownloadClient(files)
+    return manager
+
+def file_info(file_id, index):
+    return {
+        'file_id': file_id, 'file_unique_id': f"unique_{file_id}",
+        'filename': f"temp_7_-100_20240101_00000{index}_abcdef0{index}.json", 'timestamp': None
+    }
+
+def scan(message_ids):
+    return {'messages_in_this_group': [
+        {'group_id': -100, 'message_id': message_id, 'timestamp': '2024-01-01T00:00:00'} for message_id in message_ids
+    ]}
+
+def test_merge_succeeds_when_every_source_is_read(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch, {'a': scan([1, 2]), 'b': scan([2, 3])})
+
+    success, summary, filename = asyncio.run(manager._merge_files(7, [file_info('a', 0), file_info('b', 1)]))
+
+    assert success and filename.startswith('final_7_')
+    assert summary['total_messages'] == 3
+    # خروجی در پوشه کش است تا آپلود بتواند آن را بدون کپی وارد کش کند
+    assert os.path.dirname(summary['output_path']) == str(manager.file_cache.cache_dir)
+    os.remove(summary['output_path'])
+
+class FakeUploadClient:
+    """کلاینت آزمایشی آپلود؛ محتوای فایل ارسالی را نگه می‌دارد"""
+
+    def __init__(self):
+        self.sent = {}
+
+    async def send_document(self, chat_id, document, file_name, caption=None):
+        with open(document, encoding='utf-8') as f:
+            self.sent[file_name] = f.read()
+        return SimpleNamespace(id=99, date=None, document=SimpleNamespace(
+            file_name=file_name, file_id="uploaded", file_unique_id="unique_uploaded", file_size=10
+        ))
+
+def test_uploaded_final_file_enters_the_cache(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch, {'a': scan([1]), 'b': scan([2])})
+    success, summary, filename = asyncio.run(manager._merge_files(7, [file_info('a', 0), file_info('b', 1)]))
+    assert success
+
+    manager.client = FakeUploadClient()
+    sent_message = asyncio.run(manager._upload_final_json(summary, filename))
+
+    assert sent_message is not None
+    cached_path = manager.file_cache.get_path("unique_uploaded")
+    with open(cached_path, encoding='utf-8') as f:
+        assert f.read() == manager.client.sent[filename]
+    assert not os.path.exists(summary['output_path'])
+
+def test_merge_aborts_when_a_source_fails(tmp_path, monkeypatch):
+    for failed in (None, '{"messages_in_this_group": ['):
+        manager = make_manager(tmp_path, monkeypatch, {'a': scan([1]), 'b': failed})
+
+        result = asyncio.run(manager._merge_files(7, [file_info('a', 0), file_info('b', 1)]))
+
+        # فایل نهایی ناقص ساخته نمی‌شود
+        assert result == (False, None, None)
+        assert manager.file_cache.get_stats()['pinned'] == 0
+
+class FakeIndexStorage:
+    """ذخیره‌ساز آزمایشی ایندکس فایل‌ها؛ save_results تعداد ذخیره شده هر فراخوانی را تعیین می‌کند"""
+
+    def __init__(self, position=0, save_results=None):
+        self.position = position
+        self.save_results = list(save_results or [])
+        self.saved = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def get_index_position(self, name):
+        return self.position
+
+    async def set_index_position(self, name, message_id):
+        self.position = message_id
+
+    async def save_user_file_entries(self, entries):
+        self.saved.extend(entries)
+        return self.save_results.pop(0) if self.save_results else len(entries)
+
+class FakeHistoryClient:
+    """تاریخچه Saved Messages از جدید به قدیم؛ خطاهای flood_waits پیش از هر پیمایش بالا می‌روند"""
+
+    def __init__(self, message_ids, flood_waits=0):
+        self.message_ids = sorted(message_ids, reverse=True)
+        self.flood_waits = flood_waits
+        self.history_calls = 0
+
+    async def get_chat_history(self, chat_id):
+        self.history_calls += 1
+        if self.flood_waits:
+            self.flood_waits -= 1
+            error = user_json_manager.FloodWait.__new__(user_json_manager.FloodWait)
+            error.value = 0
+            raise error
+        for message_id in self.message_ids:
+            yield SimpleNamespace(id=message_id, date=None, document=SimpleNamespace(
+                file_name=f"temp_7_-100_20240101_00000{message_id % 10}_abcdef0{message_id % 10}.json",
+                file_id=f"file_{message_id}", file_unique_id=f"unique_{message_id}", file_size=10
+            ))
+
+def sync_manager(tmp_path, monkeypatch, storage, client) -> UserJSONManager:
+    manager = make_manager(tmp_path, monkeypatch, {})
+    monkeypatch.setattr(user_json_manager, 'StorageManager', lambda: storage)
+    manager.client = client
+    manager.target_chat_id = 'me'
+    return manager
+
+def test_index_position_advances_after_all_entries_are_saved(tmp_path, monkeypatch):
+    storage = FakeIndexStorage(position=10)
+    manager = sync_manager(tmp_path, monkeypatch, storage, FakeHistoryClient([11, 12, 10, 9]))
+
+    assert asyncio.run(manager.sync_file_index()) == 2
+    assert storage.position == 12
+
+def test_index_position_is_kept_when_a_save_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_json_manager, 'INDEX_BATCH_SIZE', 2)
+    storage = FakeIndexStorage(position=10, save_results=[2, 0])
+    manager = sync_manager(tmp_path, monkeypatch, storage, FakeHistoryClient([11, 12, 13, 14]))
+
+    assert asyncio.run(manager.sync_file_index()) == 2
+    assert storage.position == 10
+    assert len(storage.saved) == 4
+
+def test_flood_wait_retries_are_bounded(tmp_path, monkeypatch):
+    client = FakeHistoryClient([11], flood_waits=1)
+    storage = FakeIndexStorage()
+    manager = sync_manager(tmp_path, monkeypatch, storage, client)
+    assert asyncio.run(manager.sync_file_index()) == 1
+    assert storage.position == 11
+
+    client = FakeHistoryClient([12], flood_waits=user_json_manager.INDEX_SYNC_ATTEMPTS)
+    manager = sync_manager(tmp_path, monkeypatch, storage, client)
+    assert asyncio.run(manager.sync_file_index()) == 0
+    assert client.history_calls == user_json_manager.INDEX_SYNC_ATTEMPTS
+    assert storage.position == 11
@@ -0,0 +1,66 @@
+import json
+
+from services.user_json_merger import StreamingUserMerger, iter_streaming_messages, read_streaming_header
+
+def message(group_id, message_id, timestamp, text=''):
+    return {'group_id': group_id, 'message_id': message_id, 'timestamp': timestamp, 'text': text}
+
+def write_json(path, data) -> str:
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return str(path)
+
+def test_merge_orders_and_dedupes_messages(tmp_path):
+    older = {'group_info': {'group_id': -200}, 'messages_in_this_group': [
+        message(-200, 5, '2024-01-02T00:00:00', 'old'),
+        message(-200, 3, '2024-01-01T00:00:00'),
+    ]}
+    newer = {'group_info': {'group_id': -100}, 'messages_in_this_group': [
+        message(-200, 5, '2024-01-02T00:00:00', 'edited'),
+        message(-100, 9, '2024-01-03T00:00:00'),
+        message(-100, 1, '2024-01-03T00:00:00'),
+    ]}
+
+    with StreamingUserMerger(42, work_dir=str(tmp_path)) as merger:
+        assert merger.add_source_file(write_json(tmp_path / 'a.json', older))
+        assert merger.add_source_file(write_json(tmp_path / 'b.json', newer))
+        summary = merger.write(str(tmp_path / 'final.json'))
+
+    messages = list(iter_streaming_messages(summary['output_path']))
+    assert [(m['group_id'], m['message_id']) for m in messages] == [(-100, 1), (-100, 9), (-200, 3), (-200, 5)]
+    # در تکرارها نسخه منبع جدیدتر حفظ می‌شود
+    assert messages[-1]['text'] == 'edited'
+    assert summary['total_messages'] == 4
+    assert summary['total_groups'] == 2
+
+def test_final_file_is_merged_with_new_sources(tmp_path):
+    first = {
+        'user_info': {'current_username': 'old', 'username_history': [{'username': 'old', 'changed_at': '2024-01-01'}]},
+        'messages_in_this_group': [message(-100, 1, '2024-01-01T00:00:00')]
+    }
+    with StreamingUserMerger(42, work_dir=str(tmp_path)) as merger:
+        merger.add_source_file(write_json(tmp_path / 'first.json', first))
+        final_path = merger.write(str(tmp_path / 'final_1.json'))['output_path']
+
+    assert read_streaming_header(final_path)['user_id'] == 42
+
+    second = {
+        'user_info': {'current_username': 'new', 'username_history': [{'username': 'new', 'changed_at': '2024-02-01'}]},
+        'messages_in_this_group': [message(-100, 1, '2024-01-01T00:00:00'), message(-100, 2, '2024-02-01T00:00:00')]
+    }
+    with StreamingUserMerger(42, work_dir=str(tmp_path)) as merger:
+        assert merger.add_source_file(final_path)
+        merger.add_source_file(write_json(tmp_path / 'second.json', second))
+        summary = merger.write(str(tmp_path / 'final_2.json'))
+
+    header = read_streaming_header(summary['output_path'])
+    assert [entry['username'] for entry in header['user_info']['username_history']] == ['old', 'new']
+    assert [m['message_id'] for m in iter_streaming_messages(summary['output_path'])] == [1, 2]
+    assert summary['total_files_merged'] == 2
+
+def test_unreadable_source_is_rejected(tmp_path):
+    broken = tmp_path / 'broken.json'
+    broken.write_text('{"messages_in_this_group": [', encoding='utf-8')
+
+    with StreamingUserMerger(42, work_dir=str(tmp_path)) as merger:
+        assert not merger.add_source_file(str(broken))
+        assert merger.sources == 0
@@ -0,0 +1,77 @@
+import asyncio
+
+from services import storage as storage_module
+from services.user_tracker import UserTracker
+
+class FakeProfileStorage:
+    """ذخیره‌ساز آزمایشی؛ fail_users/fail_messages مانند backendها تعداد ناقص برمی‌گردانند"""
+
+    def __init__(self, fail_users=False, fail_messages=False):
+        self.fail_users = fail_users
+        self.fail_messages = fail_messages
+        self.profiles = []
+        self.messages = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def bulk_upsert_user_profiles(self, profiles):
+        if self.fail_users:
+            return {'inserted': 0, 'updated': 0}
+        self.profiles.extend(profiles)
+        return {'inserted': len(profiles), 'updated': 0}
+
+    async def save_messages(self, messages):
+        if self.fail_messages:
+            return {'inserted': 0, 'updated': 0}
+        self.messages.extend(messages)
+        return {'inserted': len(messages), 'updated': 0}
+
+def tracker_with_changes(tmp_path, monkeypatch) -> UserTracker:
+    monkeypatch.chdir(tmp_path)
+    tracker = UserTracker()
+    for user_id in (1, 2):
+        tracker.users[user_id] = {'user_id': user_id}
+        tracker._mark_user_dirty(user_id)
+    tracker._pending_messages = [{'group_id': -100, 'message_id': 1, 'user_id': 1}]
+    return tracker
+
+def test_flush_clears_buffers_after_success(tmp_path, monkeypatch):
+    tracker = tracker_with_changes(tmp_path, monkeypatch)
+    storage = FakeProfileStorage()
+    monkeypatch.setattr(storage_module, 'StorageManager', lambda: storage)
+
+    assert asyncio.run(tracker.flush_to_database()) == {'users': 2, 'messages': 1}
+    assert not tracker._dirty_users and not tracker._pending_messages
+
+def test_flush_keeps_buffers_that_were_not_saved(tmp_path, monkeypatch):
+    tracker = tracker_with_changes(tmp_path, monkeypatch)
+    monkeypatch.setattr(storage_module, 'StorageManager', lambda: FakeProfileStorage(fail_messages=True))
+
+    asyncio.run(tracker.flush_to_database())
+    assert not tracker._dirty_users
+    assert len(tracker._pending_messages) == 1
+
+    storage = FakeProfileStorage()
+    monkeypatch.setattr(storage_module, 'StorageManager', lambda: storage)
+    assert asyncio.run(tracker.flush_to_database()) == {'users': 0, 'messages': 1}
+    assert storage.messages[0]['message_id'] == 1
+
+def test_flush_keeps_buffers_when_storage_is_unavailable(tmp_path, monkeypatch):
+    tracker = tracker_with_changes(tmp_path, monkeypatch)
+
+    def unavailable():
+        raise ConnectionError("storage down")
+    monkeypatch.setattr(storage_module, 'StorageManager', unavailable)
+
+    asyncio.run(tracker.flush_to_database())
+    assert tracker._dirty_users == {1, 2}
+    assert len(tracker._pending_messages) == 1
+
+    monkeypatch.setattr(storage_module, 'StorageManager', lambda: FakeProfileStorage(fail_users=True))
+    asyncio.run(tracker.flush_to_database())
+    assert tracker._dirty_users == {1, 2}
+    assert not tracker._pending_messages
@@ -8,7 +8,7 @@ from typing import Optional
 sys.path.append(str(Path(__file__).parent.parent))
 
 from services.user_json_manager import UserJSONManager
-from services.mongo_service import MongoServiceManager
+from services.storage import StorageManager, close_storage_service
 from utils.logger import logger
 
 class UserJSONProcessor:
@@ -16,7 +16,7 @@ class UserJSONProcessor:
     
     def __init__(self):
         self.user_json_manager = None
-        self.mongo_service = None
+        self.storage = None
     
     async def process_user_json(self, user_id: int) -> bool:
         """پردازش فایل‌های JSON یک کاربر"""
@@ -24,8 +24,8 @@ class UserJSONProcessor:
             logger.info(f"🔍 Starting JSON processing for user {user_id}")
             
             # بررسی اینکه آیا فایل نهایی قبلاً در دیتابیس ثبت شده
-            async with MongoServiceManager() as mongo_service:
-                existing_filename = await mongo_service.get_user_final_json_filename(user_id)
+            async with StorageManager() as storage:
+                existing_filename = await storage.get_user_final_json_filename(user_id)
                 
                 if existing_filename:
                     logger.info(f"📋 Found existing final JSON filename for user {user_id}: {existing_filename}")
@@ -42,6 +42,11 @@ class UserJSONProcessor:
                         logger.warning(f"⚠️ No data to merge for user {user_id}")
                         return False
                     
+                    # فایل نهایی بدون تغییر دوباره ارسال نمی‌شود
+                    if not merged_data.get('output_path'):
+                        logger.info(f"✅ Final JSON for user {user_id} is up to date: {final_filename}")
+                        return True
+                    
                     # ارسال فایل نهایی به Saved Messages
                     sent = await json_manager.send_final_json(merged_data, final_filename)
                     
@@ -50,8 +55,8 @@ class UserJSONProcessor:
                         return False
                     
                     # ذخیره نام فایل نهایی در دیتابیس
-                    message_count = len(merged_data.get('messages', []))
-                    saved = await mongo_service.update_user_final_json_info(
+                    message_count = merged_data.get('total_messages', 0)
+                    saved = await storage.update_user_final_json_info(
                         user_id, final_filename, message_count
                     )
                     
@@ -68,12 +73,59 @@ class UserJSONProcessor:
             logger.error(f"❌ Error processing user {user_id}: {e}")
             return False
     
+    async def process_all_users(self, user_concurrency: int = 4, download_concurrency: int = 8,
+                                upload_batch_size: int = 20) -> dict:
+        """ترکیب همه کاربران با یک پیمایش روی چت ذخیره‌سازی"""
+        stats = {'users': 0, 'merged': 0, 'uploaded': 0, 'unchanged': 0, 'failed': 0}
+        
+        try:
+            logger.info("🔍 Starting bulk JSON processing for all users")
+            
+            async with UserJSONManager(download_concurrency=download_concurrency) as json_manager:
+                files_by_user = await json_manager.get_all_user_json_files()
+                user_ids = sorted(files_by_user)
+                stats['users'] = len(user_ids)
+                
+                async with StorageManager() as storage:
+                    for batch_start in range(0, len(user_ids), upload_batch_size):
+                        batch_user_ids = user_ids[batch_start:batch_start + upload_batch_size]
+                        merged = await json_manager.merge_users(batch_user_ids, files_by_user, user_concurrency)
+                        stats['merged'] += len(merged)
+                        stats['failed'] += len(batch_user_ids) - len(merged)
+                        
+                        uploads = [(data, filename) for _, data, filename, needs_upload in merged if needs_upload]
+                        stats['unchanged'] += len(merged) - len(uploads)
+                        
+                        sent_filenames = set(await json_manager.send_final_jsons(uploads))
+                        stats['uploaded'] += len(sent_filenames)
+                        stats['failed'] += len(uploads) - len(sent_filenames)
+                        
+                        # ثبت دسته‌ای نام فایل‌های نهایی در دیتابیس
+                        records = [
+                            {
+                                'user_id': user_id,
+                                'filename': filename,
+                                'message_count': data.get('total_messages', 0)
+                            }
+                            for user_id, data, filename, _ in merged
+                            if filename in sent_filenames
+                        ]
+                        await storage.update_multiple_user_final_json_info(records)
+                        
+                        logger.info(f"📊 Bulk progress: {min(batch_start + upload_batch_size, len(user_ids))}/{len(user_ids)} users")
+            
+            logger.info(f"✅ Bulk processing finished: {stats}")
+            return stats
+            
+        except Exception as e:
+            logger.error(f"❌ Error in bulk processing: {e}")
+            return stats
+    
     async def get_user_info(self, user_id: int) -> Optional[dict]:
         """دریافت اطلاعات کاربر از دیتابیس"""
         try:
-            async with MongoServiceManager() as mongo_service:
-                user_data = mongo_service.users_collection.find_one({"user_id": user_id})
-                return user_data
+            async with StorageManager() as storage:
+                return await storage.get_user_document(user_id)
         except Exception as e:
             logger.error(f"❌ Error getting user info for {user_id}: {e}")
             return None
@@ -81,13 +133,9 @@ class UserJSONProcessor:
     async def list_processed_users(self) -> list:
         """لیست کاربرانی که فایل نهایی دارند"""
         try:
-            async with MongoServiceManager() as mongo_service:
-                cursor = mongo_service.users_collection.find({
-                    "final_json_filename": {"$exists": True}
-                }).sort("final_json_updated", -1)
-                
+            async with StorageManager() as storage:
                 users = []
-                for user in cursor:
+                for user in await storage.get_users_with_final_json():
                     users.append({
                         "user_id": user["user_id"],
                         "final_json_filename": user.get("final_json_filename"),
@@ -111,11 +159,22 @@ async def main():
     parser.add_argument("--user-id", type=int, help="User ID to process")
     parser.add_argument("--list", action="store_true", help="List all processed users")
     parser.add_argument("--info", type=int, help="Get info for specific user")
+    parser.add_argument("--all", action="store_true", help="Merge all users in one pass over the storage chat")
+    parser.add_argument("--concurrency", type=int, default=4, help="Users merged concurrently in --all mode")
+    parser.add_argument("--download-concurrency", type=int, default=8, help="Concurrent file downloads in --all mode")
+    parser.add_argument("--batch-size", type=int, default=20, help="Final files uploaded per batch in --all mode")
     
     args = parser.parse_args()
     
     processor = UserJSONProcessor()
     
+    try:
+        await run_command(processor, parser, args)
+    finally:
+        await close_storage_service()
+
+async def run_command(processor: UserJSONProcessor, parser, args):
+    """اجرای دستور انتخاب شده"""
     if args.list:
         logger.info("📋 Listing all processed users...")
         users = await processor.list_processed_users()
@@ -140,6 +199,18 @@ async def main():
         else:
             logger.warning(f"⚠️ User {args.info} not found in database")
     
+    elif args.all:
+        logger.info("🔄 Processing all users...")
+        stats = await processor.process_all_users(
+            user_concurrency=args.concurrency,
+            download_concurrency=args.download_concurrency,
+            upload_batch_size=args.batch_size
+        )
+        
+        logger.info(f"📊 Users: {stats['users']} | Uploaded: {stats['uploaded']} | Unchanged: {stats['unchanged']} | Failed: {stats['failed']}")
+        if stats['failed']:
+            sys.exit(1)
+    
     elif args.user_id:
         logger.info(f"🔄 Processing user {args.user_id}...")
         success = await processor.process_user_json(args.user_id)
@@ -1,3 +1,4 @@
 from .logger import logger, Logger
+from .bloom_filter import BloomFilter
 
-__all__ = ['logger', 'Logger']
+__all__ = ['logger', 'Logger', 'BloomFilter']
@@ -0,0 +1,181 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Iterable, Union
+
+# سربرگ فایل: magic، نسخه، تعداد hash، تعداد بیت، تعداد اعضا، ظرفیت، نرخ خطا
+HEADER_FORMAT = '<4sBIQQQd'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'BLMF'
+VERSION = 1
+
+class BloomFilter:
+    """مجموعه احتمالاتی فشرده برای «قبلاً دیده شده»؛ منفی کاذب ندارد و مثبت کاذب با نرخ error_rate"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits, self.num_hashes = self._optimal_size(capacity, error_rate)
+        self.bits: Union[bytearray, memoryview] = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self.path = None
+        self._mmap = None
+        self._file = None
+
+    @staticmethod
+    def _optimal_size(capacity: int, error_rate: float):
+        """اندازه بهینه آرایه بیت و تعداد hashها برای ظرفیت و نرخ خطای داده شده"""
+        num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return num_bits, num_hashes
+
+    def _positions(self, item: Union[str, int]):
+        """موقعیت بیت‌ها با double hashing روی یک digest از blake2b"""
+        data = item.encode('utf-8') if isinstance(item, str) else str(item).encode('utf-8')
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: Union[str, int]) -> bool:
+        """افزودن عضو؛ True اگر قبلاً (احتمالاً) وجود نداشت"""
+        added = False
+        bits = self.bits
+        for position in self._positions(item):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def update(self, items: Iterable[Union[str, int]]) -> int:
+        """افزودن چند عضو؛ خروجی تعداد اعضای جدید"""
+        return sum(1 for item in items if self.add(item))
+
+    def __contains__(self, item: Union[str, int]) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def size_bytes(self) -> int:
+        """حجم آرایه بیت"""
+        return len(self.bits)
+
+    @property
+    def false_positive_rate(self) -> float:
+        """نرخ تخمینی مثبت کاذب با تعداد فعلی اعضا"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    # ---------- ذخیره و بارگذاری ----------
+
+    def _header(self) -> bytes:
+        return struct.pack(HEADER_FORMAT, MAGIC, VERSION, self.num_hashes, self.num_bits,
+                           self.count, self.capacity, self.error_rate)
+
+    @classmethod
+    def _from_header(cls, header: bytes) -> 'BloomFilter':
+        """ساخت فیلتر خالی با پارامترهای سربرگ فایل"""
+        magic, version, num_hashes, num_bits, count, capacity, error_rate = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a bloom filter file")
+
+        bloom = cls.__new__(cls)
+        bloom.capacity, bloom.error_rate = capacity, error_rate
+        bloom.num_bits, bloom.num_hashes, bloom.count = num_bits, num_hashes, count
+        bloom.bits = bytearray()
+        bloom.path, bloom._mmap, bloom._file = None, None, None
+        return bloom
+
+    def save(self, path: Union[str, Path]):
+        """ذخیره کامل در فایل (نوشتن در فایل موقت و جایگزینی اتمی)"""
+        if self._mmap is not None and Path(path) == self.path:
+            self.flush()
+            return
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(self._header())
+            f.write(self.bits)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'BloomFilter':
+        """بارگذاری کامل فایل در حافظه"""
+        with open(path, 'rb') as f:
+            bloom = cls._from_header(f.read(HEADER_SIZE))
+            bloom.bits = bytearray(f.read())
+        if len(bloom.bits) != (bloom.num_bits + 7) // 8:
+            raise ValueError(f"truncated bloom filter file: {path}")
+        return bloom
+
+    @classmethod
+    def open(cls, path: Union[str, Path], capacity: int, error_rate: float = 0.001) -> 'BloomFilter':
+        """فیلتر ماندگار روی mmap؛ فایل موجود با پارامترهای خودش باز می‌شود و بیت‌ها در حافظه پروسه کپی نمی‌شوند"""
+        path = Path(path)
+        if not path.exists() or path.stat().st_size < HEADER_SIZE:
+            # فایل خالی بدون ساخت آرایه بیت در حافظه (sparse روی اکثر فایل‌سیستم‌ها)
+            if capacity <= 0 or not 0 < error_rate < 1:
+                raise ValueError("invalid capacity or error_rate")
+            num_bits, num_hashes = cls._optimal_size(capacity, error_rate)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, num_hashes, num_bits, 0, capacity, error_rate))
+                f.truncate(HEADER_SIZE + (num_bits + 7) // 8)
+
+        file = open(path, 'r+b')
+        try:
+            bloom = cls._from_header(file.read(HEADER_SIZE))
+            mapped = mmap.mmap(file.fileno(), 0)
+        except Exception:
+            file.close()
+            raise
+
+        if len(mapped) != HEADER_SIZE + (bloom.num_bits + 7) // 8:
+            mapped.close()
+            file.close()
+            raise ValueError(f"truncated bloom filter file: {path}")
+
+        bloom.bits = memoryview(mapped)[HEADER_SIZE:]
+        bloom.path, bloom._mmap, bloom._file = path, mapped, file
+        return bloom
+
+    def flush(self):
+        """نوشتن تعداد اعضا در سربرگ و همگام‌سازی mmap با دیسک"""
+        if self._mmap is None:
+            return
+        self._mmap[:HEADER_SIZE] = self._header()
+        self._mmap.flush()
+
+    def close(self):
+        """flush و بستن فایل mmap (فیلترهای درون حافظه‌ای تغییری نمی‌کنند)"""
+        if self._mmap is None:
+            return
+        self.flush()
+        self.bits.release()
+        self.bits = bytearray()
+        self._mmap.close()
+        self._file.close()
+        self._mmap, self._file = None, None
+
+    def __enter__(self) -> 'BloomFilter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
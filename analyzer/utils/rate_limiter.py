@@ -0,0 +1,56 @@
+import asyncio
+import time
+from typing import Dict
+
+class RateLimiter:
+    """محدودکننده token bucket برای درخواست‌های async؛ rate درخواست در ثانیه و burst حداکثر درخواست پشت سر هم"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # درخواست‌ها به ترتیب ورود نوبت می‌گیرند
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """صبر تا نوبت درخواست بعدی (rate صفر یعنی بدون محدودیت، به جز توقف FloodWait)"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """توقف همه درخواست‌ها برای مدت مشخص (مثلاً پس از FloodWait)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+
+    async def __aenter__(self) -> 'RateLimiter':
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+# limiterهای مشترک پروسه بر اساس نام
+_limiters: Dict[str, RateLimiter] = {}
+
+def get_rate_limiter(name: str, rate: float, burst: int = 1) -> RateLimiter:
+    """limiter مشترک با نام مشخص؛ بار اول با rate و burst داده شده ساخته می‌شود"""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = _limiters[name] = RateLimiter(rate, burst)
+    return limiter
@@ -0,0 +1,12 @@
+from typing import Union
+
+from config.settings import SEEN_SET_SETTINGS
+from .bloom_filter import BloomFilter
+
+SeenSet = Union[set, BloomFilter]
+
+def create_seen_set(capacity: int = None, error_rate: float = None) -> SeenSet:
+    """set دقیق یا Bloom filter با حافظه ثابت بر اساس SEEN_SET_BACKEND (هر دو in، add و len دارند)"""
+    if SEEN_SET_SETTINGS.backend == 'bloom':
+        return BloomFilter(capacity or SEEN_SET_SETTINGS.capacity, error_rate or SEEN_SET_SETTINGS.error_rate)
+    return set()